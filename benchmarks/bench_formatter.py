@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+""" Benchmark ZoneFileFormatter.format and save on synthetic zones """
+
+import argparse
+import os
+import tempfile
+import time
+import synthetic
+from zoneutils import zonefile, zonefileformatter
+
+
+def bench_format(count: int) -> tuple:
+    """ Time formatting a zone with the given number of records, and saving it as org and new file """
+
+    zone = zonefile.ZoneFile('\n'.join(synthetic.generate_dig_axfr(count=count)))
+
+    start = time.perf_counter()
+    for _ in zonefileformatter.ZoneFileFormatter([]).format(zone):
+        pass
+
+    formatseconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        zonefileformatter.ZoneFileFormatter([]).save(os.path.join(tmp, 'org'), zone, [ os.path.join(tmp, 'new') ])
+        saveseconds = time.perf_counter() - start
+
+    return (formatseconds, saveseconds)
+
+
+def main():
+    """ Main function of the benchmark """
+
+    parser = argparse.ArgumentParser(description='Benchmark ZoneFileFormatter.format')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[ 1000, 10000, 100000, 500000 ], help='Zone sizes in records')
+    args = parser.parse_args()
+
+    print(f'{"records":>10}  {"seconds":>10}  {"records/s":>12}  {"save s":>10}')
+    for count in args.sizes:
+        seconds, saveseconds = bench_format(count)
+        print(f'{count:>10}  {seconds:>10.3f}  {count / seconds:>12.0f}  {saveseconds:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+""" Benchmark parsing dig AXFR output in one and in several processes """
+
+import argparse
+import os
+import time
+import synthetic
+from zoneutils import zonefile
+
+
+def bench(parse, text: str) -> tuple:
+    """ Time one parse of the text, returns the seconds and the zone """
+
+    start = time.perf_counter()
+    zone = parse(text)
+    return (time.perf_counter() - start, zone)
+
+
+def main():
+    """ Main function of the benchmark """
+
+    cores = os.cpu_count() or 1
+
+    parser = argparse.ArgumentParser(description='Benchmark parallel zone parsing')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[ 100000, 1000000 ], help='Zone sizes in records')
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({ 2, 4, 8, cores } - { 1 }), help='Numbers of worker processes')
+    args = parser.parse_args()
+
+    # measure the workers also for zones below the size where they are used by default
+    zonefile.PARALLEL_MIN_SIZE = 0
+
+    print(f'{cores} cores')
+    print(f'{"records":>10}  {"workers":>8}  {"seconds":>8}  {"speedup":>8}')
+    for count in args.sizes:
+        text = '\n'.join(synthetic.generate_mixed_axfr(count=count))
+
+        single, expected = bench(zonefile.ZoneFile, text)
+        expected = [ x.as_tuple() for x in expected.records ]
+        print(f'{count:>10}  {1:>8}  {single:>8.3f}  {1:>8.2f}')
+
+        for workers in args.workers:
+            seconds, zone = bench(lambda x: zonefile.parse_parallel(x, workers), text)
+
+            if [ x.as_tuple() for x in zone.records ] != expected:
+                raise RuntimeError(f'Parallel parse with {workers} workers differs from the sequential parse')
+
+            print(f'{count:>10}  {workers:>8}  {seconds:>8.3f}  {single / seconds:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+""" Benchmark memory and field access of zonefile.Record """
+
+import argparse
+import time
+import tracemalloc
+import synthetic
+from zoneutils import zonefile
+
+
+class LegacyRecord(object):
+    """ The previous Record layout with a per-instance __dict__, as reference """
+
+    def __init__(self, dnsName=None, dnsTtl=3600, dnsClass='IN', dnsType=None, dnsPrio=None, dnsContent=None):
+        self.dnsName = dnsName
+        self.dnsTtl = dnsTtl
+        self.dnsClass = dnsClass
+        self.dnsType = dnsType
+        self.dnsPrio = dnsPrio
+        self.dnsContent = dnsContent
+
+    def as_array(self) -> list:
+        return [ self.dnsName, self.dnsTtl, self.dnsClass, self.dnsType, self.dnsPrio, self.dnsContent ]
+
+    def get_by_index(self, index: int):
+        if index >= 0 and index < len(self.as_array()):
+            return self.as_array()[index]
+
+        return None
+
+
+def bench(cls, fields: list) -> tuple:
+    """ Measure memory of all instances and time of a column scan """
+
+    tracemalloc.start()
+    records = [ cls(*x) for x in fields ]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i in range(0, 6):
+        max(map(lambda x: len(str(x.get_by_index(i))), records))
+
+    return (memory, time.perf_counter() - start)
+
+
+def main():
+    """ Main function of the benchmark """
+
+    parser = argparse.ArgumentParser(description='Benchmark zonefile.Record')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[ 10000, 100000, 500000 ], help='Zone sizes in records')
+    args = parser.parse_args()
+
+    print(f'{"records":>10}  {"class":<12}  {"MiB":>8}  {"scan s":>8}')
+    for count in args.sizes:
+        zone = zonefile.ZoneFile('\n'.join(synthetic.generate_dig_axfr(count=count)))
+        fields = [ x.as_tuple() for x in zone.records ]
+        del zone
+
+        for cls in [ LegacyRecord, zonefile.Record ]:
+            memory, seconds = bench(cls, fields)
+            print(f'{count:>10}  {cls.__name__:<12}  {memory / 1048576:>8.1f}  {seconds:>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
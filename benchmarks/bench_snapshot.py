@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+""" Benchmark loading a cached zone as text file and as binary snapshot """
+
+import argparse
+import os
+import tempfile
+import time
+import synthetic
+from zoneutils import zonefile, zonesnapshot
+
+
+def bench(load, file: str) -> tuple:
+    """ Time opening a zone, reading its SOA record and touching all records """
+
+    start = time.perf_counter()
+    zone = load(file)
+    zone.records[0]
+    opened = time.perf_counter() - start
+
+    for _ in zone.records:
+        pass
+
+    return (opened, time.perf_counter() - start)
+
+
+def main():
+    """ Main function of the benchmark """
+
+    parser = argparse.ArgumentParser(description='Benchmark zone snapshots')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[ 10000, 100000, 1000000 ], help='Zone sizes in records')
+    args = parser.parse_args()
+
+    print(f'{"records":>10}  {"format":<10}  {"MiB":>8}  {"open s":>8}  {"all s":>8}')
+    for count in args.sizes:
+        zone = zonefile.ZoneFile(synthetic.generate_dig_axfr(count=count))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            textfile = os.path.join(tmp, 'zone.db')
+            with open(textfile, 'w') as f:
+                for record in zone.records:
+                    f.write(f'{str(record)}\n')
+
+            snapfile = os.path.join(tmp, 'zone.snap')
+            zonesnapshot.save(snapfile, zone)
+
+            for name, load, file in [ ('text', zonefile.load, textfile), ('snapshot', zonesnapshot.load, snapfile) ]:
+                opened, total = bench(load, file)
+                size = os.path.getsize(file) / 1048576
+                print(f'{count:>10}  {name:<10}  {size:>8.1f}  {opened:>8.3f}  {total:>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
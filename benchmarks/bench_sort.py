@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+""" Benchmark the record ordering of ZoneFileFormatter without formatting """
+
+import argparse
+import random
+import time
+import synthetic
+from zoneutils import zonefile, zonefileformatter
+
+
+def legacy_sort(records: list) -> list:
+    """ The previous ordering with a reversed name string and a type priority list, as reference """
+
+    record_prio = [ 'SOA', 'NS', 'CAA', 'A', 'AAAA', 'MX', 'SRV' ]
+    for record in records:
+        if record.dnsType not in record_prio:
+            record_prio.append(record.dnsType)
+
+    def sorter(x):
+        reversename = '.'.join(x.dnsName.split('.')[::-1])
+        return (reversename, record_prio.index(x.dnsType), x.dnsPrio if x.dnsPrio else 0)
+
+    return sorted(records, key=sorter)
+
+
+def bench(sort, records: list) -> float:
+    """ Time one sort of the records """
+
+    start = time.perf_counter()
+    sort(records)
+    return time.perf_counter() - start
+
+
+def main():
+    """ Main function of the benchmark """
+
+    parser = argparse.ArgumentParser(description='Benchmark the record ordering of ZoneFileFormatter')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[ 10000, 100000, 500000 ], help='Zone sizes in records')
+    args = parser.parse_args()
+
+    print(f'{"records":>10}  {"sorter":<10}  {"seconds":>8}')
+    for count in args.sizes:
+        zone = zonefile.ZoneFile(synthetic.generate_dig_axfr(count=count))
+
+        # the transfer order is already close to sorted, shuffle to get the worst case
+        records = list(zone.records)
+        random.Random(1).shuffle(records)
+
+        # a new formatter for the cold run, so building the name keys is part of the measurement
+        formatter = zonefileformatter.ZoneFileFormatter([])
+        sorters = [
+            ('legacy', legacy_sort),
+            ('cold', formatter.sort_records),
+            ('warm', formatter.sort_records),
+        ]
+
+        for name, sort in sorters:
+            print(f'{count:>10}  {name:<10}  {bench(sort, records):>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+""" Benchmark suite for the zone pipeline with JSON results and comparison against a baseline """
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import synthetic
+from typing import Callable, Dict, Iterator, List
+from zoneutils import zonefile, zonefileformatter, zonediff, zonehash, nsupdate
+
+CASES = [ 'parse', 'parse_ignore', 'format', 'save', 'from_diff', 'diff', 'hash', 'drift', 'soa' ]
+IGNORE_RRTYPES = [ 'DNSKEY', 'RRSIG', 'NSEC', 'TYPE65534', 'CDS', 'CDNSKEY' ]
+CHANGE_RATE = 100
+
+
+def change_records(zone: zonefile.ZoneFile) -> zonefile.ZoneFile:
+    """ Copy of a zone with the TTL of every CHANGE_RATE-th record changed, and a new serial """
+
+    records = []
+    for i, record in enumerate(zone.records):
+        if i > 0 and i % CHANGE_RATE == 0:
+            record = zonefile.Record(record.dnsName, record.dnsTtl + 1, record.dnsClass, record.dnsType, record.dnsPrio, record.dnsContent)
+
+        records.append(record)
+
+    soa = zonefile.from_string(str(records[0]))
+    zonefile.SoaRecord(soa).apply_default_serialincrease()
+
+    changed = zonefile.ZoneFile()
+    changed.records = [ soa ] + records[1:]
+    return changed
+
+
+def classic_diff(org: zonefile.ZoneFile, new: zonefile.ZoneFile) -> str:
+    """ Changed records in the format of diff(1) without context, the input of nsupdate.from_diff """
+
+    lines = []
+    for old, changed in zip(org.records, new.records):
+        if old is not changed:
+            lines.append(f'< {str(old)}')
+            lines.append(f'> {str(changed)}')
+
+    return '\n'.join(lines)
+
+
+def prepare(case: str, lines: List[str], tmp: str) -> Callable[[], None]:
+    """ Create the function to measure for a case, preparation is not part of the measurement """
+
+    if case == 'parse':
+        text = '\n'.join(lines)
+        return lambda: zonefile.ZoneFile(text)
+
+    if case == 'parse_ignore':
+        text = '\n'.join(lines)
+        return lambda: zonefile.ZoneFile(text, IGNORE_RRTYPES)
+
+    zone = zonefile.ZoneFile('\n'.join(lines))
+
+    if case == 'format':
+        def run():
+            for _ in zonefileformatter.ZoneFileFormatter([]).format(zone):
+                pass
+
+        return run
+
+    if case == 'save':
+        file = os.path.join(tmp, 'zone.db')
+        return lambda: zonefileformatter.ZoneFileFormatter([]).save(file, zone, [ file + '.new' ])
+
+    changed = change_records(zone)
+
+    if case == 'from_diff':
+        diff = classic_diff(zone, changed)
+        return lambda: nsupdate.from_diff(diff).get_transactions(zone.zone)
+
+    if case == 'diff':
+        return lambda: zonediff.diff(zone, changed).get_transactions(zone.zone)
+
+    if case == 'hash':
+        def run():
+            # a new record list drops the index and the hash tree
+            zone.records = zone.records
+            zone.get_hash_tree()
+
+        return run
+
+    if case == 'drift':
+        org = zone.get_hash_tree()
+        new = changed.get_hash_tree()
+        return lambda: zonehash.compare(org, new)
+
+    if case == 'soa':
+        def run():
+            # a new record list drops the lookup index, so the SOA is searched again
+            zone.records = zone.records
+            zonefile.SoaRecord(zone.get_soa()).apply_default_serialincrease()
+
+        return run
+
+    raise ValueError(f'Unknown case {case}')
+
+
+def measure(run: Callable[[], None], repeat: int) -> float:
+    """ Best wall time of several runs, the garbage collector runs before each one """
+
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    return best
+
+
+def run_suite(sizes: List[int], cases: List[str], repeat: int, seed: int, dnssec: bool) -> Iterator[dict]:
+    """ Run all cases on zones of all sizes, yields each result as soon as it is measured """
+
+    for count in sizes:
+        lines = list(synthetic.generate_mixed_axfr(count=count, seed=seed, dnssec=dnssec))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for case in cases:
+                seconds = measure(prepare(case, lines, tmp), repeat)
+                yield { 'case': case, 'records': count, 'seconds': seconds }
+
+
+def baseline_times(baseline: dict) -> Dict[tuple, float]:
+    """ Seconds of the baseline by case and zone size """
+
+    return { (x['case'], x['records']): x['seconds'] for x in baseline.get('results', []) }
+
+
+def compare(results: List[dict], baseline: dict, tolerance: float) -> List[dict]:
+    """ Results which are slower than the baseline by more than the tolerance """
+
+    known = baseline_times(baseline)
+
+    regressions = []
+    for result in results:
+        previous = known.get((result['case'], result['records']))
+        if previous is not None and result['seconds'] > previous * (1 + tolerance):
+            regressions.append(dict(result, baseline=previous))
+
+    return regressions
+
+
+def main():
+    """ Main function of the benchmark """
+
+    parser = argparse.ArgumentParser(description='Benchmark suite for zoneutils')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[ 1000, 10000, 100000 ], help='Zone sizes in records')
+    parser.add_argument('--cases', type=str, nargs='+', default=CASES, choices=CASES, help='Cases to run')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case, the best one counts')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the zone generator')
+    parser.add_argument('--no-dnssec', action='store_true', help='Generate zones without RRSIG and NSEC records')
+    parser.add_argument('--output', type=str, help='Write the results as JSON file', metavar='results.json')
+    parser.add_argument('--baseline', type=str, help='Compare with the JSON results of a previous run', metavar='baseline.json')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown against the baseline (default: 0.2)')
+    args = parser.parse_args()
+
+    baseline = None
+    known = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+        known = baseline_times(baseline)
+
+    print(f'{"case":<12}  {"records":>10}  {"seconds":>10}  {"records/s":>12}' + (f'  {"baseline":>10}  {"ratio":>6}' if baseline else ''))
+
+    results = []
+    for result in run_suite(args.sizes, args.cases, args.repeat, args.seed, not args.no_dnssec):
+        results.append(result)
+
+        line = f'{result["case"]:<12}  {result["records"]:>10}  {result["seconds"]:>10.4f}  {result["records"] / result["seconds"]:>12.0f}'
+        previous = known.get((result['case'], result['records']))
+        if previous:
+            line += f'  {previous:>10.4f}  {result["seconds"] / previous:>6.2f}'
+
+        print(line, flush=True)
+
+    if args.output:
+        document = {
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'dnssec': not args.no_dnssec,
+            'repeat': args.repeat,
+            'results': results,
+        }
+
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+            f.write('\n')
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+
+        for x in regressions:
+            print(f'Regression: {x["case"]} with {x["records"]} records took {x["seconds"]:.4f}s, baseline {x["baseline"]:.4f}s', file=sys.stderr)
+
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+""" Synthetic zone generators for the benchmarks """
+
+import base64
+import os
+import sys
+import random
+from typing import Iterator
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+
+def generate_dig_axfr(zone: str = 'example.com', count: int = 1000, seed: int = 1) -> Iterator[str]:
+    """ Generate dig AXFR output lines with roughly the given number of records """
+
+    rnd = random.Random(seed)
+    zone = zone.rstrip('.') + '.'
+    soa = f'{zone}\t\t3600\tIN\tSOA\tns1.{zone} hostmaster.{zone} 2020092601 3600 900 604800 300'
+
+    yield f'; <<>> DiG 9.16.1-Ubuntu <<>> @ns1.{zone} -y hmac-sha256:bench:c2VjcmV0 -t AXFR {zone.rstrip(".")}'
+    yield '; (1 server found)'
+    yield ';; global options: +cmd'
+    yield soa
+    yield f'{zone}\t\t3600\tIN\tNS\tns1.{zone}'
+    yield f'{zone}\t\t3600\tIN\tMX\t10 mail.{zone}'
+
+    for i in range(max(count - 4, 0)):
+        host = f'host{i}.sub{i % 97}.{zone}'
+        kind = i % 5
+
+        if kind == 0:
+            yield f'{host}\t300\tIN\tA\t10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}'
+        elif kind == 1:
+            yield f'{host}\t300\tIN\tAAAA\t2001:db8::{i:x}'
+        elif kind == 2:
+            yield f'{host}\t3600\tIN\tTXT\t"v=spf1 +mx -all {rnd.randrange(1 << 30)}"'
+        elif kind == 3:
+            yield f'{host}\t3600\tIN\tMX\t{rnd.randrange(100)} mail{i % 7}.{zone}'
+        else:
+            yield f'{host}\t3600\tIN\tCNAME\thost{i - 1}.sub{(i - 1) % 97}.{zone}'
+
+    yield soa
+    yield ''
+    yield ';; Query time: 1 msec'
+    yield f';; XFR size: {count + 1} records (messages 1, bytes 1)'
+
+
+IDN_LABELS = [ 'xn--mnchen-3ya', 'xn--bcher-kva', 'xn--caf-dma', 'xn--80ak6aa92e', 'xn--fiqs8s' ]
+
+
+def generate_mixed_axfr(zone: str = 'example.com', count: int = 1000, seed: int = 1, dnssec: bool = True) -> Iterator[str]:
+    """ Generate dig AXFR output lines closer to real zones: SRV records, long multi-string TXT records,
+        IDN names and, when enabled, RRSIG and NSEC records like in a signed zone """
+
+    rnd = random.Random(seed)
+    zone = zone.rstrip('.') + '.'
+    soa = f'{zone}\t\t3600\tIN\tSOA\tns1.{zone} hostmaster.{zone} 2020092601 3600 900 604800 300'
+
+    def rrsig(name: str, ttl: int, covered: str) -> str:
+        signature = base64.b64encode(rnd.randbytes(64)).decode('ascii')
+        return f'{name}\t{ttl}\tIN\tRRSIG\t{covered} 13 {name.count(".")} {ttl} 20201026000000 20200926000000 12345 {zone} {signature}'
+
+    yield f'; <<>> DiG 9.16.1-Ubuntu <<>> @ns1.{zone} -y hmac-sha256:bench:c2VjcmV0 -t AXFR {zone.rstrip(".")}'
+    yield '; (1 server found)'
+    yield ';; global options: +cmd'
+    yield soa
+    yield f'{zone}\t\t3600\tIN\tNS\tns1.{zone}'
+    yield f'{zone}\t\t3600\tIN\tNS\tns2.{zone}'
+    yield f'{zone}\t\t3600\tIN\tMX\t10 mail.{zone}'
+
+    if dnssec:
+        yield rrsig(zone, 3600, 'SOA')
+        yield rrsig(zone, 3600, 'NS')
+
+    written = 7
+    i = 0
+    while written < count:
+        label = IDN_LABELS[i % len(IDN_LABELS)] if i % 11 == 0 else f'host{i}'
+        host = f'{label}.sub{i % 97}.{zone}'
+        kind = i % 6
+
+        if kind == 0:
+            line, ttl, rrtype = (f'{host}\t300\tIN\tA\t10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}', 300, 'A')
+        elif kind == 1:
+            line, ttl, rrtype = (f'{host}\t300\tIN\tAAAA\t2001:db8::{i:x}', 300, 'AAAA')
+        elif kind == 2:
+            # DKIM like keys are longer than 255 characters and split into several strings
+            key = base64.b64encode(rnd.randbytes(300)).decode('ascii')
+            line, ttl, rrtype = (f'{host}\t3600\tIN\tTXT\t"v=DKIM1; k=rsa; p={key[:200]}" "{key[200:]}"', 3600, 'TXT')
+        elif kind == 3:
+            line, ttl, rrtype = (f'{host}\t3600\tIN\tMX\t{rnd.randrange(100)} mail{i % 7}.{zone}', 3600, 'MX')
+        elif kind == 4:
+            host = f'_sip._tcp.{host}'
+            line, ttl, rrtype = (f'{host}\t3600\tIN\tSRV\t{rnd.randrange(100)} {rnd.randrange(100)} 5060 sip{i % 7}.{zone}', 3600, 'SRV')
+        else:
+            line, ttl, rrtype = (f'{host}\t3600\tIN\tCNAME\thost{i - 1}.sub{(i - 1) % 97}.{zone}', 3600, 'CNAME')
+
+        yield line
+        written += 1
+
+        if dnssec:
+            yield rrsig(host, ttl, rrtype)
+            yield f'{host}\t300\tIN\tNSEC\thost{i + 1}.sub{(i + 1) % 97}.{zone} {rrtype} RRSIG NSEC'
+            yield rrsig(host, 300, 'NSEC')
+            written += 3
+
+        i += 1
+
+    yield soa
+    yield ''
+    yield ';; Query time: 1 msec'
+    yield f';; XFR size: {written + 1} records (messages 1, bytes 1)'
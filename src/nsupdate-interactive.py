@@ -9,7 +9,12 @@ import shlex
 import shutil
 import datetime
 import textwrap
-from zoneutils import zonefile, zonefileformatter, nsupdate, utils
+import atexit
+import itertools
+import asyncio
+import time
+from typing import Iterable
+from zoneutils import zonefile, zonefileformatter, utils, zonecache, zonediff, batch, zonecheck, zonescope, diffrender, profiling, daemon, changestream
 from pprint import pprint
 
 
@@ -35,17 +40,37 @@ def parse_args():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--zone', type=str, help='The zone name', metavar='example.com')
     group.add_argument('--get-zone-slug', type=str, help='Slugify a zone name for hmac key envs', metavar='example.com')
+    group.add_argument('--batch', type=str, nargs='+', help='Non-interactive, apply desired-state zone files or directories of them', metavar='PATH')
+    group.add_argument('--check-drift', type=str, nargs='+', help='Non-interactive, list the names where zones differ from desired-state zone files or directories of them', metavar='PATH')
+    group.add_argument('--changes', type=str, help='Non-interactive, apply add, delete and replace operations of a JSON or CSV file, - for stdin', metavar='FILE')
+    group.add_argument('--daemon', type=str, help='Keep zones loaded and serve a HTTP API on this unix socket', metavar='SOCKET')
     
     parser.add_argument('--dnsserver', type=str, required=False, help='DNS server to use', metavar='ns1.example.com')
     parser.add_argument('--ignore-rrtype', action='append', required=False, help='Ignore RR types, can be used multiple times', metavar='RRSIG')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the local caches, always look up the dns server and transfer the full zone')
+    parser.add_argument('--name', action='append', required=False, help='Only edit the records of this name, can be used multiple times', metavar='mail')
+    parser.add_argument('--subtree', action='append', required=False, help='Only edit the records at and below this name, can be used multiple times', metavar='customer1')
+    parser.add_argument('--type', action='append', required=False, help='Only edit records of this RR type, can be used multiple times', metavar='MX')
+    parser.add_argument('--strict-check', action='store_true', help='Check zone files with named-checkzone in addition to the built-in check')
+    parser.add_argument('--no-pager', action='store_true', help='Print the diff instead of showing it in $PAGER')
+    parser.add_argument('--collapse-lines', type=int, default=diffrender.DEFAULT_COLLAPSE_LINES, help=f'Shorten diff hunks with more lines, 0 to show all (default: {diffrender.DEFAULT_COLLAPSE_LINES})', metavar=str(diffrender.DEFAULT_COLLAPSE_LINES))
+    parser.add_argument('--parse-workers', type=int, default=1, help='Parse big zone files in several processes, 0 for one per core (default: 1)', metavar='1')
+    parser.add_argument('--workers', type=int, default=8, help='Batch, drift and changes mode: zones processed in parallel (default: 8)', metavar='8')
+    parser.add_argument('--per-server', type=int, default=2, help='Batch and drift mode: parallel operations per dns server (default: 2)', metavar='2')
+    parser.add_argument('--changes-format', type=str, default='auto', choices=changestream.FORMATS, help='Changes mode: format of the operations (default: auto)')
+    parser.add_argument('--window', type=float, default=changestream.DEFAULT_WINDOW, help=f'Changes mode: seconds to collect operations into one update (default: {changestream.DEFAULT_WINDOW})', metavar=str(changestream.DEFAULT_WINDOW))
+    parser.add_argument('--max-batch', type=int, default=changestream.DEFAULT_MAX_BATCH, help=f'Changes mode: operations per update at most (default: {changestream.DEFAULT_MAX_BATCH})', metavar=str(changestream.DEFAULT_MAX_BATCH))
+    parser.add_argument('--poll-interval', type=float, default=daemon.DEFAULT_POLL_INTERVAL, help=f'Daemon mode: seconds between SOA serial checks of loaded zones (default: {daemon.DEFAULT_POLL_INTERVAL})', metavar=str(daemon.DEFAULT_POLL_INTERVAL))
+    parser.add_argument('--dry-run', action='store_true', help='Batch and changes mode: only show which zones would change')
+    parser.add_argument('--profile', action='store_true', help='Print wall time per stage, record and byte counters on exit')
+    parser.add_argument('--profile-json', type=str, required=False, help='Write the profile as JSON file on exit', metavar='profile.json')
 
     return parser.parse_args()
 
 
-def check_dependencies(editor: str):
+def check_dependencies(binaries: list):
     """ Check for binaries which are required for this script """
 
-    binaries = [ editor, 'nsupdate', 'dig', 'diff', 'colordiff', 'named-checkzone' ]
     binarymissing = False
     for binary in binaries:
         if shutil.which(binary) is None:
@@ -61,6 +86,101 @@ def domain_slugify(domain: str) -> str:
     return SLUG_RGX.sub('_', idn).upper().strip()
 
 
+def get_hmac(zone: str) -> str:
+    """ Get the global hmac key or the one of the zone """
+
+    zone_varname = f"HMAC_{domain_slugify(zone)}"
+    return os.environ.get('HMAC', os.environ.get(zone_varname))
+
+
+def run_batch(args):
+    """ Apply desired-state zone files without interaction """
+
+    runner = batch.BatchRunner(get_hmac, args.dnsserver, args.ignore_rrtype, args.workers,
+        args.per_server, args.dry_run, not args.no_cache, args.strict_check, args.parse_workers or None)
+
+    files = list(batch.find_zonefiles(args.batch))
+    results = runner.run(files)
+
+    for line in batch.summary(results):
+        print(line)
+
+    if len(list(filter(lambda x: x.status in [ 'failed', 'invalid' ], results))) > 0:
+        sys.exit(1)
+
+
+def run_drift(args):
+    """ Compare desired-state zone files with the zones on the servers """
+
+    runner = batch.BatchRunner(get_hmac, args.dnsserver, args.ignore_rrtype, args.workers,
+        args.per_server, True, not args.no_cache, False, args.parse_workers or None)
+
+    files = list(batch.find_zonefiles(args.check_drift))
+    results = runner.check_drift(files)
+
+    for line in batch.drift_summary(results):
+        print(line)
+
+    if len(list(filter(lambda x: x.status != 'in sync', results))) > 0:
+        sys.exit(1)
+
+
+def run_changes(args):
+    """ Apply a stream of operations in batches and report the throughput """
+
+    runner = changestream.ChangeStreamRunner(get_hmac, args.dnsserver, args.ignore_rrtype, not args.no_cache,
+        args.window, args.max_batch, args.workers, args.dry_run)
+
+    async def run(lines: Iterable[str]) -> list:
+        reports = []
+        async for report in runner.run(lines, changestream.ChangeReader(args.changes_format)):
+            reports.append(report)
+            for line in changestream.batch_lines(report):
+                print(line, flush=True)
+
+        return reports
+
+    start = time.monotonic()
+    try:
+        with changestream.open_lines(args.changes) as lines:
+            reports = asyncio.run(run(lines))
+    except (OSError, UnicodeError) as e:
+        print(str(e))
+        sys.exit(1)
+
+    for line in changestream.summary(reports, time.monotonic() - start):
+        print(line)
+
+    if any(len(x.rejected) > 0 or any(y.status == 'failed' for y in x.results) for x in reports):
+        sys.exit(1)
+
+
+def run_daemon(args):
+    """ Serve the zone API until interrupted """
+
+    server = daemon.ZoneDaemon(get_hmac, args.dnsserver, args.ignore_rrtype, args.poll_interval, not args.no_cache)
+    print(f"Listening on {args.daemon}", file=sys.stderr)
+
+    try:
+        asyncio.run(server.serve(args.daemon))
+    except daemon.DaemonError as e:
+        print(str(e))
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+
+
+def print_profile(args):
+    """ Report the measurements of the run """
+
+    if args.profile:
+        for line in profiling.report():
+            print(line, file=sys.stderr)
+
+    if args.profile_json:
+        profiling.save_json(args.profile_json)
+
+
 def press(what: str):
     input(f"Press ENTER to {what}, CTRL+C to abort.")
 
@@ -71,12 +191,22 @@ def main():
     # get editor
     editor = os.environ.get('EDITOR', 'nano')
 
-    # check for dependend programs
-    check_dependencies(editor)
-
     # parse arguments
     args = parse_args()
 
+    # report measurements also when the script exits early
+    if args.profile or args.profile_json:
+        atexit.register(print_profile, args)
+
+    # check for dependend programs
+    binaries = [] if args.batch or args.check_drift or args.changes or args.daemon else [ editor ]
+
+    # dig is only used to discover the authoritative server
+    if not args.dnsserver:
+        binaries.append('dig')
+
+    check_dependencies(binaries + ([ 'named-checkzone' ] if args.strict_check else []))
+
     # ignore rrtypes default
     if (not args.ignore_rrtype) or len(args.ignore_rrtype) < 1:
         args.ignore_rrtype = DEFAULT_IGNORE_RRTYPES
@@ -88,17 +218,37 @@ def main():
         print(f"HMAC_{domain_slugify(args.get_zone_slug)}")
         sys.exit(0)
 
+    # apply many zones at once
+    if args.batch:
+        run_batch(args)
+        sys.exit(0)
+
+    # compare many zones with their desired state
+    if args.check_drift:
+        run_drift(args)
+        sys.exit(0)
+
+    # apply a stream of operations
+    if args.changes:
+        run_changes(args)
+        sys.exit(0)
+
+    # serve zones over a unix socket
+    if args.daemon:
+        run_daemon(args)
+        sys.exit(0)
+
     # get hmac key
-    zone_varname = f"HMAC_{domain_slugify(args.zone)}"
-    hmackey = os.environ.get('HMAC', os.environ.get(zone_varname))
+    hmackey = get_hmac(args.zone)
 
     if hmackey is None:
         print("Environment variable 'HMAC' is required.")
         sys.exit(1)
 
     # find nameserver if no one is defined
-    if not args.dnsserver:
-        args.dnsserver = utils.dig_get_authoritative_server(args.zone)
+    discovered = not args.dnsserver
+    if discovered:
+        args.dnsserver = zonecache.authoritative_server(args.zone, not args.no_cache)
 
         if args.dnsserver:
             print(f"Found dns server by SOA record: {args.dnsserver}")
@@ -111,25 +261,29 @@ def main():
     ts = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')+'Z'
     filename = 'nsupdate_'+utils.sanitize_for_filesystem(args.dnsserver)+'_'+utils.sanitize_for_filesystem(args.zone)+'_'+ts+'.{0}.db'
 
-    # get zone records by calling dig
-    digstr = utils.dig_zonetransfer(args.dnsserver, hmackey, args.zone)
+    # get zone records by zone transfer, incremental if the zone is cached
+    # ignored RR types are skipped while reading the zone and are neither shown nor changed
+    if args.no_cache:
+        transfer = utils.zonetransfer(args.dnsserver, hmackey, args.zone, args.ignore_rrtype)
+    else:
+        transfer = zonecache.zonetransfer(args.dnsserver, hmackey, args.zone, args.ignore_rrtype)
 
-    if digstr[2] == utils.ZonetransferResult.KEYINVALID:
-        print(digstr[1])
+    if transfer[2] == utils.ZonetransferResult.KEYINVALID:
+        print(transfer[1])
         print("Invalid HMAC key provided or HMAC key was denied by DNS server.")
         sys.exit(1)
-    elif digstr[2] == utils.ZonetransferResult.FAILED:
-        print(digstr[1])
+    elif transfer[2] == utils.ZonetransferResult.FAILED:
+        # the cached server might be outdated
+        if discovered:
+            zonecache.invalidate_server(args.zone)
+
+        print(transfer[1])
         print("Transfer failed.")
         print("Maybe a typo in zone name or dns server address?")
         print("Or the HMAC doesn't have the permission to access the given dns zone.")
         sys.exit(1)
-    elif digstr[0] == False:
-        print("dig failed:")
-        print(digstr[1])
-        sys.exit(1)
 
-    records = zonefile.ZoneFile(digstr[1])
+    records = transfer[1]
 
     if len(records.records) < 1:
         print("Unable to find any records in the DNS zone.")
@@ -138,20 +292,36 @@ def main():
         print("Or something wrong with your permissions?")
         sys.exit(1)
 
+    if len(records.ignored) > 0:
+        ignored = ', '.join(map(lambda x: f'{x[1]} {x[0]}', sorted(records.ignored.items())))
+        print(f"Ignored records: {ignored}")
+
+    # only edit a part of the zone, the changes are computed against this part
+    scope = zonescope.ZoneScope(args.zone, args.name or [], args.subtree or [], args.type or [])
+    fullzone = records
+
+    if not scope.is_empty():
+        records = scope.select(fullzone)
+        print(f"Editing {len(records.records)} of {len(fullzone.records)} records: {scope.describe()}")
+
     # create zone files for diff and editing
-    formatter = zonefileformatter.ZoneFileFormatter(args.ignore_rrtype)
+    formatter = zonefileformatter.ZoneFileFormatter()
 
-    for version in [ 'org', 'new' ]:
-        formatter.save(filename.format(version), records)
+    formatter.save(filename.format('org'), records, [ filename.format('new') ])
 
-    # edit and check syntax
+    # edit and check syntax, records from the server are known to be valid
+    if scope.is_empty():
+        checker = zonecheck.ZoneChecker(args.zone, records.records)
+    else:
+        checker = zonecheck.ZoneChecker(args.zone, records.records, scope, fullzone)
     haserrors = True
     while haserrors:
         # open text editor
-        subprocess.call([ editor, filename.format('new') ])
+        with profiling.stage('editor'):
+            subprocess.call([ editor, filename.format('new') ])
 
         # check syntax
-        checkresult = utils.checkzone(args.zone, filename.format('new'))
+        checkresult = checker.check(filename.format('new'), args.strict_check)
         if checkresult[0]:
             haserrors = False
         else:
@@ -159,18 +329,19 @@ def main():
             print(checkresult[1])
             press('correct the zone file')
 
-    # show a diff between work copy and original
-    diffresult = utils.diff(filename.format('org'), filename.format('new'))
-    if diffresult[0] == False:
+    # compare work copy and original
+    newrecords = zonefile.load(filename.format('new'), args.ignore_rrtype, args.parse_workers or None)
+    nsupdater = zonediff.diff(records, newrecords)
+
+    if len(nsupdater.add) < 1 and len(nsupdater.delete) < 1:
         print("No changes made. Exit.")
         os.remove(filename.format('org'))
         os.remove(filename.format('new'))
         sys.exit(0)
 
     # update soa serial
-    originalsoa = zonefile.SoaRecord(next(filter(lambda x: x.dnsType=='SOA', records.records)))
-    newrecords = zonefile.load(filename.format('new'))
-    editedsoa = zonefile.SoaRecord(next(filter(lambda x: x.dnsType=='SOA', newrecords.records)))
+    originalsoa = zonefile.SoaRecord(records.get_soa())
+    editedsoa = zonefile.SoaRecord(newrecords.get_soa())
 
     if originalsoa == editedsoa:
         # update serial with the classic date format
@@ -178,27 +349,35 @@ def main():
 
         # write zone file and redo diff
         formatter.save(filename.format('new'), newrecords)
-        diffresult = utils.diff(filename.format('org'), filename.format('new'))
+        nsupdater = zonediff.diff(records, newrecords)
 
-    print(utils.colorize_diff(diffresult[1])[1])
-
-    # write diff into a patch file
+    # show a diff between work copy and original, it is rendered while the pager reads it
+    color = diffrender.use_color()
     with open(filename.format('patch'), 'w+') as f:
-        f.write(diffresult[1])
+        # the patch file gets the complete diff
+        difflines = diffrender.tee(zonediff.file_diff(filename.format('org'), filename.format('new')), f)
+
+        shown = diffrender.collapse(difflines, args.collapse_lines)
+        if color:
+            shown = diffrender.colorize(shown)
+
+        diffrender.show(itertools.chain(diffrender.summary(nsupdater.add, nsupdater.delete, color), shown), not args.no_pager)
+
+        # the pager might have been closed before the end of the diff
+        for _ in difflines:
+            pass
 
     # ask befort continue with nsupdate
     press('send the changes to the nameserver')
 
-    # create nsupdate batch file
-    minidiff = utils.diff_minimal(filename.format('org'), filename.format('new'))[1]
-    nsupdater = nsupdate.from_diff(minidiff)
+    # keep the changeset as nsupdate batch file
     nsupdatestr = '\n'.join(list(nsupdater.get_nsupdate_batch(args.dnsserver, args.zone)))
 
     with open(filename.format('batch'), 'w+') as f:
         f.write(nsupdatestr)
 
-    # execute nsupdate
-    updateresult = utils.nsupdate(hmackey, filename.format('batch'))
+    # send the update to the nameserver
+    updateresult = utils.send_update(args.dnsserver, hmackey, args.zone, nsupdater)
 
     if updateresult[0] == False:
         print("nsupdate failed:")
@@ -0,0 +1,249 @@
+import asyncio
+import random
+import re
+import subprocess
+from enum import Enum
+from typing import AsyncIterator, Iterable, List, Set, Tuple, Union
+from zoneutils import zonefile, dnswire, dnsclient, diffrender, profiling
+from zoneutils.nsupdate import NsUpdate
+
+TSIG_EXISTS_RGX = re.compile(r"^\s*[^\s]+\s+[^\s]+\s+ANY\s+TSIG\s+[^\s]+\s+[^\s]+\s+[^\s]+\s+[^\s]+\s+[^\s]+\s+[^\s]+\s+NOERROR\s+[^\s]+\s*$", re.M)
+TRANSFER_FAILED_RGX = re.compile(r"^\s*;\s+Transfer\s+failed.\s*$", re.M)
+
+
+class ZonetransferResult(Enum):
+    OK = 0,
+    KEYINVALID = 1,
+    FAILED = 2
+
+
+async def _terminate(proc: asyncio.subprocess.Process):
+    """ Kill a process which is still running, used on timeout and cancellation """
+
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+        await proc.wait()
+
+
+async def create_process(cmd: List[str], input: bytes = None, timeout: float = None) -> subprocess.CompletedProcess:
+    """ Execute a command, raises asyncio.TimeoutError when it takes too long """
+
+    profiling.count('subprocesses')
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT
+    )
+
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(input), timeout)
+    finally:
+        await _terminate(proc)
+
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout)
+
+
+async def stream_process(cmd: List[str], timeout: float = None) -> AsyncIterator[str]:
+    """ Execute a command and yield its output line by line while it is running """
+
+    profiling.count('subprocesses')
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT
+    )
+
+    try:
+        while True:
+            line = await asyncio.wait_for(proc.stdout.readline(), timeout)
+            if not line:
+                break
+
+            yield line.decode('UTF-8-sig')
+
+        await asyncio.wait_for(proc.wait(), timeout)
+    finally:
+        await _terminate(proc)
+
+
+async def dig_get_soa(zone: str, timeout: float = None) -> zonefile.Record:
+    """ Get the SOA record of a domain from the resolver """
+
+    cmd = [ 'dig', '-t', 'SOA', zone ]
+    soa = None
+
+    # find SOA record while dig is writing its output
+    async for line in stream_process(cmd, timeout):
+        record = zonefile.from_string(line.strip()) if soa is None else None
+
+        if record and record.dnsType == 'SOA':
+            soa = record
+
+    return soa
+
+
+async def dig_get_authoritative_server(zone: str, timeout: float = None) -> str:
+    """ Get domains authoritative name server by SOA record """
+
+    soa = await dig_get_soa(zone, timeout)
+    return zonefile.SoaRecord(soa).soaPrimaryDns if soa else None
+
+
+async def dig_zonetransfer(ns: str, hmac: str, zone: str, timeout: float = None) -> Tuple[bool, str, ZonetransferResult]:
+    """ Perform zone transfer to get the full list of all records in the zone """
+
+    cmd = [ 'dig', '@'+ns, '-y', hmac, '-t', 'AXFR', zone ]
+
+    with profiling.stage('axfr'):
+        proc = await create_process(cmd, timeout=timeout)
+
+    profiling.count('bytes_received', len(proc.stdout))
+    diglines = proc.stdout.decode('UTF-8-sig')
+
+    # check for errors
+    result = ZonetransferResult.OK
+
+    if not TSIG_EXISTS_RGX.search(diglines):
+        result = ZonetransferResult.KEYINVALID
+
+    elif TRANSFER_FAILED_RGX.search(diglines):
+        result = ZonetransferResult.FAILED
+
+    return (proc.returncode == 0 and result == ZonetransferResult.OK, diglines, result)
+
+
+def _wire_rrtypes(rrtypes: Iterable[str]) -> Set[int]:
+    """ Numeric codes of RR types, unknown mnemonics can't match any record and are left out """
+
+    result = set()
+    for rrtype in zonefile.rrtype_set(rrtypes):
+        try:
+            result.add(dnswire.rrtype_from_text(rrtype))
+        except dnswire.DnsWireError:
+            pass
+
+    return result
+
+
+async def zonetransfer(ns: str, hmac: str, zone: str, timeout: float = dnsclient.DNS_TIMEOUT,
+                       ignore_rrtypes: Iterable[str] = ()) -> Tuple[bool, Union[zonefile.ZoneFile, str], ZonetransferResult]:
+    """ Perform zone transfer in-process, returns the zone or an error message.
+        Records of ignored RR types are counted but not converted into records """
+
+    try:
+        key = dnswire.tsigkey_from_hmac(hmac)
+    except dnswire.TsigError as e:
+        return (False, str(e), ZonetransferResult.KEYINVALID)
+
+    try:
+        with profiling.stage('axfr'):
+            records = zonefile.ZoneFile()
+            ignore = _wire_rrtypes(ignore_rrtypes)
+
+            result = []
+            async for message, rr in dnsclient.axfr_wire(ns, zone, key, timeout=timeout):
+                if rr.rrtype in ignore:
+                    rrtype = dnswire.rrtype_to_text(rr.rrtype)
+                    records.ignored[rrtype] = records.ignored.get(rrtype, 0) + 1
+                else:
+                    result.append(dnsclient.to_record(message, rr))
+
+            records.records = result
+            profiling.count('records_transferred', len(result))
+            profiling.count('records_ignored', sum(records.ignored.values()))
+    except dnsclient.KeyRejectedError as e:
+        return (False, str(e), ZonetransferResult.KEYINVALID)
+    except asyncio.TimeoutError:
+        return (False, 'Timeout during zone transfer', ZonetransferResult.FAILED)
+    except (dnsclient.DnsClientError, dnswire.DnsWireError, zonefile.ZoneRecordSyntaxError, OSError) as e:
+        # a record the zone file format can't hold, e.g. of an other class than the ones of zone files
+        return (False, str(e), ZonetransferResult.FAILED)
+
+    records.nameserver = ns
+    records.zone = zone
+    records.querykeytype = key.algorithm
+
+    return (True, records, ZonetransferResult.OK)
+
+
+async def diff(file1: str, file2: str, timeout: float = None) -> Tuple[bool, str]:
+    """ Diff two text files """
+
+    cmd = [ 'diff', '--ignore-space-change', '--suppress-common-lines', '-Nau', file1, file2 ]
+    proc = await create_process(cmd, timeout=timeout)
+
+    return (proc.returncode == 1, proc.stdout.decode('UTF-8-sig'))
+
+
+async def diff_minimal(file1: str, file2: str, timeout: float = None) -> Tuple[bool, str]:
+    """ Diff two text files and shows just the changed lines """
+
+    cmd = [ 'diff', '--ignore-space-change', '--suppress-common-lines', file1, file2 ]
+    proc = await create_process(cmd, timeout=timeout)
+
+    return (proc.returncode == 1, proc.stdout.decode('UTF-8-sig'))
+
+
+async def colorize_diff(diffstr: str, timeout: float = None) -> Tuple[bool, str]:
+    """ Colorize a diff, in-process, the timeout is not used anymore """
+
+    with profiling.stage('colorize'):
+        return (True, '\n'.join(diffrender.colorize(diffstr.split('\n'))))
+
+
+async def checkzone(zone: str, file: str, timeout: float = None) -> Tuple[bool, str]:
+    """ Check syntax of a zone file """
+
+    cmd = [ 'named-checkzone', '-i', 'local', zone, file ]
+
+    with profiling.stage('checkzone'):
+        proc = await create_process(cmd, timeout=timeout)
+
+    return (proc.returncode == 0, proc.stdout.decode('UTF-8-sig'))
+
+
+async def nsupdate(hmac: str, filename: str, timeout: float = None) -> Tuple[bool, str]:
+    """ Perform the nsupdate with a batch file """
+
+    cmd = [ 'nsupdate', '-y', hmac, filename ]
+
+    with profiling.stage('nsupdate'):
+        proc = await create_process(cmd, timeout=timeout)
+
+    return (proc.returncode == 0, proc.stdout.decode('UTF-8-sig'))
+
+
+async def send_update(ns: str, hmac: str, zone: str, changeset: NsUpdate, timeout: float = dnsclient.DNS_TIMEOUT) -> Tuple[bool, str]:
+    """ Send a changeset as signed RFC2136 UPDATE to the nameserver, returns the rcode """
+
+    try:
+        key = dnswire.tsigkey_from_hmac(hmac)
+        messages = changeset.get_update_messages(zone, random.randrange(0, 65536))
+    except dnswire.DnsWireError as e:
+        return (False, str(e))
+
+    # large changesets are split into several transactions, stop at the first failing one
+    rcode = 'NOERROR'
+    for number, message in enumerate(messages, 1):
+        where = f' (transaction {number} of {len(messages)})' if len(messages) > 1 else ''
+
+        try:
+            with profiling.stage('update'):
+                response = await dnsclient.update(ns, message, key, timeout=timeout)
+                profiling.count('update_messages')
+        except asyncio.TimeoutError:
+            return (False, f'Timeout while sending the update{where}')
+        except (dnsclient.DnsClientError, dnswire.DnsWireError, OSError) as e:
+            return (False, f'{str(e)}{where}')
+
+        rcode = response.rcode_text()
+        if response.rcode != 0:
+            return (False, f'{rcode}{where}')
+
+    return (True, rcode)
@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Tuple
+from zoneutils import zonefile, zonediff, zonecache, zonecheck, zonehash, utils
+
+
+class BatchResult:
+    """ Outcome of one zone in a batch run """
+
+    def __init__(self, file: str, zone: str = None):
+        self.file = file
+        self.zone = zone
+        self.server = None
+        self.status = 'failed'
+        self.message = ''
+        self.add = 0
+        self.delete = 0
+        self.seconds = 0.0
+
+        # drift check: diverged names and their changed RR types
+        self.drift: List[Tuple[str, List[str]]] = []
+
+
+def find_zonefiles(paths: List[str]) -> Iterator[str]:
+    """ Expand directories into the zone files they contain """
+
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if not name.startswith('.') and os.path.isfile(os.path.join(path, name)):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+class BatchRunner:
+    """ Applies desired-state zone files to many zones in parallel """
+
+    def __init__(self, hmac_lookup: Callable[[str], str], dnsserver: str = None, ignore_rrtypes: List[str] = [],
+                 workers: int = 8, per_server: int = 2, dry_run: bool = False, use_cache: bool = True,
+                 strict: bool = False, parse_workers: int = 1):
+        self.hmac_lookup = hmac_lookup
+        self.dnsserver = dnsserver
+        self.ignore_rrtypes = ignore_rrtypes
+        self.workers = workers
+        self.per_server = per_server
+        self.dry_run = dry_run
+        self.use_cache = use_cache
+        self.strict = strict
+        self.parse_workers = parse_workers
+        self.server_slots = {}
+        self.lock = threading.Lock()
+
+    def run(self, files: List[str]) -> List[BatchResult]:
+        """ Process all zone files, results are in the order of the files """
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(lambda x: self._run_timed(x, self._run), files))
+
+    def check_drift(self, files: List[str]) -> List[BatchResult]:
+        """ Compare all zone files with the zones on the servers without changing them """
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(lambda x: self._run_timed(x, self._drift), files))
+
+    def _server_slot(self, server: str) -> threading.Semaphore:
+        """ Limits the concurrent operations against one nameserver """
+
+        with self.lock:
+            if server not in self.server_slots:
+                self.server_slots[server] = threading.Semaphore(self.per_server)
+
+            return self.server_slots[server]
+
+    def _run_timed(self, file: str, run: Callable[[str, BatchResult], None]) -> BatchResult:
+        """ Process one zone file and measure the time """
+
+        result = BatchResult(file)
+        start = time.monotonic()
+
+        try:
+            run(file, result)
+        except Exception as e:
+            result.status = 'failed'
+            result.message = str(e)
+
+        result.seconds = time.monotonic() - start
+        return result
+
+    def _transfer(self, file: str, result: BatchResult, hashtree: bool = False) -> Tuple[zonefile.ZoneFile, zonefile.ZoneFile, str]:
+        """ Load the zone file and transfer the current zone, returns both zones and the HMAC key,
+            None on failure with the reason in the result. With hashtree the cache keeps the hash tree of the zone """
+
+        # ignored RR types are neither compared nor changed
+        desired = zonefile.load(file, self.ignore_rrtypes, self.parse_workers)
+        soa = desired.get_soa()
+
+        if soa is None:
+            result.message = 'No SOA record in zone file'
+            return None
+
+        result.zone = soa.dnsName.rstrip('.')
+
+        hmackey = self.hmac_lookup(result.zone)
+        if hmackey is None:
+            result.message = 'No HMAC key defined'
+            return None
+
+        result.server = self.dnsserver or zonecache.authoritative_server(result.zone, self.use_cache)
+        if result.server is None:
+            result.message = 'Unable to find the authoritative name server'
+            return None
+
+        with self._server_slot(result.server):
+            if self.use_cache:
+                transfer = zonecache.zonetransfer(result.server, hmackey, result.zone, self.ignore_rrtypes, hashtree)
+            else:
+                transfer = utils.zonetransfer(result.server, hmackey, result.zone, self.ignore_rrtypes)
+
+        if not transfer[0]:
+            # the cached server might be outdated
+            if self.dnsserver is None and transfer[2] == utils.ZonetransferResult.FAILED:
+                zonecache.invalidate_server(result.zone)
+
+            result.message = f'{transfer[2].name}: {transfer[1]}'
+            return None
+
+        return (desired, transfer[1], hmackey)
+
+    def _drift(self, file: str, result: BatchResult):
+        """ Compare the hash trees of one zone file and the zone on the server """
+
+        # the tree of the server zone comes from the cache and is only updated by the incremental changes
+        zones = self._transfer(file, result, True)
+        if zones is None:
+            return
+
+        desired, current, hmackey = zones
+
+        # the serial of a desired-state file is usually outdated, the other SOA fields count
+        soa = zonefile.from_string(str(desired.get_soa()))
+        zonefile.SoaRecord(soa).soaSerial = zonefile.SoaRecord(current.get_soa()).soaSerial
+        desired.records = [ soa ] + [ x for x in desired.records if x.dnsType != 'SOA' ]
+
+        result.drift = zonehash.compare(current.get_hash_tree(), desired.get_hash_tree())
+        result.status = 'drift' if len(result.drift) > 0 else 'in sync'
+
+    def _run(self, file: str, result: BatchResult):
+        """ Transfer, diff and update one zone """
+
+        zones = self._transfer(file, result)
+        if zones is None:
+            return
+
+        desired, current, hmackey = zones
+
+        # only records which are not on the server yet get the full check
+        checkresult = zonecheck.ZoneChecker(result.zone, current.records).check(file, self.strict)
+        if not checkresult[0]:
+            result.status = 'invalid'
+            result.message = checkresult[1].strip()
+            return
+
+        # the serial of a desired-state file is usually outdated
+        changeset = zonediff.diff_desired(current, desired)
+        if len(changeset.add) < 1 and len(changeset.delete) < 1:
+            result.status = 'unchanged'
+            return
+
+        result.add = len(changeset.add)
+        result.delete = len(changeset.delete)
+
+        if self.dry_run:
+            result.status = 'changes'
+            return
+
+        with self._server_slot(result.server):
+            updateresult = utils.send_update(result.server, hmackey, result.zone, changeset)
+
+        if updateresult[0]:
+            result.status = 'updated'
+        else:
+            result.message = updateresult[1]
+
+
+def summary(results: List[BatchResult]) -> Iterator[str]:
+    """ Aggregated report of a batch run """
+
+    for result in results:
+        zone = result.zone or result.file
+        message = f' ({result.message})' if result.message else ''
+        yield f'{result.status:<10} {zone:<40} +{result.add:<6} -{result.delete:<6} {result.seconds:7.2f}s{message}'
+
+    yield ''
+
+    statuses = {}
+    for result in results:
+        statuses[result.status] = statuses.get(result.status, 0) + 1
+
+    totals = ', '.join(map(lambda x: f'{x[1]} {x[0]}', sorted(statuses.items())))
+    yield f'{len(results)} zones: {totals}'
+    yield f'{sum(map(lambda x: x.add, results))} records added, {sum(map(lambda x: x.delete, results))} records deleted'
+
+
+def drift_summary(results: List[BatchResult]) -> Iterator[str]:
+    """ Diverged zones with their names, zones in sync are only counted """
+
+    for result in results:
+        if result.status == 'in sync':
+            continue
+
+        zone = result.zone or result.file
+        message = f' ({result.message})' if result.message else ''
+        names = f' {len(result.drift)} names' if result.status == 'drift' else ''
+        yield f'{result.status:<10} {zone:<40}{names}{message}'
+
+        for name, rrtypes in result.drift:
+            yield f'  {name:<48} {",".join(rrtypes)}'
+
+    yield ''
+
+    statuses = {}
+    for result in results:
+        statuses[result.status] = statuses.get(result.status, 0) + 1
+
+    totals = ', '.join(map(lambda x: f'{x[1]} {x[0]}', sorted(statuses.items())))
+    yield f'{len(results)} zones: {totals}'
@@ -0,0 +1,404 @@
+import asyncio
+import contextlib
+import csv
+import json
+import sys
+import threading
+import time
+from typing import AsyncIterator, Callable, ContextManager, Dict, Iterable, Iterator, List, NamedTuple, TextIO, Tuple
+from zoneutils import zonefile, zonescope, nsupdate, aioutils, zonestate, profiling
+
+OPERATIONS = ( 'add', 'delete', 'replace' )
+FORMATS = ( 'auto', 'json', 'csv' )
+CSV_FIELDS = [ 'op', 'zone', 'name', 'ttl', 'type', 'content' ]
+DEFAULT_TTL = 300
+DEFAULT_WINDOW = 1.0
+DEFAULT_MAX_BATCH = 10000
+
+# rcodes of failed prerequisites, the zone was changed by someone else meanwhile
+RETRY_RCODES = ( 'NXRRSET', 'YXRRSET', 'NXDOMAIN', 'YXDOMAIN' )
+
+
+class ChangeSyntaxError(Exception): pass
+
+
+class Change(NamedTuple):
+    """ One operation of a change stream, a delete without content removes the whole RRset """
+
+    op: str
+    zone: str
+    record: zonefile.Record
+
+
+class ZoneChangeResult:
+    """ Outcome of the changes of one zone in a batch """
+
+    def __init__(self, zone: str, operations: int, coalesced: int = 0):
+        self.zone = zone
+        self.operations = operations
+        self.coalesced = coalesced
+        self.status = 'failed'
+        self.message = ''
+        self.add = 0
+        self.delete = 0
+
+
+class BatchReport:
+    """ Outcome of one batch of coalesced changes """
+
+    def __init__(self, number: int):
+        self.number = number
+        self.operations = 0
+        self.rejected: List[str] = []
+        self.results: List[ZoneChangeResult] = []
+        self.seconds = 0.0
+
+
+class ChangeReader:
+    """ Parses lines of JSON objects or CSV rows into changes, the format is detected on the first line """
+
+    def __init__(self, format: str = 'auto'):
+        self.format = format
+        self.fields = CSV_FIELDS
+
+    def parse(self, line: str) -> List[Change]:
+        """ Changes of one line, empty for blank lines, comments and CSV headers """
+
+        stripped = line.strip()
+        if not stripped or stripped[0] == '#':
+            return []
+
+        if self.format == 'auto':
+            self.format = 'json' if stripped[0] in '{[' else 'csv'
+
+        if self.format == 'json':
+            try:
+                data = json.loads(stripped)
+            except ValueError as e:
+                raise ChangeSyntaxError(f'Invalid JSON: {e}')
+
+            items = data if isinstance(data, list) else [ data ]
+            if not all(isinstance(x, dict) for x in items):
+                raise ChangeSyntaxError('Expected a JSON object or a list of them')
+
+            return [ change_from_fields(x) for x in items ]
+
+        row = next(csv.reader([ stripped ]))
+
+        # an optional header defines the order of the columns
+        if row[0].strip().lower() == 'op':
+            self.fields = [ x.strip().lower() for x in row ]
+            return []
+
+        if len(row) > len(self.fields):
+            raise ChangeSyntaxError(f'Expected at most {len(self.fields)} columns: {", ".join(self.fields)}')
+
+        return [ change_from_fields(dict(zip(self.fields, row))) ]
+
+
+def change_from_fields(fields: dict) -> Change:
+    """ Change from op, zone and either a zone file line as record or name, ttl, class, type and content """
+
+    op = str(fields.get('op', '')).strip().lower()
+    if op not in OPERATIONS:
+        raise ChangeSyntaxError(f'Unknown operation {op!r}, expected one of {", ".join(OPERATIONS)}')
+
+    zone = str(fields.get('zone') or '').strip().rstrip('.').lower()
+    if not zone:
+        raise ChangeSyntaxError('Missing zone')
+
+    if fields.get('record'):
+        record = zonefile.from_string(str(fields['record']))
+        if record is None:
+            raise ChangeSyntaxError(f'Unable to parse record: {fields["record"]}')
+    else:
+        # names relative to the zone are usual for short-lived records, e.g. _acme-challenge.www
+        name = zonescope.ZoneScope(zone).qualify(str(fields.get('name') or '@'))
+        rrtype = str(fields.get('type') or '').strip().upper()
+        rrclass = str(fields.get('class') or 'IN').strip().upper()
+        content = str(fields.get('content') or '').strip()
+        ttl = str(fields.get('ttl') or DEFAULT_TTL).strip()
+
+        if not rrtype:
+            raise ChangeSyntaxError(f'Missing type for {name}')
+
+        try:
+            if op == 'delete' and not content:
+                record = zonefile.Record(name, 0, rrclass, rrtype)
+            else:
+                record = zonefile.from_string(f'{name} {ttl} {rrclass} {rrtype} {content}')
+        except zonefile.ZoneRecordSyntaxError as e:
+            raise ChangeSyntaxError(str(e))
+
+        if record is None:
+            raise ChangeSyntaxError(f'Unable to parse record: {name} {ttl} {rrclass} {rrtype} {content}')
+
+    name = record.dnsName.lower()
+    if name != zone + '.' and not name.endswith('.' + zone + '.'):
+        raise ChangeSyntaxError(f'{record.dnsName} is not part of the zone {zone}')
+
+    # the serial is increased once per batch, a stream never sets it
+    if record.dnsType == 'SOA':
+        raise ChangeSyntaxError('SOA records can not be changed by a change stream')
+
+    return Change(op, zone, record)
+
+
+def _rr_key(record: zonefile.Record) -> tuple:
+    """ Identity of a RR, a record with another TTL replaces it """
+
+    return (record.dnsName.lower(), record.dnsClass, record.dnsType, record.dnsPrio, record.dnsContent)
+
+
+def _rrset_key(record: zonefile.Record) -> Tuple[str, str, str]:
+    """ Identity of the RRset of a record """
+
+    return (record.dnsName.lower(), record.dnsClass, record.dnsType)
+
+
+class ZoneBatch:
+    """ Coalesced changes of one zone, the operations of each RRset in their order """
+
+    def __init__(self, zone: str):
+        self.zone = zone
+        self.rrsets: Dict[Tuple[str, str, str], List[Change]] = {}
+        self.operations = 0
+        self.coalesced = 0
+
+    def append(self, change: Change):
+        """ Add an operation, a replace makes the earlier operations of its RRset obsolete """
+
+        operations = self.rrsets.setdefault(_rrset_key(change.record), [])
+        if change.op == 'replace' or (change.op == 'delete' and change.record.dnsContent is None):
+            self.coalesced += len(operations)
+            operations.clear()
+
+        operations.append(change)
+        self.operations += 1
+
+    def changeset(self, current: zonefile.ZoneFile) -> nsupdate.NsUpdate:
+        """ Net changes against the current zone, with one serial increase for all of them """
+
+        add = []
+        delete = []
+        keep = []
+
+        for (name, rrclass, rrtype), operations in self.rrsets.items():
+            old = [ x for x in current.get_rrset(name, rrtype) if x.dnsClass == rrclass ]
+            new = _fold(old, operations)
+
+            # a changed TTL is a changed record
+            oldkeys = set(map(lambda x: _rr_key(x) + (x.dnsTtl,), old))
+            newkeys = set(map(lambda x: _rr_key(x) + (x.dnsTtl,), new))
+
+            add.extend(x for x in new if _rr_key(x) + (x.dnsTtl,) not in oldkeys)
+            delete.extend(x for x in old if _rr_key(x) + (x.dnsTtl,) not in newkeys)
+            keep.extend(x for x in old if _rr_key(x) + (x.dnsTtl,) in newkeys)
+
+        if len(add) < 1 and len(delete) < 1:
+            return nsupdate.NsUpdate(keep=keep)
+
+        soa = current.get_soa()
+        newsoa = zonefile.from_string(str(soa))
+        zonefile.SoaRecord(newsoa).apply_default_serialincrease()
+
+        return nsupdate.NsUpdate(add=add + [ newsoa ], delete=delete + [ soa ], keep=keep)
+
+
+def _fold(records: List[zonefile.Record], operations: List[Change]) -> List[zonefile.Record]:
+    """ Records of an RRset after applying the operations in order """
+
+    records = list(records)
+
+    for change in operations:
+        if change.op == 'replace':
+            records = [ change.record ]
+        elif change.record.dnsContent is None:
+            records = []
+        else:
+            key = _rr_key(change.record)
+            records = [ x for x in records if _rr_key(x) != key ]
+
+            if change.op == 'add':
+                records.append(change.record)
+
+    return records
+
+
+class ChangeStreamRunner:
+    """ Applies a stream of changes in batches, the zones are kept in memory between the batches """
+
+    def __init__(self, hmac_lookup: Callable[[str], str], dnsserver: str = None, ignore_rrtypes: List[str] = [],
+                 use_cache: bool = True, window: float = DEFAULT_WINDOW, max_batch: int = DEFAULT_MAX_BATCH,
+                 workers: int = 8, dry_run: bool = False):
+        self.zones = zonestate.WarmZones(hmac_lookup, dnsserver, ignore_rrtypes, use_cache)
+        self.ignore = zonefile.rrtype_set(ignore_rrtypes)
+        self.window = window
+        self.max_batch = max_batch
+        self.workers = workers
+        self.dry_run = dry_run
+
+    async def run(self, lines: Iterable[str], reader: ChangeReader) -> AsyncIterator[BatchReport]:
+        """ Read the lines in a thread and apply the changes in batches, yields a report per batch """
+
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+
+        def produce():
+            try:
+                for lineno, line in enumerate(lines, 1):
+                    try:
+                        for change in reader.parse(line):
+                            loop.call_soon_threadsafe(queue.put_nowait, change)
+                    except ChangeSyntaxError as e:
+                        loop.call_soon_threadsafe(queue.put_nowait, f'line {lineno}: {e}')
+            except Exception as e:
+                # errors while reading end the stream, they are raised again by the consumer
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        threading.Thread(target=produce, daemon=True).start()
+
+        number = 0
+        finished = False
+        while not finished:
+            number += 1
+            report = BatchReport(number)
+            batches, finished = await self._collect(queue, report)
+
+            if report.operations > 0 or len(report.rejected) > 0:
+                start = time.monotonic()
+
+                with profiling.stage('changes_apply'):
+                    slots = asyncio.Semaphore(self.workers)
+                    report.results = list(await asyncio.gather(*[ self._apply(x, slots) for x in batches.values() ]))
+
+                report.seconds = time.monotonic() - start
+                yield report
+
+    async def _collect(self, queue: asyncio.Queue, report: BatchReport) -> Tuple[Dict[str, ZoneBatch], bool]:
+        """ Collect changes until the window after the first one passed or the batch is full, True at the end of the stream """
+
+        batches: Dict[str, ZoneBatch] = {}
+        deadline = None
+
+        while report.operations < self.max_batch:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return (batches, False)
+
+            if item is None:
+                return (batches, True)
+
+            if isinstance(item, Exception):
+                raise item
+
+            if deadline is None:
+                deadline = time.monotonic() + self.window
+
+            if isinstance(item, str):
+                report.rejected.append(item)
+                continue
+
+            # ignored types are not part of the transferred zone, their RRsets are unknown
+            if item.record.dnsType in self.ignore:
+                report.rejected.append(f'{item.record.dnsName} {item.record.dnsType}: RR type is ignored')
+                continue
+
+            profiling.count('changes_received')
+            batches.setdefault(item.zone, ZoneBatch(item.zone)).append(item)
+            report.operations += 1
+
+        return (batches, False)
+
+    async def _apply(self, batch: ZoneBatch, slots: asyncio.Semaphore) -> ZoneChangeResult:
+        """ Send the changes of one zone, once more on a failed prerequisite """
+
+        result = ZoneChangeResult(batch.zone, batch.operations, batch.coalesced)
+
+        async with slots:
+            try:
+                state = await self.zones.get_zone(batch.zone)
+
+                for attempt in range(2):
+                    # a cheap SOA query, the zone is only transferred when someone else changed it
+                    await self.zones.refresh(state)
+
+                    async with state.lock:
+                        changeset = batch.changeset(state.records)
+                        result.add = len([ x for x in changeset.add if x.dnsType != 'SOA' ])
+                        result.delete = len([ x for x in changeset.delete if x.dnsType != 'SOA' ])
+
+                        if len(changeset.add) < 1 and len(changeset.delete) < 1:
+                            result.status = 'unchanged'
+                            return result
+
+                        if self.dry_run:
+                            result.status = 'changes'
+                            return result
+
+                        updateresult = await aioutils.send_update(state.server, state.hmac, state.zone, changeset)
+
+                        if updateresult[0]:
+                            state.apply(changeset)
+                            result.status = 'updated'
+                            result.message = ''
+                            return result
+
+                    result.message = updateresult[1]
+                    if not updateresult[1].startswith(RETRY_RCODES):
+                        break
+            except Exception as e:
+                result.message = str(e)
+
+        return result
+
+
+def open_lines(source: str) -> ContextManager[TextIO]:
+    """ Open a file of changes right away, so a missing file fails before the stream starts, - is stdin """
+
+    if source == '-':
+        return contextlib.nullcontext(sys.stdin)
+
+    return open(source, 'r')
+
+
+def batch_lines(report: BatchReport) -> Iterator[str]:
+    """ Report of one batch """
+
+    for line in report.rejected:
+        yield f'rejected   {line}'
+
+    for result in report.results:
+        message = f' ({result.message})' if result.message else ''
+        yield f'{result.status:<10} {result.zone:<40} {result.operations:>7} ops +{result.add:<6} -{result.delete:<6}{message}'
+
+    add = sum(map(lambda x: x.add, report.results))
+    delete = sum(map(lambda x: x.delete, report.results))
+    yield f'batch {report.number}: {report.operations} operations in {len(report.results)} zones, +{add} -{delete} records, {report.seconds:.2f}s'
+
+
+def summary(reports: List[BatchReport], seconds: float) -> Iterator[str]:
+    """ Throughput of a change stream run """
+
+    operations = sum(map(lambda x: x.operations, reports))
+    rejected = sum(map(lambda x: len(x.rejected), reports))
+    results = [ x for report in reports for x in report.results ]
+    coalesced = sum(map(lambda x: x.coalesced, results))
+    changed = sum(map(lambda x: x.add + x.delete, results))
+    applying = sum(map(lambda x: x.seconds, reports))
+
+    statuses = {}
+    for result in results:
+        statuses[result.status] = statuses.get(result.status, 0) + 1
+
+    totals = ', '.join(map(lambda x: f'{x[1]} {x[0]}', sorted(statuses.items())))
+
+    yield ''
+    yield f'{operations} operations, {rejected} rejected, {len(reports)} batches, {len(results)} zone updates' + (f': {totals}' if totals else '')
+    yield f'{changed} records changed, {coalesced} operations superseded by a later one of the same batch'
+    yield f'{seconds:.2f}s total, {applying:.2f}s applying, {operations / applying if applying > 0 else 0:.0f} operations/s while applying'
@@ -0,0 +1,332 @@
+import asyncio
+import json
+import os
+import stat
+import sys
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+from zoneutils import zonefile, zonefileformatter, zonediff, zonecheck, zonescope, zonestate, aioutils, dnsclient, dnswire, nsupdate, profiling
+
+MAX_BODY_SIZE = 64 * 1024 * 1024
+DEFAULT_POLL_INTERVAL = 60
+REASONS = { 200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 422: 'Unprocessable Entity', 500: 'Internal Server Error', 502: 'Bad Gateway' }
+
+
+class DaemonError(Exception): pass
+
+
+class ZoneDaemon:
+    """ Keeps zones warm and serves them over HTTP on a unix socket """
+
+    def __init__(self, hmac_lookup: Callable[[str], str], dnsserver: str = None, ignore_rrtypes: List[str] = [],
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, use_cache: bool = True):
+        self.zones = zonestate.WarmZones(hmac_lookup, dnsserver, ignore_rrtypes, use_cache)
+        self.ignore_rrtypes = ignore_rrtypes
+        self.poll_interval = poll_interval
+        self.formatter = zonefileformatter.ZoneFileFormatter()
+
+    async def serve(self, path: str):
+        """ Listen on a unix socket until cancelled """
+
+        # a socket file of a previous run is replaced, other files are not
+        if os.path.exists(path):
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                raise DaemonError(f'{path} exists and is not a socket')
+            os.remove(path)
+
+        # the API can change zones, only the own user may connect
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path)
+        finally:
+            os.umask(umask)
+
+        poller = asyncio.create_task(self._poll())
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            poller.cancel()
+            if os.path.exists(path):
+                os.remove(path)
+
+    async def _poll(self):
+        """ Check the serials of all warm zones periodically """
+
+        while True:
+            await asyncio.sleep(self.poll_interval)
+
+            for state in list(self.zones.zones.values()):
+                if state.records is None:
+                    continue
+
+                # a failing zone does not stop the polling of the others
+                try:
+                    await self.zones.refresh(state)
+                except Exception as e:
+                    print(f'Refresh of {state.zone} failed: {type(e).__name__}: {e}', file=sys.stderr)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """ Answer one HTTP request per connection """
+
+        try:
+            try:
+                method, target, headers, body = await _read_request(reader)
+                status, contenttype, payload = await self.dispatch(method, target, headers, body)
+            except DaemonError as e:
+                status, contenttype, payload = _json_response(e.args[0], { 'error': e.args[1] })
+            except zonestate.MissingKeyError as e:
+                status, contenttype, payload = _json_response(403, { 'error': str(e) })
+            except zonestate.ZoneStateError as e:
+                status, contenttype, payload = _json_response(502, { 'error': str(e) })
+            except (asyncio.TimeoutError, dnsclient.DnsClientError, dnswire.DnsWireError, OSError) as e:
+                status, contenttype, payload = _json_response(502, { 'error': str(e) })
+            except Exception as e:
+                status, contenttype, payload = _json_response(500, { 'error': f'{type(e).__name__}: {e}' })
+
+            profiling.count('api_requests')
+            writer.write(_response_head(status, contenttype, len(payload)) + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> Tuple[int, str, bytes]:
+        """ Route a request, returns status, content type and body """
+
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        parts = [ unquote(x) for x in url.path.strip('/').split('/') if x ]
+
+        if parts == [ 'zones' ] and method == 'GET':
+            return _json_response(200, [ x.info() for x in self.zones.zones.values() ])
+
+        if len(parts) < 2 or parts[0] != 'zones' or len(parts) > 3:
+            raise DaemonError(404, 'Unknown path')
+
+        action = parts[2] if len(parts) > 2 else None
+        routes = {
+            ('GET', None): self._get_records,
+            ('GET', 'file'): self._get_file,
+            ('POST', 'refresh'): self._post_refresh,
+            ('POST', 'diff'): self._post_diff,
+            ('POST', 'update'): self._post_update,
+        }
+
+        handler = routes.get((method, action))
+        if handler is None:
+            raise DaemonError(405 if action in [ None, 'file', 'refresh', 'diff', 'update' ] else 404, 'Unsupported method or path')
+
+        state = await self.zones.get_zone(parts[1])
+        scope = zonescope.ZoneScope(state.zone, query.get('name', []), query.get('subtree', []), query.get('type', []))
+
+        return await handler(state, scope, headers, body)
+
+    async def _get_records(self, state: zonestate.WarmZone, scope: zonescope.ZoneScope, headers: dict, body: bytes) -> Tuple[int, str, bytes]:
+        """ Records of the zone or a part of it """
+
+        result = state.info()
+        result['records'] = [ str(x) for x in scope.select(state.records).records ]
+        return _json_response(200, result)
+
+    async def _get_file(self, state: zonestate.WarmZone, scope: zonescope.ZoneScope, headers: dict, body: bytes) -> Tuple[int, str, bytes]:
+        """ The zone or a part of it as formatted zone file """
+
+        lines = self.formatter.format(scope.select(state.records))
+        return (200, 'text/plain; charset=utf-8', ('\n'.join(lines) + '\n').encode('UTF-8'))
+
+    async def _post_refresh(self, state: zonestate.WarmZone, scope: zonescope.ZoneScope, headers: dict, body: bytes) -> Tuple[int, str, bytes]:
+        """ Transfer the zone again, without waiting for the next poll """
+
+        await self.zones.refresh(state, force=True)
+        return _json_response(200, state.info())
+
+    async def _post_diff(self, state: zonestate.WarmZone, scope: zonescope.ZoneScope, headers: dict, body: bytes) -> Tuple[int, str, bytes]:
+        """ Preview the changes of a desired-state zone file or changeset """
+
+        # a running update is waited for, like an update waits for a running refresh
+        async with state.lock:
+            current, changeset = self._changeset(state, scope, headers, body)
+            return _json_response(200, _changeset_result(current, changeset, self.formatter))
+
+    async def _post_update(self, state: zonestate.WarmZone, scope: zonescope.ZoneScope, headers: dict, body: bytes) -> Tuple[int, str, bytes]:
+        """ Send the changes of a desired-state zone file or changeset to the server """
+
+        async with state.lock:
+            current, changeset = self._changeset(state, scope, headers, body)
+            result = _changeset_result(current, changeset, self.formatter, False)
+
+            if len(changeset.add) < 1 and len(changeset.delete) < 1:
+                result['status'] = 'unchanged'
+                return _json_response(200, result)
+
+            updateresult = await aioutils.send_update(state.server, state.hmac, state.zone, changeset)
+            if not updateresult[0]:
+                raise DaemonError(502, f'Update failed: {updateresult[1]}')
+
+        # the new serial is picked up right away
+        await self.zones.refresh(state)
+
+        result['status'] = 'updated'
+        result['serial'] = state.serial
+        return _json_response(200, result)
+
+    def _changeset(self, state: zonestate.WarmZone, scope: zonescope.ZoneScope, headers: dict, body: bytes) -> Tuple[zonefile.ZoneFile, nsupdate.NsUpdate]:
+        """ Changeset from a JSON body with add and delete lists, or from a desired-state zone file """
+
+        current = scope.select(state.records)
+
+        try:
+            text = body.decode('UTF-8')
+        except UnicodeDecodeError:
+            raise DaemonError(400, 'Request body is not UTF-8')
+
+        if headers.get('content-type', '').split(';')[0].strip() == 'application/json':
+            return (current, changeset_from_json(current, text))
+
+        # the desired state gets the same check as an edited zone file
+        checker = zonecheck.ZoneChecker(state.zone, current.records, None if scope.is_empty() else scope, state.records)
+        problems = checker.check_lines(text.splitlines())
+        if len(problems) > 0:
+            raise DaemonError(422, list(zonecheck.format_problems('body', problems)))
+
+        # an outdated serial alone is no change, like in batch mode
+        desired = zonefile.ZoneFile(text, self.ignore_rrtypes)
+        return (current, zonediff.diff_desired(current, desired))
+
+
+def changeset_from_json(current: zonefile.ZoneFile, text: str) -> nsupdate.NsUpdate:
+    """ Changeset from {"add": [records], "delete": [records]} in zone file syntax, the serial is
+        increased unless the changeset contains a SOA record """
+
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise DaemonError(400, f'Invalid JSON: {e}')
+
+    if not isinstance(data, dict):
+        raise DaemonError(400, 'Expected a JSON object with add and delete lists')
+
+    soa = current.get_soa()
+    zone = soa.dnsName.lower()
+
+    changes = {}
+    for action in [ 'add', 'delete' ]:
+        records = []
+        for line in data.get(action, []):
+            try:
+                record = zonefile.from_string(line) if isinstance(line, str) else None
+            except zonefile.ZoneRecordSyntaxError as e:
+                raise DaemonError(400, f'{line}: {e}')
+
+            if record is None:
+                raise DaemonError(400, f'Unable to parse record: {line}')
+
+            name = record.dnsName.lower()
+            if name != zone and not name.endswith('.' + zone):
+                raise DaemonError(400, f'{record.dnsName} is not part of the zone {zone}')
+
+            records.append(record)
+
+        changes[action] = records
+
+    if len(changes['add']) < 1 and len(changes['delete']) < 1:
+        return nsupdate.NsUpdate()
+
+    if not any(x.dnsType == 'SOA' for x in changes['add'] + changes['delete']):
+        newsoa = zonefile.from_string(str(soa))
+        zonefile.SoaRecord(newsoa).apply_default_serialincrease()
+
+        changes['delete'].append(soa)
+        changes['add'].append(newsoa)
+
+    return nsupdate.NsUpdate(add=changes['add'], delete=changes['delete'])
+
+
+def _changeset_result(current: zonefile.ZoneFile, changeset: nsupdate.NsUpdate, formatter: zonefileformatter.ZoneFileFormatter,
+                      withdiff: bool = True) -> dict:
+    """ Changeset as JSON compatible dict, optionally with a unified diff """
+
+    result = {
+        'add': [ str(x) for x in changeset.add ],
+        'delete': [ str(x) for x in changeset.delete ],
+    }
+
+    if withdiff:
+        # the diff is against the zone file of GET /zones/<zone>/file, patch can apply it there
+        new = zonefile.ZoneFile()
+        new.digversion, new.nameserver, new.zone = current.digversion, current.nameserver, current.zone
+        new.records = _apply(current.records, changeset)
+        org = [ x + '\n' for x in formatter.format(current) ]
+        result['diff'] = '\n'.join(zonediff.unified_diff(org, [ x + '\n' for x in formatter.format(new) ]))
+
+    return result
+
+
+def _apply(records: List[zonefile.Record], changeset: nsupdate.NsUpdate) -> List[zonefile.Record]:
+    """ Records after applying a changeset """
+
+    deleted = {}
+    for record in changeset.delete:
+        key = record.as_tuple()
+        deleted[key] = deleted.get(key, 0) + 1
+
+    result = []
+    for record in records:
+        key = record.as_tuple()
+        if deleted.get(key, 0) > 0:
+            deleted[key] -= 1
+        else:
+            result.append(record)
+
+    return result + list(changeset.add)
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+    """ Read a HTTP/1.x request """
+
+    requestline = (await reader.readline()).decode('latin-1').strip()
+    parts = requestline.split(' ')
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        raise DaemonError(400, 'Invalid request line')
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1')
+        if line.strip() == '':
+            break
+
+        if ':' not in line:
+            raise DaemonError(400, 'Invalid header line')
+
+        name, value = line.split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise DaemonError(400, 'Invalid Content-Length')
+
+    if length > MAX_BODY_SIZE:
+        raise DaemonError(413, f'Request body is larger than {MAX_BODY_SIZE} bytes')
+
+    body = await reader.readexactly(length) if length > 0 else b''
+    return (parts[0].upper(), parts[1], headers, body)
+
+
+def _json_response(status: int, data) -> Tuple[int, str, bytes]:
+    """ Status, content type and body of a JSON response """
+
+    return (status, 'application/json', (json.dumps(data, indent=2) + '\n').encode('UTF-8'))
+
+
+def _response_head(status: int, contenttype: str, length: int) -> bytes:
+    """ Status line and headers of a response """
+
+    return (f'HTTP/1.1 {status} {REASONS.get(status, "Unknown")}\r\n'
+            f'Content-Type: {contenttype}\r\n'
+            f'Content-Length: {length}\r\n'
+            'Connection: close\r\n\r\n').encode('latin-1')
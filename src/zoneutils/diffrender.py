@@ -0,0 +1,131 @@
+import os
+import shlex
+import subprocess
+import sys
+from collections import Counter, deque
+from typing import IO, Iterable, Iterator, List
+from zoneutils import zonefile, profiling
+
+RESET = '\033[0m'
+BOLD = '\033[1m'
+RED = '\033[31m'
+GREEN = '\033[32m'
+CYAN = '\033[36m'
+
+DEFAULT_PAGER = 'less -FRX'
+DEFAULT_COLLAPSE_LINES = 200
+
+
+def summary(add: List[zonefile.Record], delete: List[zonefile.Record], color: bool = True) -> Iterator[str]:
+    """ Number of added and deleted records per RR type """
+
+    added = Counter(map(lambda x: x.dnsType, add))
+    deleted = Counter(map(lambda x: x.dnsType, delete))
+
+    bold = BOLD if color else ''
+    plus = GREEN if color else ''
+    minus = RED if color else ''
+    reset = RESET if color else ''
+
+    yield f'{bold}Changes:{reset} {plus}+{len(add)}{reset} {minus}-{len(delete)}{reset} records'
+
+    for rrtype in sorted(set(added) | set(deleted)):
+        yield f'  {rrtype:<10} {plus}{"+" + str(added[rrtype]):>8}{reset} {minus}{"-" + str(deleted[rrtype]):>8}{reset}'
+
+    yield ''
+
+
+def colorize(lines: Iterable[str]) -> Iterator[str]:
+    """ Color the lines of a unified diff like colordiff """
+
+    for line in lines:
+        if line.startswith('+++') or line.startswith('---'):
+            yield f'{BOLD}{line}{RESET}'
+        elif line.startswith('@@'):
+            yield f'{CYAN}{line}{RESET}'
+        elif line.startswith('+'):
+            yield f'{GREEN}{line}{RESET}'
+        elif line.startswith('-'):
+            yield f'{RED}{line}{RESET}'
+        else:
+            yield line
+
+
+def collapse(lines: Iterable[str], maxlines: int = DEFAULT_COLLAPSE_LINES) -> Iterator[str]:
+    """ Shorten hunks of a unified diff with more than maxlines lines to their first and last lines """
+
+    if maxlines < 1:
+        yield from lines
+        return
+
+    head = maxlines // 2
+    tail = deque(maxlen=maxlines - head)
+    count = 0
+
+    def finish() -> Iterator[str]:
+        if count > maxlines:
+            yield f'... {count - maxlines} lines not shown ...'
+        yield from tail
+
+    for line in lines:
+        if line.startswith('@@') or line.startswith('---') or line.startswith('+++'):
+            yield from finish()
+            tail.clear()
+            count = 0
+            yield line
+            continue
+
+        # the first lines of a hunk are shown right away, the last ones when the hunk is complete
+        count += 1
+        if count <= head:
+            yield line
+        else:
+            tail.append(line)
+
+    yield from finish()
+
+
+def tee(lines: Iterable[str], file: IO[str]) -> Iterator[str]:
+    """ Write lines into a file while passing them on """
+
+    for line in lines:
+        profiling.count('diff_lines')
+        file.write(line + '\n')
+        yield line
+
+
+def use_color(stream: IO[str] = None) -> bool:
+    """ Colors only for terminals and when NO_COLOR is not set """
+
+    stream = stream or sys.stdout
+    return stream.isatty() and 'NO_COLOR' not in os.environ
+
+
+def show(lines: Iterable[str], pager: bool = True):
+    """ Print lines through $PAGER when the output is a terminal, the lines are created while
+        the pager reads them. Quitting the pager stops reading the lines """
+
+    command = shlex.split(os.environ.get('PAGER', DEFAULT_PAGER)) if pager and sys.stdout.isatty() else []
+
+    if len(command) < 1:
+        for line in lines:
+            print(line)
+        return
+
+    try:
+        proc = subprocess.Popen(command, stdin=subprocess.PIPE, encoding='UTF-8')
+        profiling.count('subprocesses')
+    except OSError:
+        # no pager installed
+        for line in lines:
+            print(line)
+        return
+
+    try:
+        for line in lines:
+            proc.stdin.write(line + '\n')
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    finally:
+        proc.wait()
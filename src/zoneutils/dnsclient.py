@@ -0,0 +1,240 @@
+import asyncio
+import random
+import struct
+from typing import AsyncIterator, Tuple
+from zoneutils import dnswire, zonefile, profiling
+
+DNS_PORT = 53
+DNS_TIMEOUT = 30
+
+
+class DnsClientError(Exception): pass
+class KeyRejectedError(DnsClientError): pass
+
+
+async def _recv_tcp(reader: asyncio.StreamReader, timeout: float) -> bytes:
+    """ Read a length prefixed message """
+
+    try:
+        length = struct.unpack('!H', await asyncio.wait_for(reader.readexactly(2), timeout))[0]
+        message = await asyncio.wait_for(reader.readexactly(length), timeout)
+    except asyncio.IncompleteReadError:
+        raise DnsClientError('Connection closed by the server')
+
+    profiling.count('bytes_received', length + 2)
+    return message
+
+
+def to_record(message: dnswire.Message, rr: dnswire.WireRecord) -> zonefile.Record:
+    """ Create a zone file record from a record in wire format """
+
+    rrtype = dnswire.rrtype_to_text(rr.rrtype)
+    content = dnswire.rdata_to_text(message.buf, rr.rrtype, rr.offset, rr.length)
+    prio = None
+
+    # same split as the zone file parser, MX and SRV carry a priority
+    if rrtype in zonefile.PRIO_RRTYPES and not content.startswith('\\#'):
+        prio, content = content.split(' ', 1)
+        prio = int(prio)
+
+    return zonefile.Record(
+        dnsName=rr.name,
+        dnsTtl=rr.ttl,
+        dnsClass=dnswire.rrclass_to_text(rr.rrclass),
+        dnsType=rrtype,
+        dnsPrio=prio,
+        dnsContent=content
+    )
+
+
+class _Exchange:
+    """ Signed query over TCP, reads the answers of one or more responses """
+
+    def __init__(self, server: str, zone: str, rrtype: str, key: dnswire.TsigKey, authority: list = [],
+                 port: int = DNS_PORT, timeout: float = DNS_TIMEOUT):
+        self.server = server
+        self.port = port
+        self.timeout = timeout
+        self.msgid = random.randrange(0, 65536)
+        self.reader = None
+        self.writer = None
+
+        question = dnswire.make_question(zone, dnswire.RRTYPES[rrtype])
+        query = dnswire.make_message(self.msgid, dnswire.OPCODE_QUERY, [ question ], authority=authority)
+        self.query, mac = dnswire.tsig_sign(query, key)
+        self.verifier = dnswire.TsigVerifier(key, mac)
+
+    async def __aenter__(self):
+        self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.server, self.port), self.timeout)
+        self.writer.write(struct.pack('!H', len(self.query)) + self.query)
+        await self.writer.drain()
+        profiling.count('bytes_sent', len(self.query) + 2)
+        return self
+
+    async def __aexit__(self, *args):
+        self.writer.close()
+
+    async def answers(self) -> AsyncIterator[Tuple[dnswire.Message, dnswire.WireRecord]]:
+        """ Read responses until the caller stops, yields their answer records """
+
+        while True:
+            message = dnswire.Message(await _recv_tcp(self.reader, self.timeout))
+
+            if message.id != self.msgid or not message.flags & dnswire.FLAG_QR:
+                raise DnsClientError('Received an unexpected message')
+
+            try:
+                self.verifier.verify(message)
+            except dnswire.TsigError as e:
+                raise KeyRejectedError(str(e))
+
+            if message.rcode != 0:
+                raise DnsClientError(f'Query failed: {message.rcode_text()}')
+
+            if len(message.answer) < 1:
+                raise DnsClientError('Query failed: empty response')
+
+            for rr in message.answer:
+                yield (message, rr)
+
+    def finish(self):
+        """ Ensure the last read response was signed """
+
+        try:
+            self.verifier.finish()
+        except dnswire.TsigError as e:
+            raise KeyRejectedError(str(e))
+
+
+async def soa(server: str, zone: str, key: dnswire.TsigKey, port: int = DNS_PORT, timeout: float = DNS_TIMEOUT) -> zonefile.Record:
+    """ Query the SOA record of a zone """
+
+    zone = zone if zone.endswith('.') else zone + '.'
+
+    async with _Exchange(server, zone, 'SOA', key, port=port, timeout=timeout) as exchange:
+        async for message, rr in exchange.answers():
+            if rr.rrtype == dnswire.RRTYPES['SOA']:
+                break
+
+        exchange.finish()
+
+    return to_record(message, rr)
+
+
+async def axfr(server: str, zone: str, key: dnswire.TsigKey, port: int = DNS_PORT, timeout: float = DNS_TIMEOUT) -> AsyncIterator[zonefile.Record]:
+    """ Transfer a zone over TCP, yields the records without the closing SOA """
+
+    async for message, rr in axfr_wire(server, zone, key, port, timeout):
+        yield to_record(message, rr)
+
+
+async def axfr_wire(server: str, zone: str, key: dnswire.TsigKey, port: int = DNS_PORT,
+                    timeout: float = DNS_TIMEOUT) -> AsyncIterator[Tuple[dnswire.Message, dnswire.WireRecord]]:
+    """ Transfer a zone over TCP, yields the records in wire format without the closing SOA,
+        so the caller can skip records before converting them """
+
+    zone = zone if zone.endswith('.') else zone + '.'
+
+    async with _Exchange(server, zone, 'AXFR', key, port=port, timeout=timeout) as exchange:
+        first = True
+        async for message, rr in exchange.answers():
+            if first and rr.rrtype != dnswire.RRTYPES['SOA']:
+                raise DnsClientError('Transfer failed: zone does not start with a SOA record')
+            elif not first and rr.rrtype == dnswire.RRTYPES['SOA']:
+                break
+
+            first = False
+            yield (message, rr)
+
+        exchange.finish()
+
+
+async def ixfr(server: str, zone: str, soarecord: zonefile.Record, key: dnswire.TsigKey,
+               port: int = DNS_PORT, timeout: float = DNS_TIMEOUT) -> Tuple[bool, list]:
+    """ Incremental transfer since the given SOA. Returns True and a list of (deleted, added)
+        records per serial step, or False and all records when the server sent the full zone """
+
+    zone = zone if zone.endswith('.') else zone + '.'
+    rdata = dnswire.rdata_from_text('SOA', soarecord.dnsContent, zone)
+    authority = dnswire.rr_to_wire(dnswire.name_to_wire(zone), dnswire.RRTYPES['SOA'], dnswire.RRCLASSES['IN'], 0, rdata)
+
+    async with _Exchange(server, zone, 'IXFR', key, authority=[ authority ], port=port, timeout=timeout) as exchange:
+        answers = exchange.answers()
+        message, rr = await answers.__anext__()
+
+        if rr.rrtype != dnswire.RRTYPES['SOA']:
+            raise DnsClientError('Transfer failed: zone does not start with a SOA record')
+
+        newsoa = to_record(message, rr)
+        newserial = zonefile.SoaRecord(newsoa).soaSerial
+        oldserial = zonefile.SoaRecord(soarecord).soaSerial
+
+        # zone is up to date, the response only contains the current SOA
+        if newserial == oldserial:
+            exchange.finish()
+            return (True, [])
+
+        # a server behind the given serial only sends its SOA as well, there are no differences to wait for
+        if not zonefile.serial_newer(newserial, oldserial):
+            raise DnsClientError(f'Transfer failed: serial {newserial} of the server is older than {oldserial}')
+
+        message, rr = await answers.__anext__()
+        record = to_record(message, rr)
+
+        # the server sent the full zone instead of the differences
+        if record.dnsType != 'SOA':
+            records = [ newsoa, record ]
+            async for message, rr in answers:
+                if rr.rrtype == dnswire.RRTYPES['SOA']:
+                    break
+                records.append(to_record(message, rr))
+
+            exchange.finish()
+            return (False, records)
+
+        # sequences of old SOA, deleted records, new SOA, added records
+        deltas = [ ([ record ], []) ]
+        adding = False
+        async for message, rr in answers:
+            record = to_record(message, rr)
+
+            if record.dnsType == 'SOA':
+                if not adding:
+                    adding = True
+                elif zonefile.SoaRecord(record).soaSerial == newserial:
+                    break
+                else:
+                    adding = False
+                    deltas.append(([], []))
+
+            deltas[-1][1 if adding else 0].append(record)
+
+        exchange.finish()
+        return (True, deltas)
+
+
+async def update(server: str, message: bytes, key: dnswire.TsigKey, port: int = DNS_PORT, timeout: float = DNS_TIMEOUT) -> dnswire.Message:
+    """ Sign and send a UPDATE message over TCP, returns the verified response """
+
+    msgid = struct.unpack_from('!H', message, 0)[0]
+    message, mac = dnswire.tsig_sign(message, key)
+    verifier = dnswire.TsigVerifier(key, mac)
+
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(server, port), timeout)
+    try:
+        writer.write(struct.pack('!H', len(message)) + message)
+        await writer.drain()
+        profiling.count('bytes_sent', len(message) + 2)
+        response = dnswire.Message(await _recv_tcp(reader, timeout))
+    finally:
+        writer.close()
+
+    if response.id != msgid or not response.flags & dnswire.FLAG_QR:
+        raise DnsClientError('Received an unexpected message')
+
+    try:
+        verifier.verify(response)
+    except dnswire.TsigError as e:
+        raise KeyRejectedError(str(e))
+
+    return response
@@ -0,0 +1,1016 @@
+import base64
+import hashlib
+import hmac
+import ipaddress
+import struct
+import time
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Tuple
+
+RRTYPES = {
+    'A': 1, 'NS': 2, 'CNAME': 5, 'SOA': 6, 'PTR': 12, 'HINFO': 13, 'MX': 15, 'TXT': 16, 'RP': 17,
+    'AFSDB': 18, 'AAAA': 28, 'LOC': 29, 'SRV': 33, 'NAPTR': 35, 'CERT': 37, 'DNAME': 39, 'OPT': 41,
+    'DS': 43, 'SSHFP': 44, 'RRSIG': 46, 'NSEC': 47, 'DNSKEY': 48, 'DHCID': 49, 'NSEC3': 50,
+    'NSEC3PARAM': 51, 'TLSA': 52, 'SMIMEA': 53, 'CDS': 59, 'CDNSKEY': 60, 'OPENPGPKEY': 61,
+    'CSYNC': 62, 'ZONEMD': 63, 'SVCB': 64, 'HTTPS': 65, 'SPF': 99, 'TKEY': 249, 'TSIG': 250,
+    'IXFR': 251, 'AXFR': 252, 'ANY': 255, 'URI': 256, 'CAA': 257
+}
+RRTYPE_NAMES = { v: k for k, v in RRTYPES.items() }
+RRCLASSES = { 'IN': 1, 'CS': 2, 'CH': 3, 'HS': 4, 'NONE': 254, 'ANY': 255 }
+RRCLASS_NAMES = { v: k for k, v in RRCLASSES.items() }
+RCODES = {
+    0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP', 5: 'REFUSED', 6: 'YXDOMAIN',
+    7: 'YXRRSET', 8: 'NXRRSET', 9: 'NOTAUTH', 10: 'NOTZONE', 16: 'BADSIG', 17: 'BADKEY', 18: 'BADTIME'
+}
+
+OPCODE_QUERY = 0
+OPCODE_UPDATE = 5
+FLAG_QR = 0x8000
+
+# rdata layout per type, used to convert between wire and presentation format
+#   name: domain name, u8/u16/u32: integers, a/aaaa: addresses, str: character string,
+#   strs: character strings up to the end, hex/b64: binary data up to the end,
+#   time: RRSIG timestamp, type: RR type, bitmap: NSEC type bitmap, salt: NSEC3 salt,
+#   b32hex: NSEC3 next hashed owner, tag: CAA property tag, qstr: quoted string up to the end,
+#   certtype: CERT type, loc: LOC location up to the end, svcparams: SVCB parameters up to the end
+RDATA_FIELDS = {
+    'A': [ 'a' ],
+    'NS': [ 'name' ],
+    'CNAME': [ 'name' ],
+    'SOA': [ 'name', 'name', 'u32', 'u32', 'u32', 'u32', 'u32' ],
+    'PTR': [ 'name' ],
+    'HINFO': [ 'str', 'str' ],
+    'MX': [ 'u16', 'name' ],
+    'TXT': [ 'strs' ],
+    'RP': [ 'name', 'name' ],
+    'AFSDB': [ 'u16', 'name' ],
+    'AAAA': [ 'aaaa' ],
+    'SRV': [ 'u16', 'u16', 'u16', 'name' ],
+    'NAPTR': [ 'u16', 'u16', 'str', 'str', 'str', 'name' ],
+    'DNAME': [ 'name' ],
+    'DS': [ 'u16', 'u8', 'u8', 'hex' ],
+    'SSHFP': [ 'u8', 'u8', 'hex' ],
+    'RRSIG': [ 'type', 'u8', 'u8', 'u32', 'time', 'time', 'u16', 'name', 'b64' ],
+    'NSEC': [ 'name', 'bitmap' ],
+    'DNSKEY': [ 'u16', 'u8', 'u8', 'b64' ],
+    'NSEC3': [ 'u8', 'u8', 'u16', 'salt', 'b32hex', 'bitmap' ],
+    'NSEC3PARAM': [ 'u8', 'u8', 'u16', 'salt' ],
+    'TLSA': [ 'u8', 'u8', 'u8', 'hex' ],
+    'SMIMEA': [ 'u8', 'u8', 'u8', 'hex' ],
+    'CDS': [ 'u16', 'u8', 'u8', 'hex' ],
+    'CDNSKEY': [ 'u16', 'u8', 'u8', 'b64' ],
+    'SPF': [ 'strs' ],
+    'URI': [ 'u16', 'u16', 'qstr' ],
+    'CAA': [ 'u8', 'tag', 'qstr' ],
+    'LOC': [ 'loc' ],
+    'CERT': [ 'certtype', 'u16', 'u8', 'b64' ],
+    'DHCID': [ 'b64' ],
+    'OPENPGPKEY': [ 'b64' ],
+    'SVCB': [ 'u16', 'name', 'svcparams' ],
+    'HTTPS': [ 'u16', 'name', 'svcparams' ],
+    'ZONEMD': [ 'u32', 'u8', 'u8', 'hex' ],
+}
+
+CERT_TYPES = { 'PKIX': 1, 'SPKI': 2, 'PGP': 3, 'IPKIX': 4, 'ISPKI': 5, 'IPGP': 6, 'ACPKIX': 7, 'IACPKIX': 8, 'URI': 253, 'OID': 254 }
+CERT_TYPE_NAMES = { v: k for k, v in CERT_TYPES.items() }
+
+SVCPARAM_KEYS = { 'mandatory': 0, 'alpn': 1, 'no-default-alpn': 2, 'port': 3, 'ipv4hint': 4, 'ech': 5, 'ipv6hint': 6, 'dohpath': 7 }
+SVCPARAM_NAMES = { v: k for k, v in SVCPARAM_KEYS.items() }
+
+# LOC size, horizontal and vertical precision when they are omitted: 1m, 10000m and 10m, see RFC1876
+LOC_DEFAULT_SIZES = [ 0x12, 0x16, 0x13 ]
+
+TSIG_ALGORITHMS = {
+    'hmac-md5': ('hmac-md5.sig-alg.reg.int.', hashlib.md5),
+    'hmac-sha1': ('hmac-sha1.', hashlib.sha1),
+    'hmac-sha224': ('hmac-sha224.', hashlib.sha224),
+    'hmac-sha256': ('hmac-sha256.', hashlib.sha256),
+    'hmac-sha384': ('hmac-sha384.', hashlib.sha384),
+    'hmac-sha512': ('hmac-sha512.', hashlib.sha512),
+}
+TSIG_FUDGE = 300
+NAME_SPECIAL_CHARS = b'.;\\()"@$'
+
+
+class DnsWireError(Exception): pass
+class TsigError(DnsWireError): pass
+
+
+class WireRecord(NamedTuple):
+    """ Resource record as found in a message, rdata is referenced by offset """
+
+    name: str
+    rrtype: int
+    rrclass: int
+    ttl: int
+    offset: int
+    length: int
+
+
+class TsigKey:
+    """ HMAC key used to sign messages """
+
+    def __init__(self, name: str, algorithm: str, secret: bytes):
+        if algorithm not in TSIG_ALGORITHMS:
+            raise TsigError(f'{algorithm} is not a supported TSIG algorithm')
+
+        self.name = name if name.endswith('.') else name + '.'
+        self.algorithm = algorithm
+        self.algorithmname = TSIG_ALGORITHMS[algorithm][0]
+        self.digest = TSIG_ALGORITHMS[algorithm][1]
+        self.secret = secret
+
+
+def tsigkey_from_hmac(hmacstr: str) -> TsigKey:
+    """ Create key from a '[algorithm:]keyname:secret' string as used by dig and nsupdate """
+
+    parts = hmacstr.strip().split(':')
+
+    if len(parts) == 2:
+        parts = [ 'hmac-md5' ] + parts
+
+    if len(parts) != 3 or len(parts[1]) < 1:
+        raise TsigError('HMAC key must be in the format [algorithm:]keyname:secret')
+
+    try:
+        secret = base64.b64decode(parts[2], validate=True)
+    except ValueError:
+        raise TsigError('HMAC secret is not valid base64')
+
+    return TsigKey(parts[1], parts[0].lower(), secret)
+
+
+def name_to_wire(name: str, origin: str = None) -> bytes:
+    """ Convert a domain name in presentation format into wire format """
+
+    if name == '@' and origin:
+        name = origin
+
+    labels = []
+    label = bytearray()
+    absolute = False
+    i = 0
+
+    while i < len(name):
+        c = name[i]
+
+        if c == '\\':
+            if name[i+1:i+4].isdigit() and len(name[i+1:i+4]) == 3:
+                label.append(int(name[i+1:i+4]))
+                i += 4
+            else:
+                label.extend(name[i+1].encode('utf-8'))
+                i += 2
+            continue
+
+        if c == '.':
+            if len(label) < 1 and (len(labels) > 0 or i < len(name) - 1):
+                raise DnsWireError(f'{name} contains an empty label')
+
+            if len(label) > 0:
+                labels.append(bytes(label))
+
+            label = bytearray()
+            absolute = i == len(name) - 1
+        else:
+            label.extend(c.encode('utf-8'))
+
+        i += 1
+
+    if len(label) > 0:
+        labels.append(bytes(label))
+
+    wire = bytearray()
+    for label in labels:
+        if len(label) > 63:
+            raise DnsWireError(f'{name} contains a label longer than 63 octets')
+
+        wire.append(len(label))
+        wire.extend(label)
+
+    if not absolute and origin and origin != '.':
+        wire.extend(name_to_wire(origin))
+    else:
+        wire.append(0)
+
+    if len(wire) > 255:
+        raise DnsWireError(f'{name} is longer than 255 octets')
+
+    return bytes(wire)
+
+
+def name_from_wire(buf: bytes, offset: int) -> Tuple[str, int]:
+    """ Read a possibly compressed domain name, returns the name and the offset after it """
+
+    labels = []
+    end = None
+    jumps = 0
+
+    while True:
+        length = buf[offset]
+
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+
+            jumps += 1
+            if jumps > 127:
+                raise DnsWireError('Compression loop in domain name')
+
+            offset = ((length & 0x3F) << 8) | buf[offset+1]
+            continue
+
+        offset += 1
+        if length == 0:
+            break
+
+        labels.append(_escape_label(buf[offset:offset+length]))
+        offset += length
+
+    return ('.'.join(labels) + '.', end if end is not None else offset)
+
+
+def canonical_name_key(name: str) -> str:
+    """ Sort key for the canonical name order of RFC 4034, lowercased labels starting at the root """
+
+    # labels joined by NUL sort like a label by label comparison, but compare much faster than tuples
+    if '\\' not in name and name.isascii():
+        return '\0'.join(name.lower().rstrip('.').split('.')[::-1])
+
+    labels = []
+    wire = name_to_wire(name)
+    offset = 0
+    while wire[offset] > 0:
+        labels.append(wire[offset+1:offset+1+wire[offset]].lower().decode('latin-1'))
+        offset += wire[offset] + 1
+
+    return '\0'.join(labels[::-1])
+
+
+def _escape_label(label: bytes) -> str:
+    """ Convert a label into presentation format """
+
+    result = []
+    for b in label:
+        if b in NAME_SPECIAL_CHARS:
+            result.append('\\' + chr(b))
+        elif 0x21 <= b <= 0x7E:
+            result.append(chr(b))
+        else:
+            result.append(f'\\{b:03d}')
+
+    return ''.join(result)
+
+
+def _quote_string(data: bytes) -> str:
+    """ Convert a character string into a quoted presentation string """
+
+    result = [ '"' ]
+    for b in data:
+        if b == 0x22 or b == 0x5C:
+            result.append('\\' + chr(b))
+        elif 0x20 <= b <= 0x7E:
+            result.append(chr(b))
+        else:
+            result.append(f'\\{b:03d}')
+
+    result.append('"')
+    return ''.join(result)
+
+
+def rrtype_to_text(rrtype: int) -> str:
+    """ Get mnemonic of a RR type """
+
+    return RRTYPE_NAMES.get(rrtype, f'TYPE{rrtype}')
+
+
+def rrclass_to_text(rrclass: int) -> str:
+    """ Get mnemonic of a RR class """
+
+    return RRCLASS_NAMES.get(rrclass, f'CLASS{rrclass}')
+
+
+def rdata_to_text(buf: bytes, rrtype: int, offset: int, length: int) -> str:
+    """ Convert rdata into presentation format """
+
+    fields = RDATA_FIELDS.get(rrtype_to_text(rrtype))
+
+    if fields is not None:
+        try:
+            return _rdata_fields_to_text(buf, fields, offset, offset + length)
+        except (DnsWireError, IndexError, ValueError, struct.error):
+            pass
+
+    # RFC 3597 generic format for unknown or malformed rdata
+    return f'\\# {length} {buf[offset:offset+length].hex().upper()}'.rstrip()
+
+
+def _rdata_fields_to_text(buf: bytes, fields: List[str], offset: int, end: int) -> str:
+    """ Convert rdata field by field """
+
+    result = []
+    for field in fields:
+        if field == 'name':
+            value, offset = name_from_wire(buf, offset)
+        elif field == 'u8':
+            value = str(buf[offset])
+            offset += 1
+        elif field == 'u16' or field == 'type' or field == 'certtype':
+            number = struct.unpack_from('!H', buf, offset)[0]
+            if field == 'type':
+                value = rrtype_to_text(number)
+            elif field == 'certtype':
+                value = CERT_TYPE_NAMES.get(number, str(number))
+            else:
+                value = str(number)
+            offset += 2
+        elif field == 'u32' or field == 'time':
+            number = struct.unpack_from('!I', buf, offset)[0]
+            value = datetime.fromtimestamp(number, timezone.utc).strftime('%Y%m%d%H%M%S') if field == 'time' else str(number)
+            offset += 4
+        elif field == 'a':
+            value = str(ipaddress.IPv4Address(buf[offset:offset+4]))
+            offset += 4
+        elif field == 'aaaa':
+            value = str(ipaddress.IPv6Address(buf[offset:offset+16]))
+            offset += 16
+        elif field == 'str' or field == 'tag':
+            length = buf[offset]
+            data = buf[offset+1:offset+1+length]
+            value = _quote_string(data) if field == 'str' else data.decode('ascii')
+            offset += 1 + length
+        elif field == 'strs':
+            strings = []
+            while offset < end:
+                length = buf[offset]
+                strings.append(_quote_string(buf[offset+1:offset+1+length]))
+                offset += 1 + length
+            value = ' '.join(strings)
+        elif field == 'hex':
+            value = buf[offset:end].hex().upper()
+            offset = end
+        elif field == 'b64':
+            value = base64.b64encode(buf[offset:end]).decode('ascii')
+            offset = end
+        elif field == 'qstr':
+            value = _quote_string(buf[offset:end])
+            offset = end
+        elif field == 'salt':
+            length = buf[offset]
+            value = buf[offset+1:offset+1+length].hex().upper() if length > 0 else '-'
+            offset += 1 + length
+        elif field == 'b32hex':
+            length = buf[offset]
+            value = base64.b32hexencode(buf[offset+1:offset+1+length]).decode('ascii').rstrip('=')
+            offset += 1 + length
+        elif field == 'bitmap':
+            types = []
+            while offset < end:
+                window, length = buf[offset], buf[offset+1]
+                for i, b in enumerate(buf[offset+2:offset+2+length]):
+                    for bit in range(0, 8):
+                        if b & (0x80 >> bit):
+                            types.append(rrtype_to_text(window * 256 + i * 8 + bit))
+                offset += 2 + length
+            value = ' '.join(types)
+        elif field == 'loc':
+            value = _loc_to_text(buf, offset)
+            offset += 16
+        elif field == 'svcparams':
+            value = _svcparams_to_text(buf, offset, end)
+            offset = end
+        else:
+            raise DnsWireError(f'Unknown rdata field {field}')
+
+        if offset > end:
+            raise DnsWireError('Rdata is shorter than expected')
+
+        result.append(value)
+
+    if offset != end:
+        raise DnsWireError('Rdata is longer than expected')
+
+    return ' '.join(filter(lambda x: len(x) > 0, result))
+
+
+def rrtype_from_text(rrtype: str) -> int:
+    """ Get RR type by mnemonic or generic TYPEnnn notation """
+
+    rrtype = rrtype.upper()
+
+    if rrtype in RRTYPES:
+        return RRTYPES[rrtype]
+
+    if rrtype.startswith('TYPE') and rrtype[4:].isdigit():
+        return int(rrtype[4:])
+
+    raise DnsWireError(f'{rrtype} is not a known RR type')
+
+
+def rrclass_from_text(rrclass: str) -> int:
+    """ Get RR class by mnemonic or generic CLASSnnn notation """
+
+    rrclass = rrclass.upper()
+
+    if rrclass in RRCLASSES:
+        return RRCLASSES[rrclass]
+
+    if rrclass.startswith('CLASS') and rrclass[5:].isdigit():
+        return int(rrclass[5:])
+
+    raise DnsWireError(f'{rrclass} is not a known RR class')
+
+
+def _tokenize(text: str) -> List[Tuple[str, bool]]:
+    """ Split rdata into tokens, returns the still escaped token and if it was quoted """
+
+    tokens = []
+    i = 0
+
+    while i < len(text):
+        c = text[i]
+
+        if c.isspace() or c == '(' or c == ')':
+            i += 1
+        elif c == ';':
+            break
+        elif c == '"':
+            start = i = i + 1
+            while i < len(text) and text[i] != '"':
+                i += 2 if text[i] == '\\' else 1
+
+            if i >= len(text):
+                raise DnsWireError(f'Unterminated quoted string in {text}')
+
+            tokens.append((text[start:i], True))
+            i += 1
+        else:
+            start = i
+            while i < len(text) and not text[i].isspace() and text[i] not in '();':
+                i += 2 if text[i] == '\\' else 1
+
+            tokens.append((text[start:i], False))
+
+    return tokens
+
+
+def _unescape(text: str) -> bytes:
+    """ Resolve backslash escapes of a character string """
+
+    result = bytearray()
+    i = 0
+
+    while i < len(text):
+        if text[i] == '\\' and i + 1 < len(text):
+            if text[i+1:i+4].isdigit() and len(text[i+1:i+4]) == 3:
+                result.append(int(text[i+1:i+4]))
+                i += 4
+            else:
+                result.extend(text[i+1].encode('utf-8'))
+                i += 2
+        else:
+            result.extend(text[i].encode('utf-8'))
+            i += 1
+
+    return bytes(result)
+
+
+def _int_from_text(text: str, bits: int) -> int:
+    """ Parse an unsigned integer and check its range """
+
+    if not text.isdigit() or int(text) >= 1 << bits:
+        raise DnsWireError(f'{text} is not a valid {bits} bit number')
+
+    return int(text)
+
+
+def rdata_from_text(rrtype: str, text: str, origin: str = None) -> bytes:
+    """ Convert rdata in presentation format into wire format """
+
+    tokens = _tokenize(text)
+
+    # RFC 3597 generic format
+    if len(tokens) > 0 and tokens[0] == ('\\#', False):
+        if len(tokens) < 2 or not tokens[1][0].isdigit():
+            raise DnsWireError(f'Invalid generic rdata {text}')
+
+        rdata = bytes.fromhex(''.join(map(lambda x: x[0], tokens[2:])))
+        if len(rdata) != int(tokens[1][0]):
+            raise DnsWireError(f'Generic rdata length does not match in {text}')
+
+        return rdata
+
+    fields = RDATA_FIELDS.get(rrtype.upper())
+    if fields is None:
+        raise DnsWireError(f'Unable to encode {rrtype} records, use the generic \\# format')
+
+    try:
+        return _rdata_fields_from_text(fields, tokens, origin)
+    except (IndexError, ValueError) as e:
+        raise DnsWireError(f'Invalid {rrtype} rdata {text}: {e}')
+
+
+def _rdata_fields_from_text(fields: List[str], tokens: List[Tuple[str, bool]], origin: str) -> bytes:
+    """ Convert rdata field by field """
+
+    wire = bytearray()
+    i = 0
+
+    for field in fields:
+        token = tokens[i][0] if i < len(tokens) else None
+        rest = ''.join(map(lambda x: x[0], tokens[i:]))
+
+        if token is None and field not in [ 'strs', 'bitmap', 'svcparams' ]:
+            raise DnsWireError('Rdata has too few fields')
+
+        if field == 'name':
+            wire.extend(name_to_wire(token, origin))
+        elif field == 'u8':
+            wire.append(_int_from_text(token, 8))
+        elif field == 'u16':
+            wire.extend(struct.pack('!H', _int_from_text(token, 16)))
+        elif field == 'u32':
+            wire.extend(struct.pack('!I', _int_from_text(token, 32)))
+        elif field == 'type':
+            wire.extend(struct.pack('!H', rrtype_from_text(token)))
+        elif field == 'certtype':
+            wire.extend(struct.pack('!H', CERT_TYPES[token.upper()] if token.upper() in CERT_TYPES else _int_from_text(token, 16)))
+        elif field == 'time':
+            if len(token) == 14:
+                token = str(int(datetime.strptime(token, '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc).timestamp()))
+            wire.extend(struct.pack('!I', _int_from_text(token, 32)))
+        elif field == 'a':
+            wire.extend(ipaddress.IPv4Address(token).packed)
+        elif field == 'aaaa':
+            wire.extend(ipaddress.IPv6Address(token).packed)
+        elif field == 'str' or field == 'tag':
+            data = _unescape(token)
+            if len(data) > 255:
+                raise DnsWireError('Character string is longer than 255 octets')
+            wire.append(len(data))
+            wire.extend(data)
+        elif field == 'strs':
+            for token, _ in tokens[i:]:
+                data = _unescape(token)
+                # split long strings like a TXT record with multiple strings
+                for start in range(0, max(len(data), 1), 255):
+                    chunk = data[start:start+255]
+                    wire.append(len(chunk))
+                    wire.extend(chunk)
+            i = len(tokens)
+            continue
+        elif field == 'hex':
+            wire.extend(bytes.fromhex(rest))
+            i = len(tokens)
+            continue
+        elif field == 'b64':
+            wire.extend(base64.b64decode(rest, validate=True))
+            i = len(tokens)
+            continue
+        elif field == 'qstr':
+            wire.extend(_unescape(token))
+        elif field == 'salt':
+            data = b'' if token == '-' else bytes.fromhex(token)
+            wire.append(len(data))
+            wire.extend(data)
+        elif field == 'b32hex':
+            data = base64.b32hexdecode(token.upper() + '=' * (-len(token) % 8))
+            wire.append(len(data))
+            wire.extend(data)
+        elif field == 'bitmap':
+            wire.extend(_bitmap_from_types(map(lambda x: rrtype_from_text(x[0]), tokens[i:])))
+            i = len(tokens)
+            continue
+        elif field == 'loc':
+            wire.extend(_loc_from_text([ x[0] for x in tokens[i:] ]))
+            i = len(tokens)
+            continue
+        elif field == 'svcparams':
+            wire.extend(_svcparams_from_text([ x[0] for x in tokens[i:] ]))
+            i = len(tokens)
+            continue
+        else:
+            raise DnsWireError(f'Unknown rdata field {field}')
+
+        i += 1
+
+    if i < len(tokens):
+        raise DnsWireError('Rdata has too many fields')
+
+    return bytes(wire)
+
+
+def _bitmap_from_types(rrtypes) -> bytes:
+    """ Create a NSEC type bitmap """
+
+    windows = {}
+    for rrtype in rrtypes:
+        window = windows.setdefault(rrtype >> 8, bytearray(32))
+        window[(rrtype & 0xFF) >> 3] |= 0x80 >> (rrtype & 0x7)
+
+    wire = bytearray()
+    for number in sorted(windows.keys()):
+        bitmap = windows[number].rstrip(b'\x00')
+        wire.append(number)
+        wire.append(len(bitmap))
+        wire.extend(bitmap)
+
+    return bytes(wire)
+
+
+def _loc_to_text(buf: bytes, offset: int) -> str:
+    """ Convert LOC rdata into degrees, minutes and seconds with altitude and sizes in meters """
+
+    version, size, horizontal, vertical, latitude, longitude, altitude = struct.unpack_from('!BBBBIII', buf, offset)
+    if version != 0:
+        raise DnsWireError(f'LOC version {version} is not supported')
+
+    parts = []
+    for value, hemispheres in [ (latitude, 'NS'), (longitude, 'EW') ]:
+        # thousandths of an arc second, relative to the equator or prime meridian at 2^31
+        value -= 1 << 31
+        hemisphere = hemispheres[0] if value >= 0 else hemispheres[1]
+        value = abs(value)
+        parts.append(f'{value // 3600000} {value // 60000 % 60} {value // 1000 % 60}.{value % 1000:03d} {hemisphere}')
+
+    # centimeters above a base of 100000m below the WGS 84 spheroid
+    altitude -= 10000000
+    parts.append(f'{"-" if altitude < 0 else ""}{abs(altitude) // 100}.{abs(altitude) % 100:02d}m')
+
+    for value in [ size, horizontal, vertical ]:
+        mantissa, exponent = value >> 4, value & 0xF
+        if mantissa > 9 or exponent > 9:
+            raise DnsWireError('Invalid LOC size')
+
+        value = mantissa * 10 ** exponent
+        parts.append(f'{value // 100}.{value % 100:02d}m')
+
+    return ' '.join(parts)
+
+
+def _loc_size_from_text(text: str) -> int:
+    """ Encode a size in meters as mantissa and exponent of centimeters """
+
+    value = round(float(text[:-1] if text.lower().endswith('m') else text) * 100)
+    if value < 0 or value > 9 * 10 ** 9:
+        raise DnsWireError(f'{text} is not a valid LOC size')
+
+    exponent = 0
+    while value >= 10:
+        value //= 10
+        exponent += 1
+
+    return (value << 4) | exponent
+
+
+def _loc_from_text(values: List[str]) -> bytes:
+    """ Convert a location like '52 22 23.000 N 4 53 32.000 E -2.00m 0.00m 10000m 10m' into LOC rdata """
+
+    coordinates = []
+    i = 0
+
+    for hemispheres, limit in [ ('NS', 90), ('EW', 180) ]:
+        # degrees with optional minutes and seconds, followed by the hemisphere
+        parts = []
+        while values[i].upper() not in hemispheres:
+            parts.append(values[i])
+            i += 1
+
+        if not 1 <= len(parts) <= 3:
+            raise DnsWireError(f'Invalid LOC coordinate {" ".join(parts)}')
+
+        degrees = _int_from_text(parts[0], 8)
+        minutes = _int_from_text(parts[1], 8) if len(parts) > 1 else 0
+        seconds = float(parts[2]) if len(parts) > 2 else 0.0
+        value = round(((degrees * 60 + minutes) * 60 + seconds) * 1000)
+
+        if minutes >= 60 or not 0 <= seconds < 60 or value > limit * 3600000:
+            raise DnsWireError(f'Invalid LOC coordinate {" ".join(parts)}')
+
+        coordinates.append((1 << 31) + (value if values[i].upper() == hemispheres[0] else -value))
+        i += 1
+
+    altitude = round(float(values[i][:-1] if values[i].lower().endswith('m') else values[i]) * 100) + 10000000
+    if not 0 <= altitude < 1 << 32:
+        raise DnsWireError(f'{values[i]} is not a valid LOC altitude')
+
+    sizes = [ _loc_size_from_text(x) for x in values[i+1:] ]
+    if len(sizes) > 3:
+        raise DnsWireError('LOC has too many fields')
+
+    sizes += LOC_DEFAULT_SIZES[len(sizes):]
+    return struct.pack('!BBBBIII', 0, *sizes, *coordinates, altitude)
+
+
+def _svcparam_key_to_text(key: int) -> str:
+    """ Get mnemonic of a SvcParamKey """
+
+    return SVCPARAM_NAMES.get(key, f'key{key}')
+
+
+def _svcparam_key_from_text(key: str) -> int:
+    """ Get SvcParamKey by mnemonic or generic keyNNNNN notation """
+
+    key = key.lower()
+    if key in SVCPARAM_KEYS:
+        return SVCPARAM_KEYS[key]
+    elif key.startswith('key') and len(key) > 3:
+        return _int_from_text(key[3:], 16)
+
+    raise DnsWireError(f'Unknown SVCB parameter {key}')
+
+
+def _escape_list_item(data: bytes) -> str:
+    """ Convert an item of a comma separated SVCB value into presentation format """
+
+    result = []
+    for b in data:
+        if b in b',\\"':
+            result.append('\\' + chr(b))
+        elif 0x21 <= b <= 0x7E:
+            result.append(chr(b))
+        else:
+            result.append(f'\\{b:03d}')
+
+    return ''.join(result)
+
+
+def _split_list(value: str) -> List[bytes]:
+    """ Split a comma separated SVCB value, commas inside of items are escaped """
+
+    items = []
+    start = i = 0
+
+    while i <= len(value):
+        if i == len(value) or value[i] == ',':
+            items.append(_unescape(value[start:i]))
+            start = i + 1
+        elif value[i] == '\\':
+            i += 1
+        i += 1
+
+    return items
+
+
+def _svcparams_to_text(buf: bytes, offset: int, end: int) -> str:
+    """ Convert SVCB parameters into key=value pairs """
+
+    result = []
+    while offset < end:
+        key, length = struct.unpack_from('!HH', buf, offset)
+        data = buf[offset+4:offset+4+length]
+        offset += 4 + length
+
+        if len(data) != length or offset > end:
+            raise DnsWireError('SVCB parameter is shorter than expected')
+
+        name = _svcparam_key_to_text(key)
+        if key == 0:
+            value = ','.join([ _svcparam_key_to_text(x[0]) for x in struct.iter_unpack('!H', data) ])
+        elif key == 1:
+            items = []
+            i = 0
+            while i < len(data):
+                items.append(_escape_list_item(data[i+1:i+1+data[i]]))
+                i += 1 + data[i]
+            if i != len(data):
+                raise DnsWireError('Invalid SVCB alpn parameter')
+            value = ','.join(items)
+        elif key == 2:
+            if length != 0:
+                raise DnsWireError('Invalid SVCB no-default-alpn parameter')
+            result.append(name)
+            continue
+        elif key == 3:
+            value = str(struct.unpack('!H', data)[0])
+        elif key == 4 or key == 6:
+            size = 4 if key == 4 else 16
+            if length == 0 or length % size != 0:
+                raise DnsWireError(f'Invalid SVCB {name} parameter')
+            value = ','.join([ str(ipaddress.ip_address(data[i:i+size])) for i in range(0, length, size) ])
+        elif key == 5:
+            value = base64.b64encode(data).decode('ascii')
+        else:
+            value = _quote_string(data)
+
+        result.append(f'{name}={value}')
+
+    return ' '.join(result)
+
+
+def _svcparams_from_text(values: List[str]) -> bytes:
+    """ Convert key=value pairs into SVCB parameters, ordered by key as required by RFC9460 """
+
+    params = {}
+    for param in values:
+        name, _, value = param.partition('=')
+        if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+            value = value[1:-1]
+
+        key = _svcparam_key_from_text(name)
+        if key in params:
+            raise DnsWireError(f'Duplicate SVCB parameter {name}')
+
+        if key == 0:
+            keys = sorted([ _svcparam_key_from_text(x.decode('ascii')) for x in _split_list(value) ])
+            data = b''.join([ struct.pack('!H', x) for x in keys ])
+        elif key == 1:
+            items = _split_list(value)
+            if any(map(lambda x: not 0 < len(x) < 256, items)):
+                raise DnsWireError(f'Invalid SVCB alpn parameter {value}')
+            data = b''.join([ bytes([ len(x) ]) + x for x in items ])
+        elif key == 2:
+            if value:
+                raise DnsWireError('SVCB no-default-alpn parameter has no value')
+            data = b''
+        elif key == 3:
+            data = struct.pack('!H', _int_from_text(value, 16))
+        elif key == 4:
+            data = b''.join([ ipaddress.IPv4Address(x).packed for x in value.split(',') ])
+        elif key == 5:
+            data = base64.b64decode(value, validate=True)
+        elif key == 6:
+            data = b''.join([ ipaddress.IPv6Address(x).packed for x in value.split(',') ])
+        else:
+            data = _unescape(value)
+
+        if len(data) > 65535:
+            raise DnsWireError(f'SVCB parameter {name} is too long')
+
+        params[key] = data
+
+    return b''.join([ struct.pack('!HH', k, len(v)) + v for k, v in sorted(params.items()) ])
+
+
+def rr_to_wire(name: bytes, rrtype: int, rrclass: int, ttl: int, rdata: bytes) -> bytes:
+    """ Create a resource record in wire format """
+
+    return name + struct.pack('!HHIH', rrtype, rrclass, ttl, len(rdata)) + rdata
+
+
+def make_message(msgid: int, opcode: int, questions: List[bytes], answer: List[bytes] = [],
+                 authority: List[bytes] = [], additional: List[bytes] = []) -> bytes:
+    """ Create a message from already encoded questions and records """
+
+    header = struct.pack('!HHHHHH', msgid, (opcode & 0xF) << 11, len(questions), len(answer), len(authority), len(additional))
+    return header + b''.join(questions + answer + authority + additional)
+
+
+def make_question(name: str, rrtype: int, rrclass: int = 1) -> bytes:
+    """ Create the question part of a message """
+
+    return name_to_wire(name) + struct.pack('!HH', rrtype, rrclass)
+
+
+class Message:
+    """ Parsed DNS message, rdata stays in the original buffer """
+
+    def __init__(self, buf: bytes):
+        self.buf = buf
+        self.id, self.flags, qdcount, ancount, nscount, arcount = struct.unpack_from('!HHHHHH', buf, 0)
+        self.rcode = self.flags & 0xF
+        self.questions = []
+        self.answer = []
+        self.authority = []
+        self.additional = []
+        self.tsig = None
+        self.tsigoffset = None
+
+        offset = 12
+        try:
+            for _ in range(0, qdcount):
+                name, offset = name_from_wire(buf, offset)
+                rrtype, rrclass = struct.unpack_from('!HH', buf, offset)
+                self.questions.append((name, rrtype, rrclass))
+                offset += 4
+
+            for section, count in [ (self.answer, ancount), (self.authority, nscount), (self.additional, arcount) ]:
+                for _ in range(0, count):
+                    start = offset
+                    name, offset = name_from_wire(buf, offset)
+                    rrtype, rrclass, ttl, length = struct.unpack_from('!HHIH', buf, offset)
+                    offset += 10
+                    section.append(WireRecord(name, rrtype, rrclass, ttl, offset, length))
+                    offset += length
+
+                    if rrtype == RRTYPES['TSIG']:
+                        self.tsigoffset = start
+        except (IndexError, struct.error):
+            raise DnsWireError('Truncated DNS message')
+
+        if offset > len(buf):
+            raise DnsWireError('Truncated DNS message')
+
+        # TSIG must be the last record of the message
+        if self.tsigoffset is not None:
+            if len(self.additional) < 1 or self.additional[-1].rrtype != RRTYPES['TSIG']:
+                raise DnsWireError('TSIG record is not the last record')
+
+            self.tsig = self.additional[-1]
+
+    def rcode_text(self) -> str:
+        """ Get mnemonic of the response code """
+
+        return RCODES.get(self.rcode, str(self.rcode))
+
+
+def _tsig_variables(key: TsigKey, timesigned: int, fudge: int, error: int = 0, other: bytes = b'') -> bytes:
+    """ TSIG variables which are part of the MAC """
+
+    return name_to_wire(key.name.lower()) + struct.pack('!HI', RRCLASSES['ANY'], 0) \
+        + name_to_wire(key.algorithmname) + _tsig_timers(timesigned, fudge) \
+        + struct.pack('!HH', error, len(other)) + other
+
+
+def _tsig_timers(timesigned: int, fudge: int) -> bytes:
+    """ 48 bit time signed and fudge """
+
+    return struct.pack('!HIH', timesigned >> 32, timesigned & 0xFFFFFFFF, fudge)
+
+
+def tsig_sign(wire: bytes, key: TsigKey, request_mac: bytes = None, now: int = None) -> Tuple[bytes, bytes]:
+    """ Append a TSIG record to a message, returns the signed message and the MAC """
+
+    timesigned = int(now if now is not None else time.time())
+    h = hmac.new(key.secret, digestmod=key.digest)
+
+    if request_mac is not None:
+        h.update(struct.pack('!H', len(request_mac)) + request_mac)
+
+    h.update(wire)
+    h.update(_tsig_variables(key, timesigned, TSIG_FUDGE))
+    mac = h.digest()
+
+    rdata = name_to_wire(key.algorithmname) + _tsig_timers(timesigned, TSIG_FUDGE) \
+        + struct.pack('!H', len(mac)) + mac + wire[0:2] + struct.pack('!HH', 0, 0)
+    arcount = struct.unpack_from('!H', wire, 10)[0]
+    signed = wire[0:10] + struct.pack('!H', arcount + 1) + wire[12:] \
+        + rr_to_wire(name_to_wire(key.name), RRTYPES['TSIG'], RRCLASSES['ANY'], 0, rdata)
+
+    return (signed, mac)
+
+
+class TsigVerifier:
+    """ Verifies the TSIG records of one or more responses to a signed request """
+
+    def __init__(self, key: TsigKey, request_mac: bytes):
+        self.key = key
+        self.priormac = request_mac
+        self.first = True
+        self.hmac = None
+
+    def verify(self, message: Message):
+        """ Verify a response, unsigned messages are allowed between signed ones after the first """
+
+        if self.hmac is None:
+            self.hmac = hmac.new(self.key.secret, digestmod=self.key.digest)
+            self.hmac.update(struct.pack('!H', len(self.priormac)) + self.priormac)
+
+        if message.tsig is None:
+            if self.first:
+                raise TsigError(f'Response is not signed (rcode {message.rcode_text()})')
+
+            self.hmac.update(message.buf)
+            return
+
+        buf = message.buf
+        keyname = message.tsig.name
+        algorithm, offset = name_from_wire(buf, message.tsig.offset)
+        timehigh, timelow, fudge, maclength = struct.unpack_from('!HIHH', buf, offset)
+        offset += 10
+        mac = buf[offset:offset+maclength]
+        offset += maclength
+        originalid, error, otherlength = struct.unpack_from('!HHH', buf, offset)
+        other = buf[offset+6:offset+6+otherlength]
+        timesigned = (timehigh << 32) | timelow
+
+        if error != 0:
+            raise TsigError(f'Server rejected the TSIG key: {RCODES.get(error, str(error))}')
+
+        if keyname.lower() != self.key.name.lower() or algorithm.lower() != self.key.algorithmname:
+            raise TsigError('Response is signed with a different key')
+
+        # message without TSIG, with the original id and the original record count
+        arcount = struct.unpack_from('!H', buf, 10)[0]
+        self.hmac.update(struct.pack('!H', originalid) + buf[2:10] + struct.pack('!H', arcount - 1) + buf[12:message.tsigoffset])
+
+        if self.first:
+            self.hmac.update(_tsig_variables(self.key, timesigned, fudge, error, other))
+        else:
+            self.hmac.update(_tsig_timers(timesigned, fudge))
+
+        if not hmac.compare_digest(self.hmac.digest(), mac):
+            raise TsigError('TSIG signature of the response is invalid')
+
+        if abs(time.time() - timesigned) > fudge:
+            raise TsigError('TSIG time of the response is out of the allowed range')
+
+        self.priormac = mac
+        self.first = False
+        self.hmac = None
+
+    def finish(self):
+        """ Ensure the last verified response was signed """
+
+        if self.hmac is not None:
+            raise TsigError('Last response is not signed')
@@ -1,34 +1,230 @@
-from zoneutils import zonefile
-from typing import List, Iterator
+from zoneutils import zonefile, dnswire
+from typing import Dict, List, Iterator, NamedTuple, Tuple
+
+# bytes of prerequisites and updates per UPDATE message, below the 64k limit of DNS over TCP
+MAX_UPDATE_SIZE = 60000
+
+PREREQ_MODES = ( 'yxrrset', 'nxrrset', 'yxrr' )
+
+
+class Operation(NamedTuple):
+    """ One prerequisite or update, record is the RR or the representative of its RRset
+
+    Prerequisites: yxrrset (RRset exists), nxrrset (RRset does not exist), yxrr (RRset exists with exactly this RR).
+    Updates: del (delete one RR), delrrset (delete the whole RRset), add (add one RR).
+    """
+
+    mode: str
+    record: zonefile.Record
+
+
+class Transaction(NamedTuple):
+    """ Prerequisites and updates which are sent as one UPDATE message """
+
+    prereqs: List[Operation]
+    updates: List[Operation]
+
+
+def _rrset_key(record: zonefile.Record) -> Tuple[str, str, str]:
+    """ Identity of the RRset of a record """
+
+    return (record.dnsName.lower(), record.dnsClass, record.dnsType)
+
 
 class NsUpdate:
     """ Generate nsupdate batch files """
 
-    def __init__(self, add: List[zonefile.Record] = [], delete: List[zonefile.Record] = []):
+    def __init__(self, add: List[zonefile.Record] = [], delete: List[zonefile.Record] = [], keep: List[zonefile.Record] = None):
         self.add = add
         self.delete = delete
 
-    def get_nsupdate_batch(self, nameserver: str, zone: str) -> Iterator[str]:
-        """ Create a nsupdate batch file """
+        # unchanged records, without them the content of an RRset is unknown and only single RRs are changed
+        self.keep = keep
 
-        # SOA records must not be deleted
-        itemsdelete = filter(lambda x: x.dnsType != 'SOA', self.delete)
+    def get_rrset_operations(self) -> List[Tuple[List[Operation], List[Operation]]]:
+        """ Prerequisites and updates per changed RRset, with the cheaper of RRset or per-RR updates """
 
+        # a record which is deleted and added again is no change
+        pending = {}
+        for record in self.add:
+            pending[record.as_tuple()] = pending.get(record.as_tuple(), 0) + 1
+
+        deleted = []
+        for record in self.delete:
+            if pending.get(record.as_tuple(), 0) > 0:
+                pending[record.as_tuple()] -= 1
+            else:
+                deleted.append(record)
+
+        added = []
+        for record in self.add:
+            if pending.get(record.as_tuple(), 0) > 0:
+                pending[record.as_tuple()] -= 1
+                added.append(record)
+
+        # group by RRset: deleted, added and unchanged records
+        rrsets: Dict[Tuple[str, str, str], Tuple[list, list, list]] = {}
+        for index, records in enumerate([ deleted, added ]):
+            for record in records:
+                rrsets.setdefault(_rrset_key(record), ([], [], []))[index].append(record)
+
+        for record in self.keep or []:
+            if _rrset_key(record) in rrsets:
+                rrsets[_rrset_key(record)][2].append(record)
+
+        groups = []
+        for key, (rrdeleted, rradded, rrkept) in rrsets.items():
+            # SOA records must not be deleted, the new one replaces the old one
+            if key[2] == 'SOA':
+                if len(rradded) > 0:
+                    groups.append(([], [ Operation('add', x) for x in rradded ]))
+                continue
+
+            if self.keep is None:
+                groups.append(([], [ Operation('del', x) for x in rrdeleted ] + [ Operation('add', x) for x in rradded ]))
+                continue
+
+            existed = len(rrdeleted) + len(rrkept) > 0
+            prereqs = [ Operation('yxrrset' if existed else 'nxrrset', (rrdeleted + rradded)[0]) ]
+
+            # deleting the RRset and adding the remaining records might need less operations
+            remaining = rrkept + rradded
+            if len(rrdeleted) > 0 and 1 + len(remaining) < len(rrdeleted) + len(rradded):
+                updates = [ Operation('delrrset', rrdeleted[0]) ] + [ Operation('add', x) for x in remaining ]
+            else:
+                updates = [ Operation('del', x) for x in rrdeleted ] + [ Operation('add', x) for x in rradded ]
+
+            groups.append((prereqs, updates))
+
+        # RRsets with deletes before the ones with only adds, so a name is cleared before a CNAME is added,
         # SOA records always as the last operation
-        itemsadd = sorted(self.add, key=lambda x: 1 if x.dnsType == 'SOA' else 0)
+        return sorted(groups, key=lambda x: 2 if x[1][0].record.dnsType == 'SOA' else (0 if x[1][0].mode != 'add' else 1))
+
+    def get_transactions(self, zone: str, max_size: int = MAX_UPDATE_SIZE) -> List[Transaction]:
+        """ Split the changes into UPDATE transactions of limited size, in the order they have to be sent """
+
+        return [ Transaction([ x[0] for x in prereqs ], [ x[0] for x in updates ]) for prereqs, updates in self._plan(zone, max_size) ]
+
+    def _plan(self, zone: str, max_size: int) -> List[Tuple[List[Tuple[Operation, bytes]], List[Tuple[Operation, bytes]]]]:
+        """ Transactions with the operations in wire format, their size is the size in the UPDATE message """
+
+        encode = _operation_wire
+
+        zone = zone if zone.endswith('.') else zone + '.'
+        transactions = []
+        prereqs = []
+        updates = []
+        size = 0
+
+        # the first transaction only applies when the zone is still in the state the changes are based on
+        soa = next(filter(lambda x: x.dnsType == 'SOA', self.delete + (self.keep or [])), None)
+        if soa is not None:
+            wire = encode(Operation('yxrr', soa), zone)
+            prereqs.append((Operation('yxrr', soa), wire))
+            size += len(wire)
+
+        for groupprereqs, groupupdates in self.get_rrset_operations():
+            groupprereqs = [ (x, encode(x, zone)) for x in groupprereqs ]
+            groupupdates = [ (x, encode(x, zone)) for x in groupupdates ]
+            groupsize = sum(map(lambda x: len(x[1]), groupprereqs + groupupdates))
+
+            # an RRset stays in one transaction, unless it is too big on its own
+            if size + groupsize > max_size and len(updates) > 0:
+                transactions.append((prereqs, updates))
+                prereqs = []
+                updates = []
+                size = 0
+
+            prereqs.extend(groupprereqs)
+            size += sum(map(lambda x: len(x[1]), groupprereqs))
+
+            for update in groupupdates:
+                if size + len(update[1]) > max_size and len(updates) > 0:
+                    transactions.append((prereqs, updates))
+                    prereqs = []
+                    updates = []
+                    size = 0
+
+                updates.append(update)
+                size += len(update[1])
+
+        if len(updates) > 0:
+            transactions.append((prereqs, updates))
+
+        # deletes before adds in each transaction
+        return [ (p, sorted(u, key=lambda x: 1 if x[0].mode == 'add' else 0)) for p, u in transactions ]
+
+    def get_nsupdate_batch(self, nameserver: str, zone: str) -> Iterator[str]:
+        """ Create a nsupdate batch file """
 
         yield '; nsupdate batch file'
         yield ''
         yield f'server {nameserver}'
         yield f'zone {zone}'
 
-        for mode, block in [ ('del', itemsdelete), ('add', itemsadd) ]:
-            for change in block:
-                yield f'update {mode} {str(change)}'
+        # the same transactions as the UPDATE messages, so both are split at the same operations
+        for transaction in self.get_transactions(zone):
+            yield ''
+
+            for operation in transaction.prereqs + transaction.updates:
+                yield _operation_text(operation)
+
+            yield 'send'
 
         yield ''
         yield '; EOF'
 
+    def get_update_messages(self, zone: str, msgid: int) -> List[bytes]:
+        """ Create the RFC2136 UPDATE messages of all transactions, not signed yet """
+
+        zone = zone if zone.endswith('.') else zone + '.'
+        zonesection = dnswire.make_question(zone, dnswire.RRTYPES['SOA'])
+        messages = []
+
+        for prereqs, updates in self._plan(zone, MAX_UPDATE_SIZE):
+            messages.append(dnswire.make_message((msgid + len(messages)) % 65536, dnswire.OPCODE_UPDATE, [ zonesection ],
+                answer=[ x[1] for x in prereqs ], authority=[ x[1] for x in updates ]))
+
+        return messages
+
+
+def _operation_text(operation: Operation) -> str:
+    """ Operation as nsupdate command """
+
+    record = operation.record
+
+    if operation.mode in [ 'yxrrset', 'nxrrset' ]:
+        return f'prereq {operation.mode} {record.dnsName} {record.dnsClass} {record.dnsType}'
+    elif operation.mode == 'yxrr':
+        prio = ' '+str(record.dnsPrio) if record.dnsPrio is not None else ''
+        return f'prereq yxrrset {record.dnsName} {record.dnsClass} {record.dnsType}{prio} {record.dnsContent}'
+    elif operation.mode == 'delrrset':
+        return f'update del {record.dnsName} {record.dnsClass} {record.dnsType}'
+
+    return f'update {operation.mode} {str(record)}'
+
+
+def _operation_wire(operation: Operation, zone: str) -> bytes:
+    """ Operation as RR of an UPDATE message, see RFC2136 section 2.4 and 2.5 """
+
+    record = operation.record
+    rrclass = dnswire.rrclass_from_text(record.dnsClass)
+    ttl = 0
+    rdata = b''
+
+    if operation.mode in [ 'add', 'del', 'yxrr' ]:
+        rdatastr = record.dnsContent if record.dnsPrio is None else f'{record.dnsPrio} {record.dnsContent}'
+        rdata = dnswire.rdata_from_text(record.dnsType, rdatastr, zone)
+
+    if operation.mode == 'add':
+        ttl = record.dnsTtl
+    elif operation.mode in [ 'del', 'nxrrset' ]:
+        rrclass = dnswire.RRCLASSES['NONE']
+    elif operation.mode in [ 'delrrset', 'yxrrset' ]:
+        rrclass = dnswire.RRCLASSES['ANY']
+
+    return dnswire.rr_to_wire(dnswire.name_to_wire(record.dnsName, zone), dnswire.rrtype_from_text(record.dnsType), rrclass, ttl, rdata)
+
 
 def from_diff(diff: str, addchar: str = '> ', delchar: str = '< ') -> NsUpdate:
     """ Create changeset from a zone file diff """
@@ -0,0 +1,105 @@
+import contextlib
+import json
+import threading
+import time
+from typing import Callable, Iterator, List
+
+# hooks are called as hook(kind, name, value), kind is 'stage' (value in seconds) or 'counter'
+_hooks: List[Callable[[str, str, float], None]] = []
+_lock = threading.Lock()
+
+# name -> [ calls, seconds ] and name -> value, in order of first use
+_stages = {}
+_counters = {}
+
+
+def add_hook(hook: Callable[[str, str, float], None]):
+    """ Call a function for every finished stage and counter change, e.g. to feed monitoring """
+
+    with _lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: Callable[[str, str, float], None]):
+    """ Stop calling a hook """
+
+    with _lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def _notify(kind: str, name: str, value: float):
+    """ Pass an event to the hooks, outside of the lock """
+
+    for hook in list(_hooks):
+        hook(kind, name, value)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """ Measure the wall time of a pipeline stage, stages of parallel zones add up """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+
+        with _lock:
+            entry = _stages.setdefault(name, [ 0, 0.0 ])
+            entry[0] += 1
+            entry[1] += seconds
+
+        if _hooks:
+            _notify('stage', name, seconds)
+
+
+def count(name: str, value: float = 1):
+    """ Increase a counter """
+
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+    if _hooks:
+        _notify('counter', name, value)
+
+
+def reset():
+    """ Forget all measurements """
+
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def snapshot() -> dict:
+    """ All measurements as JSON compatible dict """
+
+    with _lock:
+        return {
+            'stages': { k: { 'calls': v[0], 'seconds': v[1] } for k, v in _stages.items() },
+            'counters': dict(_counters),
+        }
+
+
+def report() -> Iterator[str]:
+    """ All measurements as table """
+
+    data = snapshot()
+
+    yield f'{"stage":<20} {"calls":>8} {"seconds":>10}'
+    for name, entry in data['stages'].items():
+        yield f'{name:<20} {entry["calls"]:>8} {entry["seconds"]:>10.3f}'
+
+    yield ''
+    yield f'{"counter":<20} {"value":>19}'
+    for name, value in data['counters'].items():
+        yield f'{name:<20} {value:>19}'
+
+
+def save_json(file: str):
+    """ Write all measurements as JSON file """
+
+    with open(file, 'w') as f:
+        json.dump(snapshot(), f, indent=2)
+        f.write('\n')
@@ -1,100 +1,66 @@
+import asyncio
 import subprocess
-from typing import Tuple
-from enum import Enum
+from typing import Iterable, Tuple, Union
 import re
-from zoneutils import zonefile
+from zoneutils import zonefile, aioutils
+from zoneutils.nsupdate import NsUpdate
 
-TSIG_EXISTS_RGX = re.compile(r"^\s*[^\s]+\s+[^\s]+\s+ANY\s+TSIG\s+[^\s]+\s+[^\s]+\s+[^\s]+\s+[^\s]+\s+[^\s]+\s+[^\s]+\s+NOERROR\s+[^\s]+\s*$", re.M)
-TRANSFER_FAILED_RGX = re.compile(r"^\s*;\s+Transfer\s+failed.\s*$", re.M)
 ILLEGAL_PATH_CHARS_RGX = r"[/<>:\"\\|?*]"
 
-class ZonetransferResult(Enum):
-    OK = 0,
-    KEYINVALID = 1,
-    FAILED = 2
+# the blocking API is a thin wrapper around zoneutils.aioutils
+ZonetransferResult = aioutils.ZonetransferResult
+TSIG_EXISTS_RGX = aioutils.TSIG_EXISTS_RGX
+TRANSFER_FAILED_RGX = aioutils.TRANSFER_FAILED_RGX
 
 def create_process(cmd: str) -> subprocess.CompletedProcess:
     """ Execute a command """
 
-    return subprocess.run(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT
-    )
+    return asyncio.run(aioutils.create_process(cmd))
 
 def dig_get_authoritative_server(zone: str) -> str:
     """ Get domains authoritative name server by SOA record """
 
-    cmd = [ 'dig', '-t', 'SOA', zone ]
-    proc = create_process(cmd)
-    diglines = proc.stdout.decode('UTF-8-sig')
-
-    if proc.returncode == 0:
-        # find SOA record and return primary DNS server
-        records = zonefile.ZoneFile(diglines)
-        rawsoa = list(filter(lambda x: x.dnsType == 'SOA', records.records))
-
-        if len(rawsoa) > 0:
-            soa = zonefile.SoaRecord(rawsoa[0])
-            return soa.soaPrimaryDns
-
-    return None
+    return asyncio.run(aioutils.dig_get_authoritative_server(zone))
 
 def dig_zonetransfer(ns: str, hmac: str, zone: str) -> Tuple[bool, str, ZonetransferResult]:
     """ Perform zone transfer to get the full list of all records in the zone """
 
-    cmd = [ 'dig', '@'+ns, '-y', hmac, '-t', 'AXFR', zone ]
-    proc = create_process(cmd)
-    diglines = proc.stdout.decode('UTF-8-sig')
-
-    # check for errors
-    result = ZonetransferResult.OK
-
-    if not TSIG_EXISTS_RGX.search(diglines):
-        result = ZonetransferResult.KEYINVALID
+    return asyncio.run(aioutils.dig_zonetransfer(ns, hmac, zone))
 
-    elif TRANSFER_FAILED_RGX.search(diglines):
-        result = ZonetransferResult.FAILED
+def zonetransfer(ns: str, hmac: str, zone: str, ignore_rrtypes: Iterable[str] = ()) -> Tuple[bool, Union[zonefile.ZoneFile, str], ZonetransferResult]:
+    """ Perform zone transfer in-process, returns the zone or an error message """
 
-    return (proc.returncode == 0 and result == ZonetransferResult.OK, diglines, result)
+    return asyncio.run(aioutils.zonetransfer(ns, hmac, zone, ignore_rrtypes=ignore_rrtypes))
 
 def diff(file1: str, file2: str) -> Tuple[bool, str]:
     """ Diff two text files """
 
-    cmd = [ 'diff', '--ignore-space-change', '--suppress-common-lines', '-Nau', file1, file2 ]
-    proc = create_process(cmd)
-
-    return (proc.returncode == 1, proc.stdout.decode('UTF-8-sig'))
+    return asyncio.run(aioutils.diff(file1, file2))
 
 def diff_minimal(file1: str, file2: str) -> Tuple[bool, str]:
     """ Diff two text files and shows just the changed lines """
 
-    cmd = [ 'diff', '--ignore-space-change', '--suppress-common-lines', file1, file2 ]
-    proc = create_process(cmd)
-
-    return (proc.returncode == 1, proc.stdout.decode('UTF-8-sig'))
+    return asyncio.run(aioutils.diff_minimal(file1, file2))
 
 def colorize_diff(diffstr: str) -> Tuple[bool, str]:
     """ Colorize a diff """
 
-    proc = subprocess.run(['colordiff'], stdout=subprocess.PIPE, input=diffstr, encoding='UTF-8-sig')
-    return (proc.returncode == 0, proc.stdout)
+    return asyncio.run(aioutils.colorize_diff(diffstr))
 
 def checkzone(zone: str, file: str) -> Tuple[bool, str]:
     """ Check syntax of a zone file """
 
-    cmd = [ 'named-checkzone', '-i', 'local', zone, file ]
-    proc = create_process(cmd)
-
-    return (proc.returncode == 0, proc.stdout.decode('UTF-8-sig'))
+    return asyncio.run(aioutils.checkzone(zone, file))
 
 def nsupdate(hmac: str, filename: str) -> Tuple[bool, str]:
     """ Perform the nsupdate with a batch file """
 
-    cmd = [ 'nsupdate', '-y', hmac, filename ]
-    proc = create_process(cmd)
+    return asyncio.run(aioutils.nsupdate(hmac, filename))
+
+def send_update(ns: str, hmac: str, zone: str, changeset: NsUpdate) -> Tuple[bool, str]:
+    """ Send a changeset as signed RFC2136 UPDATE to the nameserver, returns the rcode """
 
-    return ( proc.returncode == 0, proc.stdout.decode('UTF-8-sig'))
+    return asyncio.run(aioutils.send_update(ns, hmac, zone, changeset))
 
 def sanitize_for_filesystem(instr: str) -> str:
     """ Clean string from invalid path characters """
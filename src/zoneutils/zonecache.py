@@ -0,0 +1,317 @@
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple, Union
+from zoneutils import zonefile, zonesnapshot, utils, aioutils, dnswire, dnsclient, profiling
+
+
+SERVER_CACHE_FILE = 'servers.json'
+
+# zone -> [ primary server, expiry timestamp ], shared by all threads of the process
+_servers = None
+_servers_lock = threading.Lock()
+
+
+def cache_dir() -> str:
+    """ Directory for locally cached data """
+
+    base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'nsupdate-interactive')
+
+
+def zone_path(server: str, zone: str) -> str:
+    """ Cache file of a zone transferred from a server """
+
+    name = utils.sanitize_for_filesystem(server) + '_' + utils.sanitize_for_filesystem(zone.rstrip('.'))
+    return os.path.join(cache_dir(), name + '.zone.snap')
+
+
+def load(server: str, zone: str, ignore_rrtypes: Iterable[str] = (), hashtree: bool = False) -> zonefile.ZoneFile:
+    """ Load a cached zone, None if not cached. The cache always holds all records,
+        ignored RR types are only left out of the returned zone. A stored hash tree is loaded on request """
+
+    try:
+        with profiling.stage('cache_load'):
+            records = zonesnapshot.load(zone_path(server, zone), ignore_rrtypes, hashtree)
+    except (OSError, zonesnapshot.SnapshotFormatError):
+        return None
+
+    if len(records.records) < 1 or records.records[0].dnsType != 'SOA':
+        return None
+
+    records.nameserver = server
+    records.zone = zone
+    return records
+
+
+def save(server: str, zone: str, records: zonefile.ZoneFile, hashtree: bool = False):
+    """ Write a zone into the cache, replaces the previous version atomically.
+        The hash tree is stored with the records on request, it is built if necessary """
+
+    tree = records.get_hash_tree() if hashtree else None
+
+    with profiling.stage('cache_save'):
+        _write_atomic(zone_path(server, zone), zonesnapshot.dumps(records, tree))
+
+
+def _write_atomic(path: str, data: bytes):
+    """ Write a file, replaces the previous version atomically """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+
+        os.replace(temp, path)
+    except Exception:
+        os.remove(temp)
+        raise
+
+
+def invalidate(server: str, zone: str):
+    """ Remove a zone from the cache """
+
+    try:
+        os.remove(zone_path(server, zone))
+    except FileNotFoundError:
+        pass
+
+
+def _servers_path() -> str:
+    """ Cache file of the discovered authoritative servers """
+
+    return os.path.join(cache_dir(), SERVER_CACHE_FILE)
+
+
+def _read_servers() -> dict:
+    """ Read the discovered servers from disk, empty on a missing or broken file """
+
+    try:
+        with open(_servers_path(), 'r') as f:
+            servers = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    return servers if isinstance(servers, dict) else {}
+
+
+def _store_server(zone: str, entry: list):
+    """ Update one zone in memory and on disk, entries of other processes are kept """
+
+    global _servers
+
+    with _servers_lock:
+        servers = _read_servers()
+
+        if entry is None:
+            servers.pop(zone, None)
+        else:
+            servers[zone] = entry
+
+        _servers = servers
+
+        try:
+            _write_atomic(_servers_path(), json.dumps(servers, indent=1, sort_keys=True).encode('utf-8'))
+        except OSError:
+            pass
+
+
+def _server_key(zone: str) -> str:
+    """ Zone names are case insensitive and may be written with or without trailing dot """
+
+    return zone.rstrip('.').lower()
+
+
+async def authoritative_server_async(zone: str, use_cache: bool = True) -> str:
+    """ Primary server of a zone by SOA record, cached as long as the SOA TTL allows """
+
+    global _servers
+
+    key = _server_key(zone)
+
+    if use_cache:
+        with _servers_lock:
+            if _servers is None:
+                _servers = _read_servers()
+
+            entry = _servers.get(key)
+
+        if isinstance(entry, list) and len(entry) == 2 and entry[1] > time.time():
+            profiling.count('server_cache_hits')
+            return entry[0]
+
+    with profiling.stage('discovery'):
+        soa = await aioutils.dig_get_soa(zone)
+
+    if soa is None:
+        return None
+
+    # a fresh answer is stored even if the cache was bypassed
+    server = zonefile.SoaRecord(soa).soaPrimaryDns
+    _store_server(key, [ server, time.time() + soa.dnsTtl ])
+
+    return server
+
+
+def authoritative_server(zone: str, use_cache: bool = True) -> str:
+    """ Primary server of a zone by SOA record, cached, blocking """
+
+    return asyncio.run(authoritative_server_async(zone, use_cache))
+
+
+def invalidate_server(zone: str):
+    """ Forget the discovered server of a zone, e.g. when it refused the transfer """
+
+    _store_server(_server_key(zone), None)
+
+
+def _record_key(record: zonefile.Record) -> tuple:
+    """ Identity of a RR in a transfer, the TTL is not part of it """
+
+    return (record.dnsName.lower(), record.dnsClass, record.dnsType, record.dnsPrio, record.dnsContent)
+
+
+def _rrset_key(record: zonefile.Record) -> tuple:
+    """ Identity of the RRset of a record """
+
+    return (record.dnsName.lower(), record.dnsClass, record.dnsType)
+
+
+def apply_ixfr(records: zonefile.ZoneFile, deltas: List[Tuple[List[zonefile.Record], List[zonefile.Record]]]):
+    """ Apply the (deleted, added) steps of a incremental transfer to a zone. The steps are applied to the
+        changed RRsets only, the zone is walked once. A hash tree of the zone is updated for the changed names """
+
+    changed = { _rrset_key(x) for d, a in deltas for x in itertools.chain(d, a) }
+
+    # records of the unchanged RRsets and where the changed ones have been
+    rrsets: Dict[tuple, List[zonefile.Record]] = {}
+    kept = []
+    positions = []
+    for record in records.records:
+        key = (record.dnsName.lower(), record.dnsClass, record.dnsType)
+
+        if key not in changed:
+            kept.append(record)
+        elif key in rrsets:
+            rrsets[key].append(record)
+        else:
+            rrsets[key] = [ record ]
+            positions.append((len(kept), key))
+
+    for deleted, added in deltas:
+        remove = Counter(map(_record_key, deleted))
+
+        for key in { _rrset_key(x) for x in deleted } & rrsets.keys():
+            rrset = []
+            for record in rrsets[key]:
+                recordkey = _record_key(record)
+                if remove[recordkey] > 0:
+                    remove[recordkey] -= 1
+                else:
+                    rrset.append(record)
+
+            rrsets[key] = rrset
+
+        for record in added:
+            key = _rrset_key(record)
+            if key not in rrsets:
+                positions.append((len(kept), key))
+
+            rrsets.setdefault(key, []).append(record)
+
+    # the changed RRsets take the place of the old ones, new RRsets come last, the current SOA stays the first record
+    result = []
+    start = 0
+    for position, key in positions:
+        result.extend(kept[start:position])
+        result.extend(rrsets[key][-1:] if key[2] == 'SOA' else rrsets[key])
+        start = position
+
+    result.extend(kept[start:])
+    records.replace_records(result, [ x[0] for x in changed ])
+
+
+async def zonetransfer_async(ns: str, hmac: str, zone: str, ignore_rrtypes: Iterable[str] = (),
+                             hashtree: bool = False) -> Tuple[bool, Union[zonefile.ZoneFile, str], aioutils.ZonetransferResult]:
+    """ Zone transfer backed by the local cache, refreshed by IXFR and full AXFR as fallback.
+        With hashtree the hash tree of the zone is cached as well and updated by the incremental changes """
+
+    # the stored hash tree covers all records, ignored RR types are left out of the copy which is returned
+    cached = load(ns, zone, () if hashtree else ignore_rrtypes, hashtree)
+
+    if cached is not None:
+        try:
+            key = dnswire.tsigkey_from_hmac(hmac)
+            cachedsoa = cached.records[0]
+
+            # nothing to transfer when the serial didn't change
+            with profiling.stage('soa_check'):
+                currentsoa = await dnsclient.soa(ns, zone, key)
+
+            currentserial = zonefile.SoaRecord(currentsoa).soaSerial
+            if currentserial == zonefile.SoaRecord(cachedsoa).soaSerial:
+                profiling.count('zone_cache_hits')
+
+                if not hashtree:
+                    return (True, cached, aioutils.ZonetransferResult.OK)
+
+                # the tree is hashed once and stored for the next runs
+                if not cached.has_hash_tree():
+                    save(ns, zone, cached, True)
+
+                return (True, cached.exclude_rrtypes(ignore_rrtypes), aioutils.ZonetransferResult.OK)
+
+            # the cached zone is ahead of the server, e.g. after the zone was restored from a backup,
+            # there are no incremental changes from it
+            if not zonefile.serial_newer(currentserial, zonefile.SoaRecord(cachedsoa).soaSerial):
+                raise dnsclient.DnsClientError('Cached zone is newer than the zone on the server')
+
+            # the incremental changes apply to all records of the zone
+            if cached.ignored:
+                cached = load(ns, zone)
+                if cached is None:
+                    raise OSError('Cached zone disappeared')
+
+            with profiling.stage('ixfr'):
+                incremental, result = await dnsclient.ixfr(ns, zone, cachedsoa, key)
+
+                if incremental:
+                    apply_ixfr(cached, result)
+                    profiling.count('records_transferred', sum(len(d) + len(a) for d, a in result))
+                else:
+                    cached.records = result
+                    profiling.count('records_transferred', len(result))
+
+            save(ns, zone, cached, hashtree)
+            return (True, cached.exclude_rrtypes(ignore_rrtypes), aioutils.ZonetransferResult.OK)
+        except dnsclient.KeyRejectedError as e:
+            return (False, str(e), aioutils.ZonetransferResult.KEYINVALID)
+        except (asyncio.TimeoutError, dnsclient.DnsClientError, dnswire.DnsWireError, zonefile.ZoneRecordSyntaxError, zonefile.InvalidZoneTypeError, OSError):
+            # server refused IXFR or the serial is too old or too new, fall back to a full transfer
+            pass
+
+    transfer = await aioutils.zonetransfer(ns, hmac, zone)
+
+    if transfer[0]:
+        try:
+            save(ns, zone, transfer[1], hashtree)
+        except OSError:
+            invalidate(ns, zone)
+
+        return (True, transfer[1].exclude_rrtypes(ignore_rrtypes), transfer[2])
+
+    return transfer
+
+
+def zonetransfer(ns: str, hmac: str, zone: str, ignore_rrtypes: Iterable[str] = (),
+                 hashtree: bool = False) -> Tuple[bool, Union[zonefile.ZoneFile, str], aioutils.ZonetransferResult]:
+    """ Zone transfer backed by the local cache, blocking """
+
+    return asyncio.run(zonetransfer_async(ns, hmac, zone, ignore_rrtypes, hashtree))
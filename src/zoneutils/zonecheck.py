@@ -0,0 +1,238 @@
+import os
+import tempfile
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+from zoneutils import zonefile, zonescope, dnswire, utils, profiling
+
+MAX_TTL = 2**31 - 1
+CNAME_COMPANION_RRTYPES = ( 'CNAME', 'RRSIG', 'NSEC' )
+TARGET_RRTYPES = ( 'MX', 'SRV' )
+
+
+class ZoneProblem(NamedTuple):
+    """ One finding of the zone check, line 0 is used for zone wide problems """
+    line: int
+    message: str
+
+
+def _check_unparsable(line: str) -> str:
+    """ Explain why a line is not a record, None when the parser ignores it on purpose """
+
+    parts = line.split()
+
+    if parts[0].startswith('$'):
+        return f'Directive {parts[0]} is not supported, use fully qualified names and explicit TTLs'
+
+    if len(parts) < 5:
+        return 'Incomplete record, expected name, ttl, class, type and data'
+
+    if parts[3].startswith('TSIG'):
+        return None
+
+    if not parts[0].endswith('.'):
+        return f'Name {parts[0]} is not fully qualified'
+
+    if not parts[1].isascii() or not parts[1].isdigit():
+        return f'{parts[1]} is not a valid ttl'
+
+    return 'Unable to parse record'
+
+
+class ZoneChecker:
+    """ In-process syntax and consistency check of a zone file """
+
+    def __init__(self, zone: str, known: Iterable[zonefile.Record] = [], scope: zonescope.ZoneScope = None,
+                 context: zonefile.ZoneFile = None):
+        self.zone = zone.rstrip('.').lower() + '.'
+
+        # records which passed the per-record checks before, e.g. transferred from the server
+        self.valid = set(map(lambda x: x.as_tuple(), known))
+
+        # when only a part of the zone is edited, records outside of the scope come from the full zone
+        self.scope = scope
+        self.context = context
+
+    def check_file(self, file: str) -> List[ZoneProblem]:
+        """ Check a zone file """
+
+        with open(file, 'r') as f:
+            return self.check_lines(f)
+
+    def check_lines(self, lines: Iterable[str]) -> List[ZoneProblem]:
+        """ Check the lines of a zone file, only records not seen before get the expensive checks """
+
+        problems = []
+        records = []
+
+        for lineno, line in enumerate(lines, 1):
+            stripped = line.strip()
+
+            if not stripped or stripped[0] == ';':
+                continue
+
+            try:
+                record = zonefile.from_string(stripped)
+            except zonefile.ZoneRecordSyntaxError as e:
+                problems.append(ZoneProblem(lineno, str(e)))
+                continue
+
+            if record is None:
+                message = _check_unparsable(stripped)
+                if message:
+                    problems.append(ZoneProblem(lineno, message))
+                continue
+
+            records.append((lineno, record))
+
+        # rdata, names and ttls of new and changed records
+        changed = []
+        for lineno, record in records:
+            key = record.as_tuple()
+            if key in self.valid:
+                continue
+
+            messages = self._check_record(record)
+
+            if self.scope is not None and not self.scope.matches(record):
+                messages.append(f'{record.dnsName} {record.dnsType} is outside of the edited part of the zone ({self.scope.describe()})')
+            problems.extend(map(lambda x: ZoneProblem(lineno, x), messages))
+            changed.append((lineno, record))
+
+            if len(messages) < 1:
+                self.valid.add(key)
+
+        problems.extend(self._check_soa(records))
+        problems.extend(self._check_names(records, changed))
+
+        return sorted(problems)
+
+    def check(self, file: str, strict: bool = False) -> Tuple[bool, str]:
+        """ Check a zone file, strict mode runs named-checkzone as well """
+
+        with profiling.stage('check'):
+            problems = self.check_file(file)
+
+        if len(problems) < 1 and strict:
+            if self.scope is not None and self.context is not None:
+                return self._checkzone_merged(file)
+
+            return utils.checkzone(self.zone.rstrip('.'), file)
+
+        return (len(problems) < 1, '\n'.join(format_problems(file, problems)))
+
+    def _checkzone_merged(self, file: str) -> Tuple[bool, str]:
+        """ Run named-checkzone on the edited part together with the rest of the zone """
+
+        # the edited part comes first, so the line numbers in the output still match
+        with tempfile.NamedTemporaryFile('w', suffix='.db', delete=False) as f:
+            with open(file, 'r') as edited:
+                for line in edited:
+                    f.write(line if line.endswith('\n') else line + '\n')
+
+            for record in self.context.records:
+                if not self.scope.matches(record):
+                    f.write(f'{str(record)}\n')
+
+        try:
+            result = utils.checkzone(self.zone.rstrip('.'), f.name)
+        finally:
+            os.remove(f.name)
+
+        return (result[0], result[1].replace(f.name, file))
+
+    def _check_record(self, record: zonefile.Record) -> List[str]:
+        """ Checks which only need the record itself """
+
+        messages = []
+        name = record.dnsName.lower()
+
+        if name != self.zone and not name.endswith('.' + self.zone):
+            messages.append(f'{record.dnsName} is out of zone {self.zone}')
+
+        try:
+            dnswire.name_to_wire(record.dnsName)
+        except dnswire.DnsWireError as e:
+            messages.append(str(e))
+
+        if record.dnsTtl > MAX_TTL:
+            messages.append(f'{record.dnsTtl} is not a valid ttl, maximum is {MAX_TTL}')
+
+        if record.dnsType in zonefile.PRIO_RRTYPES and record.dnsPrio is None and not record.dnsContent.startswith('\\#'):
+            messages.append(f'{record.dnsType} record without priority')
+            return messages
+
+        rdatastr = record.dnsContent if record.dnsPrio is None else f'{record.dnsPrio} {record.dnsContent}'
+        try:
+            dnswire.rdata_from_text(record.dnsType, rdatastr, self.zone)
+        except dnswire.DnsWireError as e:
+            messages.append(str(e))
+
+        return messages
+
+    def _check_soa(self, records: List[Tuple[int, zonefile.Record]]) -> Iterator[ZoneProblem]:
+        """ Exactly one SOA record at the zone apex, all records in its class """
+
+        soas = [ x for x in records if x[1].dnsType == 'SOA' ]
+
+        if len(soas) < 1:
+            yield ZoneProblem(0, 'No SOA record in zone file')
+            return
+
+        first, soa = soas[0]
+
+        if soa.dnsName.lower() != self.zone:
+            yield ZoneProblem(first, f'SOA record must be at the zone apex {self.zone}')
+
+        for lineno, _ in soas[1:]:
+            yield ZoneProblem(lineno, f'Duplicate SOA record, first one is in line {first}')
+
+        for lineno, record in records:
+            if record.dnsClass != soa.dnsClass:
+                yield ZoneProblem(lineno, f'Class {record.dnsClass} differs from the zone class {soa.dnsClass}')
+
+    def _check_names(self, records: List[Tuple[int, zonefile.Record]], changed: List[Tuple[int, zonefile.Record]]) -> Iterator[ZoneProblem]:
+        """ CNAME exclusivity and MX/SRV targets, only for names touched by changed records """
+
+        if len(changed) < 1:
+            return
+
+        names: Dict[str, List[Tuple[int, zonefile.Record]]] = {}
+        for item in records:
+            names.setdefault(item[1].dnsName.lower(), []).append(item)
+
+        touched = set(map(lambda x: x[1].dnsName.lower(), changed))
+
+        # records of the same names which are not part of the edited scope
+        if self.context is not None and self.scope is not None:
+            targets = set(x[1].dnsContent.split()[-1].lower() for x in changed if x[1].dnsType in TARGET_RRTYPES and x[1].dnsContent.strip())
+            for name in touched | targets:
+                outside = [ (0, x) for x in self.context.get_by_name(name) if not self.scope.matches(x) ]
+                if len(outside) > 0:
+                    names.setdefault(name, []).extend(outside)
+
+        for name in sorted(touched):
+            cnames = [ x for x in names[name] if x[1].dnsType == 'CNAME' ]
+            if len(cnames) < 1:
+                continue
+
+            for lineno, _ in cnames[1:]:
+                yield ZoneProblem(lineno, f'Multiple CNAME records for {name}')
+
+            others = sorted(set(x[1].dnsType for x in names[name] if x[1].dnsType not in CNAME_COMPANION_RRTYPES))
+            if len(others) > 0:
+                yield ZoneProblem(cnames[0][0], f'CNAME and other data ({", ".join(others)}) for {name}')
+
+        for lineno, record in changed:
+            if record.dnsType not in TARGET_RRTYPES or record.dnsContent.startswith('\\#'):
+                continue
+
+            target = record.dnsContent.split()[-1].lower()
+            if any(x[1].dnsType == 'CNAME' for x in names.get(target, [])):
+                yield ZoneProblem(lineno, f'{record.dnsType} target {target} is a CNAME')
+
+
+def format_problems(file: str, problems: Iterable[ZoneProblem]) -> Iterator[str]:
+    """ Problems as compiler-style messages """
+
+    for problem in problems:
+        location = f'{file}:{problem.line}' if problem.line > 0 else file
+        yield f'{location}: {problem.message}'
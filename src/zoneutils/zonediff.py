@@ -0,0 +1,128 @@
+import difflib
+from collections import Counter
+from typing import Iterator, List, Tuple
+from zoneutils import zonefile, nsupdate, profiling
+
+
+def _record_key(record: zonefile.Record) -> tuple:
+    """ Compare key of a record, whitespace changes outside of quoted content are ignored """
+
+    content = record.dnsContent
+    if '"' not in content and ('  ' in content or '\t' in content):
+        content = ' '.join(content.split())
+
+    return (record.dnsName, record.dnsTtl, record.dnsClass, record.dnsType, record.dnsPrio, content)
+
+
+def diff(org: zonefile.ZoneFile, new: zonefile.ZoneFile) -> nsupdate.NsUpdate:
+    """ Create changeset from the records of two zones """
+
+    changes = get_changes(org, new)
+
+    return nsupdate.NsUpdate(
+        add=[ x[1] for x in changes if x[0] == '+' ],
+        delete=[ x[1] for x in changes if x[0] == '-' ],
+        keep=[ x[1] for x in changes if x[0] == ' ' ]
+    )
+
+
+def diff_desired(current: zonefile.ZoneFile, desired: zonefile.ZoneFile) -> nsupdate.NsUpdate:
+    """ Create changeset from the current to a desired state. An outdated serial of the desired state
+        is no change on its own, it is increased when other records change """
+
+    currentsoa = zonefile.SoaRecord(current.get_soa())
+    desiredsoa = zonefile.SoaRecord(desired.get_soa())
+    outdated = desiredsoa.soaSerial <= currentsoa.soaSerial
+
+    if outdated:
+        desiredsoa.soaSerial = currentsoa.soaSerial
+
+    changeset = diff(current, desired)
+    if outdated and (len(changeset.add) > 0 or len(changeset.delete) > 0):
+        desiredsoa.apply_default_serialincrease()
+        changeset = diff(current, desired)
+
+    return changeset
+
+
+def get_changes(org: zonefile.ZoneFile, new: zonefile.ZoneFile) -> List[Tuple[str, zonefile.Record]]:
+    """ Mark each record as unchanged (' '), deleted ('-') or added ('+') by counting equal records """
+
+    with profiling.stage('diff'):
+        counts = Counter(map(_record_key, new.records))
+        changes = []
+
+        for record in org.records:
+            key = _record_key(record)
+            count = counts.get(key, 0)
+            if count > 0:
+                counts[key] = count - 1
+                changes.append((' ', record))
+            else:
+                changes.append(('-', record))
+
+        # records of the new zone which were not consumed by the original ones
+        for record in new.records:
+            key = _record_key(record)
+            count = counts.get(key, 0)
+            if count > 0:
+                counts[key] = count - 1
+                changes.append(('+', record))
+
+    return changes
+
+
+def unified_diff(org: List[str], new: List[str], orgname: str = 'org', newname: str = 'new', context: int = 3) -> Iterator[str]:
+    """ Render the differences between the lines of two files as unified diff which patch can apply,
+        the lines keep their line endings like in readlines() """
+
+    matcher = difflib.SequenceMatcher(None, org, new)
+    header = True
+
+    for group in matcher.get_grouped_opcodes(context):
+        if header:
+            yield f'--- {orgname}'
+            yield f'+++ {newname}'
+            header = False
+
+        yield f'@@ -{_hunk_range(group[0][1], group[-1][2])} +{_hunk_range(group[0][3], group[-1][4])} @@'
+
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                yield from _hunk_lines(' ', org[i1:i2])
+                continue
+
+            yield from _hunk_lines('-', org[i1:i2])
+            yield from _hunk_lines('+', new[j1:j2])
+
+
+def file_diff(orgfile: str, newfile: str, context: int = 3) -> Iterator[str]:
+    """ Unified diff of two files, labelled with their names """
+
+    # only \n ends a line, other line breaks are part of the content like for diff(1)
+    with open(orgfile, 'r', newline='\n') as f:
+        org = f.readlines()
+
+    with open(newfile, 'r', newline='\n') as f:
+        new = f.readlines()
+
+    return unified_diff(org, new, orgfile, newfile, context)
+
+
+def _hunk_range(start: int, stop: int) -> str:
+    """ Line range of a hunk as in diff(1), empty ranges point at the line before them """
+
+    length = stop - start
+    first = start + 1 if length > 0 else start
+    return str(first) if length == 1 else f'{first},{length}'
+
+
+def _hunk_lines(prefix: str, lines: List[str]) -> Iterator[str]:
+    """ Lines of a hunk without their line endings, a missing one at the end of the file is marked """
+
+    for line in lines:
+        if line.endswith('\n'):
+            yield prefix + line[:-1]
+        else:
+            yield prefix + line
+            yield '\\ No newline at end of file'
@@ -1,12 +1,23 @@
+import bisect
+import io
+import itertools
+import os
 import re
-from typing import Union
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Tuple, Union
 from datetime import datetime, timezone
+from zoneutils import dnswire, zonehash, profiling
 
 RESOURCE_CLASSES = [ 'ANY', 'IN', 'CH', 'HS', 'CS' ]
+RECORD_FIELDS = ( 'dnsName', 'dnsTtl', 'dnsClass', 'dnsType', 'dnsPrio', 'dnsContent' )
 RESOURCE_TYPE_RGX = re.compile(r"^[A-Z0-9]+$")
-RECORD_WITHPRIO_RGX = re.compile(r"^\s*?(?P<host>[^;\s]+\.)\s+(?P<ttl>[0-9]+)\s+(?P<class>[^\s]+)\s+(?P<type>MX|SRV)(?:\s+(?P<prio>[0-9]+))?\s+(?P<content>.+)$", re.M | re.S)
-RECORD_RGX = re.compile(r"^\s*?(?P<host>[^;\s]+\.)\s+(?P<ttl>[0-9]+)\s+(?P<class>[^\s]+)\s+(?P<type>(?:(?!TSIG|SRV|MX))[^\s]+)\s+(?P<content>.+)$", re.M | re.S)
+PRIO_RRTYPES = ( 'MX', 'SRV' )
+SKIPPED_RRTYPE_PREFIXES = ( 'TSIG', 'MX', 'SRV' )
 DIG_ABOUT_RGX = re.compile(r"^\s*?^;\s+<<>>\s+DiG\s+(?P<digversion>[0-9.]+)[^<\s]*?\s+<<>>\s+@(?P<ns>[^\s]+)\s+-y\s+(?P<keytype>[^\s+]+)\s-t\s+AXFR\s+(?P<zone>[^\s]+)\s*?$", re.M | re.S)
+# inputs smaller than this are parsed in-process, starting the worker processes takes longer
+PARALLEL_MIN_SIZE = 8 * 1024 * 1024
+PARALLEL_CHUNKS_PER_WORKER = 4
 SOACONTENT_RGX = re.compile(r"^\s*?(?P<primarydns>[^\s]+)\s+(?P<contact>[^\s]+)\s+(?P<serial>[0-9]+)\s+(?P<refresh>[0-9]+)\s+(?P<retry>[0-9]+)\s+(?P<expire>[0-9]+)\s+(?P<minttl>[^\s]+)\s*?$", re.M)
 
 
@@ -17,6 +28,9 @@ class InvalidZoneTypeError(Exception): pass
 class Record(object):
     """ Represents one single record in a zone file """
 
+    # no per-instance __dict__, zones can contain hundreds of thousands of records
+    __slots__ = RECORD_FIELDS
+
     def __init__(self, dnsName=None, dnsTtl=3600, dnsClass='IN', dnsType=None, dnsPrio=None, dnsContent=None):
         self.dnsName = dnsName
         self.dnsTtl = dnsTtl
@@ -28,6 +42,11 @@ class Record(object):
         if not self.dnsName.endswith('.'):
             self.dnsName = self.dnsName + '.'
 
+        # owner names, classes and types repeat for many records, keep one copy of each
+        self.dnsName = sys.intern(self.dnsName)
+        self.dnsClass = sys.intern(self.dnsClass)
+        self.dnsType = sys.intern(self.dnsType)
+
         if self.dnsTtl < 0:
             raise ZoneRecordSyntaxError(f'{self.dnsTtl} is not a valid ttl')
 
@@ -52,15 +71,20 @@ class Record(object):
     def get_by_index(self, index: int) -> Union[int, str]:
         """ Get record field by index """
 
-        if index >= 0 and index < len(self.as_array()):
-            return self.as_array()[index]
+        if index >= 0 and index < len(RECORD_FIELDS):
+            return getattr(self, RECORD_FIELDS[index])
 
         return None
 
+    def as_tuple(self) -> tuple:
+        """ Get record as tuple, usable as hashable key """
+
+        return (self.dnsName, self.dnsTtl, self.dnsClass, self.dnsType, self.dnsPrio, self.dnsContent)
+
     def __str__(self) -> str:
         """ Convert record data back into a zone file record """
 
-        prio = ' '+str(self.dnsPrio) if self.dnsPrio else ''
+        prio = ' '+str(self.dnsPrio) if self.dnsPrio is not None else ''
         return f'{self.dnsName} {self.dnsTtl} {self.dnsClass} {self.dnsType}{prio} {self.dnsContent}'
 
     def __eq__(self, other):
@@ -73,6 +97,12 @@ class Record(object):
             and self.dnsClass == other.dnsClass and self.dnsType == other.dnsType \
             and self.dnsPrio == other.dnsPrio and self.dnsContent == other.dnsContent
 
+    def __hash__(self):
+        """ Hash over all record fields, consistent with __eq__ """
+
+        # records are mutable (see SoaRecord), don't change them while used as key
+        return hash(self.as_tuple())
+
 
 class SoaRecord(object):
     """ Special functionality for SOA records """
@@ -140,57 +170,408 @@ class SoaRecord(object):
             and self.soaExpire == other.soaExpire and self.soaTtl == other.soaTtl
 
 
+def serial_newer(serial: int, other: int) -> bool:
+    """ True when a SOA serial is newer than an other one, in the serial number arithmetic of RFC 1982 """
+
+    return serial != other and (serial - other) % 2**32 < 2**31
+
+
 def from_string(recordstr: str) -> Record:
     """ Create record from zone file line """
 
-    match = RECORD_WITHPRIO_RGX.match(recordstr)
+    # name, ttl, class, type and the remaining content
+    return _from_parts(recordstr.split(None, 4))
+
+
+def _from_parts(parts: List[str]) -> Record:
+    """ Create record from the name, ttl, class, type and content of a zone file line """
+
+    if len(parts) < 5:
+        return None
+
+    host, ttl, dnsclass, dnstype, content = parts
 
-    if match is None:
-        match = RECORD_RGX.match(recordstr)
+    if not host.endswith('.') or ';' in host or not ttl.isascii() or not ttl.isdigit():
+        return None
 
-    if match:
-        return Record(
-            dnsName=match.group('host'),
-            dnsTtl=int(match.group('ttl')),
-            dnsClass=match.group('class'),
-            dnsType=match.group('type'),
-            dnsPrio=int(match.group('prio')) if 'prio' in match.groupdict().keys() else None,
-            dnsContent=match.group('content')
-        )
+    # dispatch on the type token, only MX and SRV carry a priority
+    prio = None
+    if dnstype in PRIO_RRTYPES:
+        prioparts = content.split(None, 1)
+        if len(prioparts) > 1 and prioparts[0].isascii() and prioparts[0].isdigit():
+            prio = int(prioparts[0])
+            content = prioparts[1]
+    elif dnstype.startswith(SKIPPED_RRTYPE_PREFIXES):
+        return None
 
-    return None
+    return Record(
+        dnsName=host,
+        dnsTtl=int(ttl),
+        dnsClass=dnsclass,
+        dnsType=dnstype,
+        dnsPrio=prio,
+        dnsContent=content
+    )
+
+
+class RecordList(list):
+    """ Record list of a zone which counts its changes, so the lookup index notices any of them """
+
+    __slots__ = ( 'generation', )
+
+    def __init__(self, records: Iterable[Record] = ()):
+        super().__init__(records)
+        self.generation = 0
+
+
+def _counted(name: str):
+    """ List method which counts the change before it is made """
+
+    method = getattr(list, name)
+
+    def changed(self, *args):
+        self.generation += 1
+        return method(self, *args)
+
+    changed.__name__ = name
+    return changed
+
+
+for _method in [ 'append', 'extend', 'insert', 'pop', 'remove', 'clear', 'sort', 'reverse',
+                 '__setitem__', '__delitem__', '__iadd__', '__imul__' ]:
+    setattr(RecordList, _method, _counted(_method))
+
+
+def rrtype_set(rrtypes: Iterable[str]) -> FrozenSet[str]:
+    """ RR types to ignore as uppercase set, the SOA record is always kept """
+
+    return frozenset(map(lambda x: x.upper().strip(), rrtypes)) - { 'SOA' }
 
 
 class ZoneFile:
     """ Represents all records from a AXFR query executed by dig """
 
-    def __init__(self, zonefilestr: str):
+    def __init__(self, zonefilestr: Union[str, Iterable[str]] = '', ignore_rrtypes: Iterable[str] = ()):
         self.digversion = None
         self.nameserver = None
         self.zone = None
         self.querykeytype = None
-        self.records = []
 
-        info = DIG_ABOUT_RGX.match(zonefilestr)
+        # number of records per RR type which were skipped because of ignore_rrtypes
+        self.ignored = {}
+        ignore = rrtype_set(ignore_rrtypes)
+
+        # iterate over strings line by line without splitting them up front
+        lines = io.StringIO(zonefilestr) if isinstance(zonefilestr, str) else zonefilestr
+
+        records = []
+        soa = False
+        firstline = True
+        for line in lines:
+            stripped = line.lstrip()
+
+            # skip blank lines and comments without parsing them
+            if not stripped:
+                continue
+
+            if stripped[0] == ';':
+                # dig prints its command line as first line
+                if firstline:
+                    self._parse_about(stripped)
+
+                firstline = False
+                continue
+
+            firstline = False
+            parts = stripped.rstrip('\n').split(None, 4)
+
+            # ignored records are skipped by their type, without parsing the rest of the line
+            if ignore and len(parts) > 4 and parts[3] in ignore:
+                self.ignored[parts[3]] = self.ignored.get(parts[3], 0) + 1
+                continue
+
+            r = _from_parts(parts)
+
+            if r and (soa == False or r.dnsType != 'SOA'):
+                records.append(r)
+
+                if soa == False and r.dnsType == 'SOA':
+                    soa = True
+
+        self.records = records
+
+    @property
+    def records(self) -> List[Record]:
+        """ All records of the zone """
+
+        return self._records
+
+    @records.setter
+    def records(self, records: List[Record]):
+        """ Replace the records, the index is rebuilt on the next lookup. A list is taken over
+            as RecordList, changes to it are counted, snapshot records can't be changed """
+
+        self._records = RecordList(records) if type(records) is list else records
+        self._index = None
+        self._namekeys = None
+        self._hashtree = None
+
+    def exclude_rrtypes(self, rrtypes: Iterable[str]) -> 'ZoneFile':
+        """ Copy of the zone without the records of the given RR types, they are counted in ignored """
+
+        result = ZoneFile()
+        result.digversion = self.digversion
+        result.nameserver = self.nameserver
+        result.zone = self.zone
+        result.querykeytype = self.querykeytype
+        result.ignored = dict(self.ignored)
+
+        ignore = rrtype_set(rrtypes)
+        if not ignore:
+            result.records = self.records
+            result._hashtree = self._hashtree
+            return result
+
+        records = []
+        for record in self.records:
+            if record.dnsType in ignore:
+                result.ignored[record.dnsType] = result.ignored.get(record.dnsType, 0) + 1
+            else:
+                records.append(record)
+
+        result.records = records
+        if self._hashtree is not None:
+            result._hashtree = self._hashtree.exclude_rrtypes(ignore)
+
+        return result
+
+    def replace_records(self, records: List[Record], names: Iterable[str]):
+        """ Replace the records when only the records of the given names changed,
+            a hash tree is updated for these names instead of being built again """
+
+        hashtree = self._hashtree
+        self.records = records
+
+        if hashtree is not None:
+            index = self._get_index()[2]
+            hashtree.update({ x: index.get(x, []) for x in set(map(_name_key, names)) })
+            self._hashtree = hashtree
+
+    def get_soa(self) -> Record:
+        """ The SOA record of the zone, None if there is none """
+
+        soas = self._get_index()[1].get('SOA')
+        return soas[0] if soas else None
+
+    def get_rrset(self, name: str, rrtype: str) -> List[Record]:
+        """ All records with the given owner name and type """
+
+        return list(self._get_index()[0].get((_name_key(name), rrtype.upper()), []))
+
+    def get_by_name(self, name: str) -> List[Record]:
+        """ All records with the given owner name """
+
+        return list(self._get_index()[2].get(_name_key(name), []))
+
+    def get_by_type(self, rrtype: str) -> List[Record]:
+        """ All records of a type """
+
+        return list(self._get_index()[1].get(rrtype.upper(), []))
+
+    def get_names(self) -> List[str]:
+        """ All owner names, lowercased and in canonical order """
+
+        return [ x[1] for x in self._get_namekeys() ]
+
+    def get_subtree(self, name: str) -> List[Record]:
+        """ All records at and below a name, e.g. everything under _acme-challenge.example.com. """
+
+        names = self._get_index()[2]
+        namekeys = self._get_namekeys()
+
+        # the names of a subtree are next to each other in canonical order
+        key = dnswire.canonical_name_key(_name_key(name))
+        result = []
+        for i in range(bisect.bisect_left(namekeys, (key,)), len(namekeys)):
+            if namekeys[i][0] != key and not namekeys[i][0].startswith(key + '\0'):
+                break
+
+            result.extend(names[namekeys[i][1]])
+
+        return result
+
+    def get_hash_tree(self) -> zonehash.HashTree:
+        """ Hashes per RRset, name and subtree, built on first use """
+
+        names = self._get_index()[2]
+
+        if self._hashtree is None:
+            with profiling.stage('hash'):
+                soa = self.get_soa()
+                apex = soa.dnsName if soa else (self.zone or '.')
+                self._hashtree = zonehash.HashTree(_name_key(apex), names)
+
+        return self._hashtree
+
+    def has_hash_tree(self) -> bool:
+        """ True when the hash tree is built or was loaded with the records """
+
+        return self._hashtree is not None
+
+    def set_hash_tree(self, hashtree: zonehash.HashTree):
+        """ Use a hash tree which was stored together with the records """
+
+        self._hashtree = hashtree
+
+    def _get_index(self) -> Tuple[Dict[Tuple[str, str], List[Record]], Dict[str, List[Record]], Dict[str, List[Record]]]:
+        """ Records by (name, type), by type and by name, built on first use """
+
+        # any change of the record list since the last lookup is counted by its generation
+        generation = getattr(self._records, 'generation', 0)
+        if self._index is None or self._index[3] != generation:
+            rrsets = {}
+            types = {}
+            names = {}
+
+            for record in self._records:
+                name = _name_key(record.dnsName)
+                rrsets.setdefault((name, record.dnsType), []).append(record)
+                types.setdefault(record.dnsType, []).append(record)
+                names.setdefault(name, []).append(record)
+
+            # the list was changed, a hash tree stored with the records was already dropped by the setter
+            if self._index is not None:
+                self._hashtree = None
+
+            self._index = (rrsets, types, names, generation)
+            self._namekeys = None
+
+        return self._index
+
+    def _get_namekeys(self) -> List[Tuple[str, str]]:
+        """ Canonical sort key and name of all owner names, sorted """
+
+        names = self._get_index()[2]
+
+        if self._namekeys is None:
+            self._namekeys = sorted((dnswire.canonical_name_key(x), x) for x in names)
+
+        return self._namekeys
+
+    def _parse_about(self, line: str):
+        """ Read query information from the dig header """
+
+        info = DIG_ABOUT_RGX.match(line)
         if info:
             self.digversion = info.group('digversion')
             self.nameserver = info.group('ns')
             self.zone = info.group('zone')
             self.querykeytype = info.group('keytype')
 
-        soa = False
-        for line in zonefilestr.split('\n'):
-            r = from_string(line)
 
-            if r and (soa == False or r.dnsType != 'SOA'):
-                self.records.append(r)
+def _name_key(name: str) -> str:
+    """ Names are case insensitive, the index uses them lowercased and fully qualified """
+
+    name = name.lower()
+    return name if name.endswith('.') else name + '.'
+
+
+def _parse_chunk(text: str, ignore_rrtypes: FrozenSet[str]) -> Tuple[List[tuple], Dict[str, int], int]:
+    """ Parse a line aligned part of a zone in a worker process. Returns the records as tuples,
+        which are much faster to send back than objects, the ignored counts and the position
+        of the SOA record, -1 if the part has none """
+
+    zone = ZoneFile(text, ignore_rrtypes)
+    soa = next((i for i, x in enumerate(zone.records) if x.dnsType == 'SOA'), -1)
+
+    return ([ x.as_tuple() for x in zone.records ], zone.ignored, soa)
+
+
+def _records_from_tuples(rows: List[tuple]) -> List[Record]:
+    """ Create records from tuples which were checked by the parser already """
+
+    records = []
+    for name, ttl, dnsclass, dnstype, prio, content in rows:
+        record = Record.__new__(Record)
+        record.dnsName = sys.intern(name)
+        record.dnsTtl = ttl
+        record.dnsClass = sys.intern(dnsclass)
+        record.dnsType = sys.intern(dnstype)
+        record.dnsPrio = prio
+        record.dnsContent = content
+        records.append(record)
+
+    return records
+
+
+def _split_chunks(text: str, count: int) -> Iterator[str]:
+    """ Split a text into about count parts at line ends """
+
+    size = len(text) // count + 1
+    start = 0
+
+    while start < len(text):
+        end = text.find('\n', start + size)
+        end = len(text) if end < 0 else end + 1
+
+        yield text[start:end]
+        start = end
+
+
+def parse_parallel(zonefilestr: str, workers: int = None, ignore_rrtypes: Iterable[str] = ()) -> ZoneFile:
+    """ Parse a zone in several processes, the result is the same as with ZoneFile.
+        Uses all cores when workers is None, small zones are parsed in-process """
+
+    workers = workers or os.cpu_count() or 1
+    ignore = rrtype_set(ignore_rrtypes)
+
+    if workers < 2 or len(zonefilestr) < PARALLEL_MIN_SIZE:
+        return ZoneFile(zonefilestr, ignore)
+
+    result = ZoneFile()
+
+    # the dig header is only read from the first line of the whole output
+    for line in io.StringIO(zonefilestr):
+        stripped = line.lstrip()
+        if stripped:
+            if stripped[0] == ';':
+                result._parse_about(stripped)
+            break
+
+    chunks = _split_chunks(zonefilestr, workers * PARALLEL_CHUNKS_PER_WORKER)
+    records = []
+    soa = False
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map keeps the order of the chunks
+        for rows, ignored, soaindex in executor.map(_parse_chunk, chunks, itertools.repeat(ignore)):
+            chunk = _records_from_tuples(rows)
+
+            # only the first SOA record of the zone is kept, the closing one of the transfer is not
+            if soaindex >= 0:
+                if soa:
+                    del chunk[soaindex]
+                soa = True
+
+            records.extend(chunk)
+
+            for rrtype, count in ignored.items():
+                result.ignored[rrtype] = result.ignored.get(rrtype, 0) + count
+
+    result.records = records
+    return result
 
-                if soa == False and r.dnsType == 'SOA':
-                    soa = True
 
+def load(zonefile: str, ignore_rrtypes: Iterable[str] = (), workers: int = 1) -> ZoneFile:
+    """ Load zone from a text file, records of the ignored RR types are skipped.
+        More than one worker parses big files in several processes, None uses all cores """
 
-def load(zonefile: str) -> ZoneFile:
-    """ Load zone from a text file """
+    with profiling.stage('parse'), open(zonefile, 'r') as f:
+        if workers == 1:
+            records = ZoneFile(f, ignore_rrtypes)
+        else:
+            records = parse_parallel(f.read(), workers, ignore_rrtypes)
 
-    with open(zonefile, 'r') as f:
-        return ZoneFile(f.read())
+    profiling.count('records_parsed', len(records.records))
+    profiling.count('records_ignored', sum(records.ignored.values()))
+    return records
@@ -1,5 +1,12 @@
-from typing import Iterator, List, Tuple
-from zoneutils import zonefile
+import itertools
+import shutil
+from typing import Callable, Dict, Iterator, List
+from zoneutils import zonefile, dnswire, profiling
+
+RECORD_TYPE_PRIORITIES = { 'SOA': 0, 'NS': 1, 'CAA': 2, 'A': 3, 'AAAA': 4, 'MX': 5, 'SRV': 6 }
+WRITE_BUFFER_SIZE = 1024 * 1024
+WRITE_BLOCK_LINES = 4096
+
 
 class ZoneFileFormatter:
     """ Creates a prettified zone file """
@@ -17,104 +24,146 @@ class ZoneFileFormatter:
         if len(zonefile.records) < 1:
             return None
 
-        # filter out RR types to ignore
-        zonefile.records = list(filter(lambda x: x.dnsType not in self.ignore_rrtypes, zonefile.records))
+        with profiling.stage('format'):
+            # RR types to ignore are usually skipped while parsing already, the zone itself is not changed
+            records = zonefile.records
+            if self.ignore_rrtypes:
+                records = list(filter(lambda x: x.dnsType not in self.ignore_rrtypes, records))
+
+            # group and sort records by second level name
+            record_groups = self._get_groups(records)
+            records = self.sort_records(records)
 
-        # get maximum lengths for each column
-        lengths = self._get_columnlengths(zonefile)
+            # convert all fields to strings once, the maximum lengths come from the same strings
+            columns = self._get_columns(records)
+            template = self._line_template(self._get_columnlengths(columns))
 
         # header
-        yield f'; <<>> DiG {zonefile.digversion} <<>> @{zonefile.nameserver} -t AXFR {zonefile.zone}'
+        client = f'DiG {zonefile.digversion}' if zonefile.digversion else 'AXFR'
+        yield f'; <<>> {client} <<>> @{zonefile.nameserver} -t AXFR {zonefile.zone}'
         yield ''
 
-        yield self._format_line(lengths, self.header)
-
-        # group and sort records by second level name
-        record_groups = self._get_groups(zonefile)
-        record_prio = self._get_record_priorities(zonefile)
-        records = sorted(zonefile.records, key=lambda x: self._record_sorter(x, record_prio))
+        yield template.format(*self.header)
 
         # records
+        previous_name = None
         previous_group = None
-        for record in records:
-            group = next(filter(lambda x: record.dnsName in x['items'], record_groups))['mapname']
-
+        for record, line in zip(records, map(template.format, *columns)):
             # newline between record groups
-            if previous_group is not None and group != previous_group:
-                yield ''
+            if record.dnsName != previous_name:
+                group = record_groups[record.dnsName]
+
+                if previous_group is not None and group != previous_group:
+                    yield ''
+
+                previous_name = record.dnsName
+                previous_group = group
 
             # print record
-            yield self._format_line(lengths, record.as_array())
-            previous_group = group
+            yield line
 
         # footer
         yield ''
         yield ';; EOF'
 
-    def save(self, file, zonefile: zonefile.ZoneFile) -> int:
-        """ Save zonefile as file """
+    def save(self, file, zonefile: zonefile.ZoneFile, copies: List[str] = []) -> int:
+        """ Save zonefile as file, the copies get the same content without formatting it again """
 
         lines = self.format(zonefile)
 
         if lines is None:
             return 0
 
+        # the lines are created while writing, so this stage contains the format stage
         linecount = 0
-        with open(file, 'w+') as f:
-            for line in lines:
-                f.write(f'{line}\n')
-                linecount += 1
+        with profiling.stage('save'):
+            with open(file, 'w+', buffering=WRITE_BUFFER_SIZE) as f:
+                # join blocks of lines to keep the number of write calls low
+                while True:
+                    block = list(itertools.islice(lines, WRITE_BLOCK_LINES))
+                    if len(block) < 1:
+                        break
+
+                    profiling.count('chars_written', f.write('\n'.join(block) + '\n'))
+                    linecount += len(block)
+
+            # the file is complete only after it was closed
+            for copy in copies:
+                shutil.copyfile(file, copy)
 
         return linecount
 
-    def _record_sorter(self, x: zonefile.Record, record_prio: List[str]) -> Tuple[str, int, int]:
-        """ Sorting rule for the records in the zone file """
+    def sort_records(self, items: list, record: Callable = None) -> list:
+        """ Sort records in the order they appear in the zone file, items can wrap records """
+
+        return sorted(items, key=self._record_sorter(record))
 
-        reversename = '.'.join(x.dnsName.split('.')[::-1])
-        typeprio = record_prio.index(x.dnsType)
-        dnsprio = x.dnsPrio if x.dnsPrio else 0
+    def _record_sorter(self, record: Callable = None) -> Callable[[object], str]:
+        """ Sorting rule for the records in the zone file, one string per record because strings compare fast """
 
-        return (reversename, typeprio, dnsprio)
+        # the cache lives as long as one sort, a formatter can outlive many zones (daemon mode)
+        namekeys = {}
+        record_prio = dict(RECORD_TYPE_PRIORITIES)
 
-    def _get_record_priorities(self, zonefile: zonefile.ZoneFile) -> List[str]:
-        """ Define sorting priority for record types """
+        def sortkey(x) -> str:
+            if record is not None:
+                x = record(x)
 
-        record_prio = [ 'SOA', 'NS', 'CAA', 'A', 'AAAA', 'MX', 'SRV' ]
-        for record in zonefile.records:
-            if record.dnsType not in record_prio:
-                record_prio.append(record.dnsType)
+            # names repeat for each record type, so the canonical name key is cached per name
+            namekey = namekeys.get(x.dnsName)
+            if namekey is None:
+                # the separator sorts a name before all names below it
+                namekey = namekeys[x.dnsName] = dnswire.canonical_name_key(x.dnsName) + '\0\0'
 
-        return record_prio
+            # unknown record types in order of appearance
+            typeprio = record_prio.get(x.dnsType)
+            if typeprio is None:
+                typeprio = record_prio[x.dnsType] = len(record_prio)
 
+            dnsprio = min(x.dnsPrio, 0xFFFF) if x.dnsPrio else 0
 
-    def _get_groups(self, zonefile: zonefile.ZoneFile) -> List[dict]:
-        """ Group records in zone file by 3rd level domains """
+            return namekey + chr(typeprio + 1) + chr(dnsprio + 1)
 
-        groups = []
-        for record in zonefile.records:
+        return sortkey
 
-            mapname = record.dnsName
-            parts = record.dnsName.split('.')
+    def _get_groups(self, records: List[zonefile.Record]) -> Dict[str, str]:
+        """ Group records in zone file by 3rd level domains, indexed by record name """
+
+        groups = {}
+        for record in records:
+
+            # the group only depends on the name, so each name is mapped once
+            if record.dnsName in groups:
+                continue
+
+            # names are case insensitive, like in the sort order
+            mapname = record.dnsName.lower()
+            parts = mapname.split('.')
             if len(parts) > 3:
                 mapname = '.'.join(parts[-4:])
 
-            group = None
-            groupfilter = list(filter(lambda x: x['mapname'] == mapname, groups))
-            if len(groupfilter) > 0:
-                group = groupfilter[0]
-                group['items'].append(record.dnsName)
-            else:
-                group = { 'mapname': mapname, 'items': [ record.dnsName ] }
-                groups.append(group)
+            groups[record.dnsName] = mapname
 
         return groups
 
-    def _get_columnlengths(self, zonefile: zonefile.ZoneFile, includeheader: bool = True) -> List[int]:
+    def _get_columns(self, records: List[zonefile.Record]) -> List[List[str]]:
+        """ Get the fields of all records as strings, column by column """
+
+        return [
+            [ x.dnsName for x in records ],
+            [ str(x.dnsTtl) for x in records ],
+            [ x.dnsClass for x in records ],
+            [ x.dnsType for x in records ],
+            [ '' if x.dnsPrio is None else str(x.dnsPrio) for x in records ],
+            [ x.dnsContent for x in records ],
+        ]
+
+    def _get_columnlengths(self, columns: List[List[str]], includeheader: bool = True) -> List[int]:
         """ Get largest string for each column """
 
         columnlengths = [  ]
         for i in range(0, self.columns):
-            maxlength = max(map(lambda x: len(str(x.get_by_index(i))), zonefile.records))
+            maxlength = max(map(len, columns[i]), default=0)
 
             if includeheader:
                 maxlength = maxlength if maxlength > len(self.header[i]) else len(self.header[i])
@@ -123,23 +172,17 @@ class ZoneFileFormatter:
 
         return columnlengths
 
-    def _format_line(self, widths: List[int], record: zonefile.Record) -> str:
-        """ Write padded record into the batch file """
+    def _line_template(self, widths: List[int]) -> str:
+        """ Format string which pads the columns of a line """
 
-        line = ''
+        columns = []
 
         for i in range(0, self.columns):
-            coltxt = record[i]
-            if coltxt is None:
-                coltxt = ''
-            else:
-                coltxt = str(coltxt)
-
             if self.columnalign[i] == -1:
-                coltxt = coltxt.rjust(widths[i], ' ')
+                columns.append('{:>' + str(widths[i]) + '}')
             elif self.columnalign[i] == 1:
-                coltxt = coltxt.ljust(widths[i], ' ')
-
-            line = line + coltxt+('' if i >= len(self.columnalign) - 1 else self.separator)
+                columns.append('{:<' + str(widths[i]) + '}')
+            else:
+                columns.append('{}')
 
-        return line
+        return self.separator.join(columns)
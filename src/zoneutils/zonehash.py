@@ -0,0 +1,285 @@
+import bisect
+import hashlib
+from typing import Callable, Dict, Iterable, List, Tuple
+from zoneutils import dnswire
+
+DIGEST_SIZE = 16
+
+
+def _digest(data: bytes) -> bytes:
+    """ Short content hash, collisions only have to be unlikely between two states of a zone """
+
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+EMPTY_DIGEST = _digest(b'')
+
+
+class HashNode:
+    """ One owner name of the hash tree, with the hashes of its RRsets, of itself and of its subtree """
+
+    __slots__ = ( 'name', 'rrsets', 'own', 'subtree', 'children' )
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rrsets: Dict[Tuple[str, str], bytes] = {}
+        self.own = EMPTY_DIGEST
+        self.subtree = EMPTY_DIGEST
+        self.children: List[str] = []
+
+
+def _record_line(record) -> str:
+    """ Canonical text of a record, whitespace outside of quoted content is not significant """
+
+    content = record.dnsContent
+    if '"' not in content and ('  ' in content or '\t' in content):
+        content = ' '.join(content.split())
+
+    return f'{record.dnsName.lower()} {record.dnsTtl} {record.dnsClass} {record.dnsType} {record.dnsPrio} {content}'
+
+
+def _rrset_digests(records: Iterable) -> Dict[Tuple[str, str], bytes]:
+    """ Hash of each RRset of the records of one name """
+
+    rrsets: Dict[Tuple[str, str], List[str]] = {}
+    for record in records:
+        rrsets.setdefault((record.dnsClass, record.dnsType), []).append(_record_line(record))
+
+    # the order of the records in an RRset is not significant
+    return { k: _digest('\n'.join(sorted(v)).encode('UTF-8')) for k, v in rrsets.items() }
+
+
+def _copy_node(node: HashNode) -> HashNode:
+    """ Copy of a node with its own lists """
+
+    result = HashNode(node.name)
+    result.rrsets = dict(node.rrsets)
+    result.own = node.own
+    result.subtree = node.subtree
+    return result
+
+
+def _parent_key(key: str) -> str:
+    """ Canonical key of the parent name """
+
+    return key.rsplit('\0', 1)[0] if '\0' in key else ''
+
+
+class HashTree:
+    """ Merkle tree over the owner names of a zone in canonical order, a subtree hash covers all
+        records at and below a name, so equal subtrees of two zones are skipped when comparing them """
+
+    def __init__(self, apex: str, names: Dict[str, Iterable] = {}):
+        self.apex = dnswire.canonical_name_key(apex)
+        self.nodes: Dict[str, HashNode] = {}
+        self.root = self._node(self.apex, apex.lower())
+
+        for name, records in names.items():
+            self._set_rrsets(self._node(dnswire.canonical_name_key(name), name), _rrset_digests(records))
+
+        # empty non-terminals connect the names to the apex, the children are sorted once afterwards
+        for key in list(self.nodes):
+            self._attach(key, list.append)
+
+        # children sort after their parent in canonical order, walking backwards finishes them first,
+        # the apex comes last because records outside of the zone hang below it
+        order = sorted(self.nodes, reverse=True)
+        order.remove(self.apex)
+        order.append(self.apex)
+
+        for key in order:
+            self.nodes[key].children.sort()
+
+        self._hash_subtrees(order)
+
+    @classmethod
+    def from_nodes(cls, apex: str, nodes: Iterable[Tuple[str, HashNode]]) -> 'HashTree':
+        """ Tree of stored nodes without children, their hashes are used as they are """
+
+        tree = cls(apex)
+        tree.nodes = dict(nodes)
+        tree.root = tree.nodes.setdefault(tree.apex, tree.root)
+
+        # in canonical order the children are appended sorted
+        for key in sorted(tree.nodes):
+            if key != tree.apex:
+                tree.nodes[tree._parent(key)].children.append(key)
+
+        return tree
+
+    def update(self, names: Dict[str, Iterable]):
+        """ Replace the records of some names, e.g. the names changed by an incremental transfer,
+            only these names and their ancestors are hashed again """
+
+        changed = []
+        for name, records in names.items():
+            key = dnswire.canonical_name_key(name)
+            rrsets = _rrset_digests(records)
+
+            new = key not in self.nodes
+            if new and not rrsets:
+                continue
+
+            node = self._node(key, name)
+            if new:
+                self._attach(key, bisect.insort)
+
+            changed.append(self._set_rrsets(node, rrsets, key))
+
+        self._rehash(changed)
+
+    def exclude_rrtypes(self, rrtypes: Iterable[str]) -> 'HashTree':
+        """ Copy of the tree without the RRsets of the given RR types """
+
+        tree = HashTree.from_nodes(self.root.name, [ (k, _copy_node(v)) for k, v in self.nodes.items() ])
+
+        ignore = frozenset(rrtypes)
+        changed = []
+        for key, node in list(tree.nodes.items()):
+            if any(x[1] in ignore for x in node.rrsets):
+                changed.append(tree._set_rrsets(node, { k: v for k, v in node.rrsets.items() if k[1] not in ignore }, key))
+
+        tree._rehash(changed)
+        return tree
+
+    def _set_rrsets(self, node: HashNode, rrsets: Dict[Tuple[str, str], bytes], key: str = None) -> str:
+        """ Replace the RRset hashes of a node, a node left without records and children is removed.
+            Returns the key of the node, or of its closest remaining ancestor """
+
+        node.rrsets = rrsets
+        node.own = _digest(node.name.encode('UTF-8') + b''.join([ v for k, v in sorted(rrsets.items()) ])) if rrsets else EMPTY_DIGEST
+
+        while key is not None and key != self.apex and not node.rrsets and not node.children:
+            del self.nodes[key]
+            parent = self._parent(key)
+            node = self.nodes[parent]
+            node.children.remove(key)
+            key = parent
+
+        return key
+
+    def _parent(self, key: str) -> str:
+        """ Key of the parent node, records outside of the zone hang below the apex """
+
+        if self.apex and not key.startswith(self.apex + '\0'):
+            return self.apex
+
+        return _parent_key(key)
+
+    def _attach(self, key: str, insert: Callable[[list, str], None]):
+        """ Add a node to the children of its parent, missing parents are created as empty non-terminals """
+
+        while key != self.apex:
+            parent = self._parent(key)
+            exists = parent in self.nodes
+            insert(self._node(parent, None).children, key)
+
+            if exists:
+                break
+
+            key = parent
+
+    def _rehash(self, keys: Iterable[str]):
+        """ Hash the subtrees of the given nodes and of all their ancestors again """
+
+        affected = set()
+        for key in keys:
+            # a node removed later on was replaced by its closest remaining ancestor
+            if key not in self.nodes:
+                continue
+
+            while key not in affected:
+                affected.add(key)
+                if key == self.apex:
+                    break
+
+                key = self._parent(key)
+
+        order = sorted(affected - { self.apex }, reverse=True)
+        if self.apex in affected:
+            order.append(self.apex)
+
+        self._hash_subtrees(order)
+
+    def _hash_subtrees(self, order: List[str]):
+        """ Subtree hashes of nodes ordered children first """
+
+        nodes = self.nodes
+        for key in order:
+            node = nodes[key]
+            node.subtree = _digest(node.own + b''.join([ nodes[x].subtree for x in node.children ]))
+
+    def _node(self, key: str, name: str) -> HashNode:
+        """ Node of a canonical name key, created when missing """
+
+        node = self.nodes.get(key)
+        if node is None:
+            node = HashNode(name or _name_from_key(key))
+            self.nodes[key] = node
+        elif name and node.name != name and not node.rrsets:
+            node.name = name
+
+        return node
+
+    def digest(self) -> str:
+        """ Hash of the whole zone """
+
+        return self.root.subtree.hex()
+
+    def subtree_digest(self, name: str) -> str:
+        """ Hash of all records at and below a name, None if there are none """
+
+        node = self.nodes.get(dnswire.canonical_name_key(name))
+        return node.subtree.hex() if node else None
+
+    def rrset_digest(self, name: str, rrtype: str, rrclass: str = 'IN') -> str:
+        """ Hash of one RRset, None if it does not exist """
+
+        node = self.nodes.get(dnswire.canonical_name_key(name))
+        value = node.rrsets.get((rrclass.upper(), rrtype.upper())) if node else None
+        return value.hex() if value else None
+
+
+def _name_from_key(key: str) -> str:
+    """ Name of an empty non-terminal from its canonical key """
+
+    return '.'.join(reversed(key.split('\0'))) + '.' if key else '.'
+
+
+def compare(a: HashTree, b: HashTree) -> List[Tuple[str, List[str]]]:
+    """ Names with different records and their changed RR types, only subtrees with different hashes are visited """
+
+    result = []
+    stack = [ (a.apex, b.apex) ]
+
+    while stack:
+        akey, bkey = stack.pop()
+        anode = a.nodes.get(akey) if akey is not None else None
+        bnode = b.nodes.get(bkey) if bkey is not None else None
+
+        if anode is not None and bnode is not None and anode.subtree == bnode.subtree:
+            continue
+
+        aown = anode.own if anode is not None and anode.rrsets else EMPTY_DIGEST
+        bown = bnode.own if bnode is not None and bnode.rrsets else EMPTY_DIGEST
+
+        if aown != bown:
+            arrsets = anode.rrsets if anode is not None else {}
+            brrsets = bnode.rrsets if bnode is not None else {}
+            changed = sorted(x[1] for x in set(arrsets) | set(brrsets) if arrsets.get(x) != brrsets.get(x))
+            result.append(((anode or bnode).name, changed))
+
+        # children are matched by their canonical key, relative to the apex of each tree
+        achildren = { _relative(x, a.apex): x for x in anode.children } if anode is not None else {}
+        bchildren = { _relative(x, b.apex): x for x in bnode.children } if bnode is not None else {}
+
+        for child in set(achildren) | set(bchildren):
+            stack.append((achildren.get(child), bchildren.get(child)))
+
+    return sorted(result, key=lambda x: dnswire.canonical_name_key(x[0]))
+
+
+def _relative(key: str, apex: str) -> str:
+    """ Canonical key without the apex """
+
+    return key[len(apex):] if apex and key.startswith(apex) else key
@@ -0,0 +1,101 @@
+from typing import Iterable, List
+from zoneutils import zonefile
+
+
+class ZoneScope:
+    """ Part of a zone selected by owner names, subtrees and RR types, for editing only this part """
+
+    def __init__(self, zone: str, names: Iterable[str] = [], subtrees: Iterable[str] = [], rrtypes: Iterable[str] = []):
+        self.zone = _fqdn(zone)
+        self.names = set(map(self.qualify, names))
+        self.subtrees = set(map(self.qualify, subtrees))
+        self.rrtypes = set(map(lambda x: x.upper().strip(), rrtypes))
+
+    def qualify(self, name: str) -> str:
+        """ Fully qualified lowercase name, names outside of the zone are relative to it and @ is the apex """
+
+        name = name.strip().lower()
+
+        if name in [ '', '@' ]:
+            return self.zone
+
+        if name.endswith('.'):
+            return name
+
+        if name + '.' == self.zone or (name + '.').endswith('.' + self.zone):
+            return name + '.'
+
+        return f'{name}.{self.zone}'
+
+    def is_empty(self) -> bool:
+        """ True when nothing was selected, the scope is the whole zone then """
+
+        return len(self.names) < 1 and len(self.subtrees) < 1 and len(self.rrtypes) < 1
+
+    def matches(self, record: zonefile.Record) -> bool:
+        """ Check if a record belongs to the scope, the SOA record always does """
+
+        if record.dnsType == 'SOA' or self.is_empty():
+            return True
+
+        if len(self.rrtypes) > 0 and record.dnsType not in self.rrtypes:
+            return False
+
+        if len(self.names) < 1 and len(self.subtrees) < 1:
+            return True
+
+        name = _fqdn(record.dnsName)
+        return name in self.names or any(name == x or name.endswith('.' + x) for x in self.subtrees)
+
+    def select(self, zone: zonefile.ZoneFile) -> zonefile.ZoneFile:
+        """ The records of the scope as new zone, looked up by the index of the zone """
+
+        if self.is_empty():
+            return zone
+
+        if len(self.names) > 0 or len(self.subtrees) > 0:
+            candidates = [ x for name in sorted(self.names) for x in zone.get_by_name(name) ]
+            candidates += [ x for name in sorted(self.subtrees) for x in zone.get_subtree(name) ]
+        else:
+            candidates = [ x for rrtype in sorted(self.rrtypes) for x in zone.get_by_type(rrtype) ]
+
+        # a name can be selected directly and by a subtree
+        records: List[zonefile.Record] = []
+        seen = set()
+        for record in candidates:
+            if id(record) not in seen and record.dnsType != 'SOA' and self.matches(record):
+                seen.add(id(record))
+                records.append(record)
+
+        # the SOA record stays part of the scope, it carries the serial and is the base of the update
+        soa = zone.get_soa()
+
+        result = zonefile.ZoneFile()
+        result.digversion = zone.digversion
+        result.nameserver = zone.nameserver
+        result.zone = zone.zone
+        result.querykeytype = zone.querykeytype
+        result.ignored = dict(zone.ignored)
+        result.records = ([ soa ] if soa else []) + records
+
+        return result
+
+    def describe(self) -> str:
+        """ Human readable summary of the scope """
+
+        parts = []
+        if len(self.names) > 0:
+            parts.append('names ' + ', '.join(sorted(self.names)))
+        if len(self.subtrees) > 0:
+            parts.append('subtrees ' + ', '.join(sorted(self.subtrees)))
+        if len(self.rrtypes) > 0:
+            parts.append('types ' + ', '.join(sorted(self.rrtypes)))
+
+        return '; '.join(parts) if len(parts) > 0 else 'whole zone'
+
+
+def _fqdn(name: str) -> str:
+    """ Names are compared lowercased and fully qualified """
+
+    name = name.strip().lower()
+    return name if name.endswith('.') else name + '.'
@@ -0,0 +1,279 @@
+import itertools
+import mmap
+import struct
+from collections import Counter
+from collections.abc import Sequence
+from typing import Iterable, Iterator, List, Tuple
+from zoneutils import zonefile, zonehash
+
+# header: magic, version, flags, record count, string count,
+# string indexes of digversion, nameserver, zone and querykeytype (-1 for None)
+MAGIC = b'NIZS'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII4i')
+
+# the hash tree of the records follows the string data
+FLAG_HASH_TREE = 1
+
+# one record: string indexes of name, class, type and content, ttl and prio (-1 for None)
+RECORD = struct.Struct('<IIIIIi')
+RECORD_TYPE = struct.Struct('<8xI12x')
+STRING_OFFSET = struct.Struct('<I')
+STRING_RANGE = struct.Struct('<II')
+
+# hash tree: string index of the apex, node count, RRset count, then all nodes in canonical order
+# followed by the RRsets of all nodes
+TREE_HEADER = struct.Struct('<III')
+TREE_NODE = struct.Struct(f'<III{zonehash.DIGEST_SIZE}s{zonehash.DIGEST_SIZE}s')
+TREE_RRSET = struct.Struct(f'<II{zonehash.DIGEST_SIZE}s')
+ENCODING = 'utf-8'
+
+
+class SnapshotFormatError(Exception): pass
+
+
+class SnapshotRecords(Sequence):
+    """ Records of a snapshot, materialized on first access and kept afterwards """
+
+    def __init__(self, buf, count: int, stringcount: int, rows: List[int] = None):
+        self._buf = buf
+        self._stringtable = HEADER.size + count * RECORD.size
+        self._blob = self._stringtable + (stringcount + 1) * STRING_OFFSET.size
+
+        # row numbers of the visible records when some are excluded, None for all rows
+        self._rows = rows
+        self._count = count if rows is None else len(rows)
+        self._records = [ None ] * self._count
+        self._interned = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ self[i] for i in range(*index.indices(self._count)) ]
+
+        if index < 0:
+            index += self._count
+
+        if index < 0 or index >= self._count:
+            raise IndexError('snapshot record index out of range')
+
+        record = self._records[index]
+        if record is None:
+            record = self._records[index] = self._materialize(index)
+
+        return record
+
+    def __iter__(self) -> Iterator[zonefile.Record]:
+        # unpack all rows at once instead of one by one
+        rows = RECORD.iter_unpack(self._buf[HEADER.size:self._stringtable])
+
+        if self._rows is not None:
+            rows = map(lambda x: RECORD.unpack_from(self._buf, HEADER.size + x * RECORD.size), self._rows)
+
+        for index, row in enumerate(rows):
+            record = self._records[index]
+            if record is None:
+                record = self._records[index] = self._create(*row)
+
+            yield record
+
+    def string(self, index: int) -> str:
+        """ Decode a string of the string table """
+
+        offset, end = STRING_RANGE.unpack_from(self._buf, self._stringtable + index * STRING_OFFSET.size)
+        return self._buf[self._blob + offset:self._blob + end].decode(ENCODING, 'surrogateescape')
+
+    def _materialize(self, index: int) -> zonefile.Record:
+        """ Create the record object from its fixed-width row """
+
+        row = index if self._rows is None else self._rows[index]
+        return self._create(*RECORD.unpack_from(self._buf, HEADER.size + row * RECORD.size))
+
+    def _create(self, name: int, dnsclass: int, dnstype: int, content: int, ttl: int, prio: int) -> zonefile.Record:
+        """ Create a record from the string indexes and numbers of a row """
+
+        # names, classes and types repeat a lot, so they are decoded once
+        interned = self._interned
+        values = []
+        for index in (name, dnsclass, dnstype):
+            value = interned.get(index)
+            if value is None:
+                value = interned[index] = self.string(index)
+            values.append(value)
+
+        # snapshots are written from valid records, so the checks of the constructor are skipped
+        record = zonefile.Record.__new__(zonefile.Record)
+        record.dnsName, record.dnsClass, record.dnsType = values
+        record.dnsTtl = ttl
+        record.dnsPrio = None if prio < 0 else prio
+        record.dnsContent = self.string(content)
+
+        return record
+
+
+def dumps(records: zonefile.ZoneFile, hashtree: zonehash.HashTree = None) -> bytes:
+    """ Serialize a zone into the snapshot format, optionally together with its hash tree """
+
+    strings = {}
+
+    def intern(value: str) -> int:
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+
+        return index
+
+    rows = bytearray()
+    for record in records.records:
+        rows.extend(RECORD.pack(
+            intern(record.dnsName),
+            intern(record.dnsClass),
+            intern(record.dnsType),
+            intern(record.dnsContent),
+            record.dnsTtl,
+            -1 if record.dnsPrio is None else record.dnsPrio
+        ))
+
+    meta = [ records.digversion, records.nameserver, records.zone, records.querykeytype ]
+    meta = [ -1 if x is None else intern(x) for x in meta ]
+
+    tree = bytearray()
+    if hashtree is not None:
+        nodes = bytearray()
+        rrsets = bytearray()
+        for key in sorted(hashtree.nodes):
+            node = hashtree.nodes[key]
+            nodes.extend(TREE_NODE.pack(intern(key), intern(node.name), len(node.rrsets), node.own, node.subtree))
+            for (rrclass, rrtype), digest in sorted(node.rrsets.items()):
+                rrsets.extend(TREE_RRSET.pack(intern(rrclass), intern(rrtype), digest))
+
+        tree.extend(TREE_HEADER.pack(intern(hashtree.root.name), len(nodes) // TREE_NODE.size, len(rrsets) // TREE_RRSET.size))
+        tree.extend(nodes)
+        tree.extend(rrsets)
+
+    # strings are stored back to back, the offsets table has one extra entry for the end
+    offsets = bytearray(STRING_OFFSET.pack(0))
+    blob = bytearray()
+    for value in strings:
+        blob.extend(value.encode(ENCODING, 'surrogateescape'))
+        offsets.extend(STRING_OFFSET.pack(len(blob)))
+
+    flags = 0 if hashtree is None else FLAG_HASH_TREE
+    header = HEADER.pack(MAGIC, VERSION, flags, len(rows) // RECORD.size, len(strings), *meta)
+    return b''.join([ header, rows, offsets, blob, tree ])
+
+
+def save(file: str, records: zonefile.ZoneFile):
+    """ Write a zone as snapshot file """
+
+    with open(file, 'wb') as f:
+        f.write(dumps(records))
+
+
+def _select_rows(records: SnapshotRecords, ignore: Iterable[str]) -> Tuple[List[int], dict]:
+    """ Row numbers of the records not of an ignored type and the number of skipped records per type,
+        only the type column is read """
+
+    types = [ x for x, in RECORD_TYPE.iter_unpack(records._buf[HEADER.size:records._stringtable]) ]
+
+    ignored = { x for x in set(types) if records.string(x) in ignore }
+    if not ignored:
+        return (None, {})
+
+    counts = Counter(x for x in types if x in ignored)
+    rows = [ i for i, x in enumerate(types) if x not in ignored ]
+
+    return (rows, { records.string(x): n for x, n in counts.items() })
+
+
+def _load_hash_tree(buf, records: SnapshotRecords, offset: int) -> zonehash.HashTree:
+    """ Read the hash tree stored after the string data """
+
+    if len(buf) < offset + TREE_HEADER.size:
+        raise SnapshotFormatError('Snapshot is truncated')
+
+    apex, nodecount, rrsetcount = TREE_HEADER.unpack_from(buf, offset)
+    nodestart = offset + TREE_HEADER.size
+    rrsetstart = nodestart + nodecount * TREE_NODE.size
+    end = rrsetstart + rrsetcount * TREE_RRSET.size
+
+    if len(buf) < end:
+        raise SnapshotFormatError('Snapshot is truncated')
+
+    # classes and types repeat a lot, so they are decoded once
+    interned = {}
+
+    def string(index: int) -> str:
+        value = interned.get(index)
+        if value is None:
+            value = interned[index] = records.string(index)
+
+        return value
+
+    rrsets = TREE_RRSET.iter_unpack(buf[rrsetstart:end])
+    nodes = []
+    for key, name, count, own, subtree in TREE_NODE.iter_unpack(buf[nodestart:rrsetstart]):
+        node = zonehash.HashNode(records.string(name))
+        node.rrsets = { (string(c), string(t)): d for c, t, d in itertools.islice(rrsets, count) }
+        node.own = own
+        node.subtree = subtree
+        nodes.append((records.string(key), node))
+
+    return zonehash.HashTree.from_nodes(records.string(apex), nodes)
+
+
+def loads(buf, ignore_rrtypes: Iterable[str] = (), hashtree: bool = False) -> zonefile.ZoneFile:
+    """ Open a snapshot from a buffer, records are created when they are accessed,
+        records of ignored RR types are skipped without creating them.
+        The stored hash tree is only read on request """
+
+    if len(buf) < HEADER.size:
+        raise SnapshotFormatError('Snapshot is too short')
+
+    magic, version, flags, count, stringcount, *meta = HEADER.unpack_from(buf, 0)
+
+    if magic != MAGIC or version != VERSION:
+        raise SnapshotFormatError('Not a zone snapshot or unsupported version')
+
+    # the last string offset is the size of the string data
+    blob = HEADER.size + count * RECORD.size + (stringcount + 1) * STRING_OFFSET.size
+    if len(buf) < blob or len(buf) < blob + STRING_OFFSET.unpack_from(buf, blob - STRING_OFFSET.size)[0]:
+        raise SnapshotFormatError('Snapshot is truncated')
+
+    records = SnapshotRecords(buf, count, stringcount)
+
+    tree = None
+    if hashtree and flags & FLAG_HASH_TREE:
+        tree = _load_hash_tree(buf, records, blob + STRING_OFFSET.unpack_from(buf, blob - STRING_OFFSET.size)[0])
+
+    ignored = {}
+    ignore = zonefile.rrtype_set(ignore_rrtypes)
+    if ignore and count > 0:
+        rows, ignored = _select_rows(records, ignore)
+        if rows is not None:
+            records = SnapshotRecords(buf, count, stringcount, rows)
+
+    result = zonefile.ZoneFile()
+    result.digversion, result.nameserver, result.zone, result.querykeytype = [ None if x < 0 else records.string(x) for x in meta ]
+    result.records = records
+    result.ignored = ignored
+
+    if tree is not None:
+        result.set_hash_tree(tree.exclude_rrtypes(ignored) if ignored else tree)
+
+    return result
+
+
+def load(file: str, ignore_rrtypes: Iterable[str] = (), hashtree: bool = False) -> zonefile.ZoneFile:
+    """ Open a snapshot file through mmap """
+
+    with open(file, 'rb') as f:
+        try:
+            # the mapping stays valid after the file is closed or replaced
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise SnapshotFormatError('Snapshot is empty')
+
+    return loads(buf, ignore_rrtypes, hashtree)
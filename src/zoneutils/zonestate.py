@@ -0,0 +1,129 @@
+import asyncio
+import time
+from typing import Callable, Dict, List
+from zoneutils import zonefile, zonecache, aioutils, dnsclient, dnswire, nsupdate, profiling
+
+
+class ZoneStateError(Exception): pass
+class MissingKeyError(ZoneStateError): pass
+
+
+class WarmZone:
+    """ A parsed zone kept in memory, refreshed when its SOA serial changes """
+
+    def __init__(self, zone: str, server: str, hmac: str):
+        self.zone = zone
+        self.server = server
+        self.hmac = hmac
+        self.records: zonefile.ZoneFile = None
+        self.serial = None
+        self.refreshed = 0.0
+        self.lock = asyncio.Lock()
+
+    def info(self) -> dict:
+        """ State of the zone as JSON compatible dict """
+
+        return {
+            'zone': self.zone,
+            'server': self.server,
+            'serial': self.serial,
+            'records': len(self.records.records) if self.records else 0,
+            'ignored': self.records.ignored if self.records else {},
+            'refreshed': self.refreshed,
+        }
+
+    def apply(self, changeset: nsupdate.NsUpdate):
+        """ Apply a sent changeset, the caller holds the lock """
+
+        apply_local(self.records, changeset)
+        self.serial = zonefile.SoaRecord(self.records.get_soa()).soaSerial
+
+
+class WarmZones:
+    """ Zones kept in memory, transferred on first use and again when their serial changes """
+
+    def __init__(self, hmac_lookup: Callable[[str], str], dnsserver: str = None, ignore_rrtypes: List[str] = [],
+                 use_cache: bool = True):
+        self.hmac_lookup = hmac_lookup
+        self.dnsserver = dnsserver
+        self.ignore_rrtypes = ignore_rrtypes
+        self.use_cache = use_cache
+        self.zones: Dict[str, WarmZone] = {}
+
+    async def get_zone(self, zone: str) -> WarmZone:
+        """ The warm state of a zone, transferred on first use """
+
+        zone = zone.rstrip('.').lower()
+        state = self.zones.get(zone)
+
+        if state is None:
+            hmac = self.hmac_lookup(zone)
+            if hmac is None:
+                raise MissingKeyError(f'No HMAC key defined for {zone}')
+
+            server = self.dnsserver or await zonecache.authoritative_server_async(zone, self.use_cache)
+            if server is None:
+                raise ZoneStateError(f'Unable to find the authoritative name server of {zone}')
+
+            # another request might have created the zone meanwhile
+            state = self.zones.setdefault(zone, WarmZone(zone, server, hmac))
+
+        async with state.lock:
+            if state.records is None:
+                try:
+                    await self._transfer(state)
+                except BaseException:
+                    # a zone which was never transferred is not kept warm
+                    if self.zones.get(zone) is state:
+                        del self.zones[zone]
+                    raise
+
+        return state
+
+    async def refresh(self, state: WarmZone, force: bool = False) -> bool:
+        """ Transfer the zone again when the serial on the server changed, True if it did """
+
+        async with state.lock:
+            if not force and state.records is not None:
+                key = dnswire.tsigkey_from_hmac(state.hmac)
+                soa = await dnsclient.soa(state.server, state.zone, key)
+
+                if zonefile.SoaRecord(soa).soaSerial == state.serial:
+                    state.refreshed = time.time()
+                    return False
+
+            await self._transfer(state)
+            return True
+
+    async def _transfer(self, state: WarmZone):
+        """ Zone transfer into the warm state, incremental when the local cache is used """
+
+        with profiling.stage('warm_transfer'):
+            if self.use_cache:
+                transfer = await zonecache.zonetransfer_async(state.server, state.hmac, state.zone, self.ignore_rrtypes)
+            else:
+                transfer = await aioutils.zonetransfer(state.server, state.hmac, state.zone, ignore_rrtypes=self.ignore_rrtypes)
+
+        if not transfer[0]:
+            if transfer[2] == aioutils.ZonetransferResult.FAILED and self.dnsserver is None:
+                zonecache.invalidate_server(state.zone)
+
+            raise ZoneStateError(f'{transfer[2].name}: {transfer[1]}')
+
+        soa = transfer[1].get_soa()
+        if soa is None:
+            raise ZoneStateError(f'No SOA record in zone {state.zone}')
+
+        state.records = transfer[1]
+        state.serial = zonefile.SoaRecord(soa).soaSerial
+        state.refreshed = time.time()
+
+
+def apply_local(current: zonefile.ZoneFile, changeset: nsupdate.NsUpdate):
+    """ Apply a sent changeset to the zone in memory, so the next change needs no transfer """
+
+    deleted = set(map(id, changeset.delete))
+    added = [ x for x in changeset.add if x.dnsType != 'SOA' ]
+    soa = [ x for x in changeset.add if x.dnsType == 'SOA' ]
+
+    current.records = soa + [ x for x in current.records if id(x) not in deleted ] + added
@@ -0,0 +1,211 @@
+""" Tests of reading streams of changes """
+
+import asyncio
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import changestream, dnswire, nsupdate, zonefile, zonestate
+from test_dnsclient import HMAC, SOA1, SOA2, ZONE, StandInServer, redirect, response, rr, sign, transfer_messages
+
+RECORDS = """www.example.com. 300 IN A 192.0.2.1
+www.example.com. 300 IN A 192.0.2.2
+mail.example.com. 300 IN A 192.0.2.3
+"""
+
+
+def zone(soa: str = SOA1, records: str = RECORDS) -> zonefile.ZoneFile:
+    return zonefile.ZoneFile(f'{ZONE} 3600 IN SOA {soa}\n' + records)
+
+
+def change(op: str, content: str = None, name: str = 'www', ttl: int = 300) -> changestream.Change:
+    fields = { 'op': op, 'zone': 'example.com', 'name': name, 'type': 'A', 'ttl': ttl }
+    return changestream.change_from_fields(dict(fields, content=content) if content else fields)
+
+
+def addresses(records: list) -> list:
+    return [ x.dnsContent for x in records if x.dnsType == 'A' ]
+
+
+def failing_lines():
+    yield '# comment\n'
+    raise OSError('read failed')
+
+
+class StreamTest(unittest.IsolatedAsyncioTestCase):
+
+    def test_missing_file(self):
+        with self.assertRaises(OSError):
+            changestream.open_lines(os.path.join(tempfile.gettempdir(), 'does-not-exist', 'changes.csv'))
+
+    def test_stdin(self):
+        with changestream.open_lines('-') as lines:
+            self.assertIs(lines, sys.stdin)
+
+        self.assertFalse(sys.stdin.closed)
+
+    async def test_read_error_is_raised(self):
+        runner = changestream.ChangeStreamRunner(lambda zone: None, '127.0.0.1', window=0.01)
+
+        with self.assertRaisesRegex(OSError, 'read failed'):
+            async for _ in runner.run(failing_lines(), changestream.ChangeReader()):
+                pass
+
+
+class ZoneBatchTest(unittest.TestCase):
+
+    def test_coalescing(self):
+        batch = changestream.ZoneBatch('example.com')
+        for x in [ change('add', '192.0.2.4'), change('delete', '192.0.2.1'), change('add', '192.0.2.5', 'new'), change('delete', '192.0.2.4') ]:
+            batch.append(x)
+
+        # one list of operations per RRset, nothing is superseded
+        self.assertEqual(batch.operations, 4)
+        self.assertEqual(batch.coalesced, 0)
+        self.assertEqual(sorted(batch.rrsets.keys()), [ ('new.example.com.', 'IN', 'A'), ('www.example.com.', 'IN', 'A') ])
+
+        changeset = batch.changeset(zone())
+        self.assertEqual(addresses(changeset.add), [ '192.0.2.5' ])
+        self.assertEqual(addresses(changeset.delete), [ '192.0.2.1' ])
+        self.assertEqual(addresses(changeset.keep), [ '192.0.2.2' ])
+
+        # one serial increase for the whole batch
+        self.assertEqual([ zonefile.SoaRecord(x).soaSerial for x in changeset.delete + changeset.add if x.dnsType == 'SOA' ], [ 2020092601, 2020092602 ])
+
+    def test_replace_clears_rrset(self):
+        batch = changestream.ZoneBatch('example.com')
+        for x in [ change('add', '192.0.2.4'), change('delete', '192.0.2.1'), change('replace', '192.0.2.9') ]:
+            batch.append(x)
+
+        self.assertEqual(batch.operations, 3)
+        self.assertEqual(batch.coalesced, 2)
+        self.assertEqual([ x.op for x in batch.rrsets[('www.example.com.', 'IN', 'A')] ], [ 'replace' ])
+
+        changeset = batch.changeset(zone())
+        self.assertEqual(addresses(changeset.add), [ '192.0.2.9' ])
+        self.assertEqual(addresses(changeset.delete), [ '192.0.2.1', '192.0.2.2' ])
+
+    def test_delete_rrset_clears_rrset(self):
+        batch = changestream.ZoneBatch('example.com')
+        for x in [ change('add', '192.0.2.4'), change('delete') ]:
+            batch.append(x)
+
+        self.assertEqual(batch.coalesced, 1)
+        self.assertEqual(addresses(batch.changeset(zone()).delete), [ '192.0.2.1', '192.0.2.2' ])
+
+    def test_unchanged(self):
+        batch = changestream.ZoneBatch('example.com')
+        batch.append(change('add', '192.0.2.1'))
+
+        changeset = batch.changeset(zone())
+        self.assertEqual((changeset.add, changeset.delete), ([], []))
+
+
+class FoldTest(unittest.TestCase):
+
+    def test_operations_in_order(self):
+        records = zone().get_rrset('www.example.com.', 'A')
+
+        self.assertEqual(addresses(changestream._fold(records, [ change('delete', '192.0.2.1'), change('add', '192.0.2.4') ])), [ '192.0.2.2', '192.0.2.4' ])
+        self.assertEqual(addresses(changestream._fold(records, [ change('add', '192.0.2.4'), change('delete', '192.0.2.4') ])), [ '192.0.2.1', '192.0.2.2' ])
+        self.assertEqual(addresses(changestream._fold(records, [ change('delete'), change('add', '192.0.2.4') ])), [ '192.0.2.4' ])
+        self.assertEqual(addresses(changestream._fold(records, [ change('replace', '192.0.2.4'), change('add', '192.0.2.5') ])), [ '192.0.2.4', '192.0.2.5' ])
+
+        # the records of the zone are not changed
+        self.assertEqual(addresses(records), [ '192.0.2.1', '192.0.2.2' ])
+
+    def test_other_ttl(self):
+        records = changestream._fold(zone().get_rrset('www.example.com.', 'A'), [ change('add', '192.0.2.1', ttl=60) ])
+
+        # the RR is the same, only its TTL changed
+        self.assertEqual([ (x.dnsContent, x.dnsTtl) for x in records ], [ ('192.0.2.2', 300), ('192.0.2.1', 60) ])
+
+
+class ApplyLocalTest(unittest.TestCase):
+
+    def test_apply(self):
+        records = zone()
+        batch = changestream.ZoneBatch('example.com')
+        for x in [ change('delete', '192.0.2.1'), change('add', '192.0.2.4', 'new') ]:
+            batch.append(x)
+
+        zonestate.apply_local(records, batch.changeset(records))
+
+        # the new SOA is the first record, the others keep their order
+        self.assertEqual([ str(x) for x in records.records ], [
+            f'{ZONE} 3600 IN SOA {SOA2}',
+            'www.example.com. 300 IN A 192.0.2.2',
+            'mail.example.com. 300 IN A 192.0.2.3',
+            'new.example.com. 300 IN A 192.0.2.4',
+        ])
+        self.assertEqual(addresses(records.get_rrset('new.example.com.', 'A')), [ '192.0.2.4' ])
+
+    def test_equal_record_is_kept(self):
+        # only the deleted record object is removed, not an equal one
+        records = zone(records='www.example.com. 300 IN TXT "a"\nwww.example.com. 300 IN TXT "a"\n')
+        zonestate.apply_local(records, nsupdate.NsUpdate(delete=records.records[1:2]))
+        self.assertEqual([ x.dnsType for x in records.records ], [ 'SOA', 'TXT' ])
+
+
+class RetryTest(unittest.IsolatedAsyncioTestCase):
+
+    def handler(self, rcodes: list):
+        """ A server whose zone is changed by someone else at the first update, the updates get the given rcodes """
+
+        axfr = [ [ rr(ZONE, 'SOA', SOA1), rr('www.example.com.', 'A', '192.0.2.1', 300), rr(ZONE, 'SOA', SOA1) ],
+                 [ rr(ZONE, 'SOA', SOA2), rr('www.example.com.', 'A', '192.0.2.2', 300), rr(ZONE, 'SOA', SOA2) ] ]
+
+        soa = [ SOA1 ]
+
+        def handle(query, mac):
+            if (query.flags >> 11) & 0xF == dnswire.OPCODE_UPDATE:
+                soa[0] = SOA2
+                header = struct.pack('!HHHHHH', query.id, 0x8000 | (dnswire.OPCODE_UPDATE << 11) | rcodes.pop(0), 1, 0, 0, 0)
+                return [ sign(header + dnswire.make_question(ZONE, dnswire.RRTYPES['SOA']), mac)[0] ]
+
+            if dnswire.rrtype_to_text(query.questions[0][1]) == 'SOA':
+                return [ sign(response(query, [ rr(ZONE, 'SOA', soa[0]) ]), mac)[0] ]
+
+            return transfer_messages(query, mac, [ axfr.pop(0) ])
+
+        return handle
+
+    def requests(self, server: StandInServer) -> list:
+        messages = [ dnswire.Message(x) for x in server.requests ]
+        return [ 'UPDATE' if (x.flags >> 11) & 0xF == dnswire.OPCODE_UPDATE else dnswire.rrtype_to_text(x.questions[0][1]) for x in messages ]
+
+    async def apply(self, server: StandInServer) -> changestream.ZoneChangeResult:
+        runner = changestream.ChangeStreamRunner(lambda zone: HMAC, '127.0.0.1', use_cache=False)
+        batch = changestream.ZoneBatch('example.com')
+        batch.append(change('add', '192.0.2.9'))
+
+        with redirect(server.port):
+            result = await runner._apply(batch, asyncio.Semaphore(1))
+
+        return (result, runner.zones.zones.get('example.com'))
+
+    async def test_retry_on_prerequisite(self):
+        async with StandInServer(self.handler([ 8, 0 ])) as server:
+            result, state = await self.apply(server)
+
+        # the failed update is sent again against the zone transferred anew
+        self.assertEqual(self.requests(server), [ 'AXFR', 'SOA', 'UPDATE', 'SOA', 'AXFR', 'UPDATE' ])
+        self.assertEqual((result.status, result.message), ('updated', ''))
+        self.assertEqual(addresses(state.records.records), [ '192.0.2.2', '192.0.2.9' ])
+        self.assertEqual(state.serial, 2020092603)
+
+    async def test_no_retry(self):
+        async with StandInServer(self.handler([ 5 ])) as server:
+            result, state = await self.apply(server)
+
+        self.assertEqual(self.requests(server), [ 'AXFR', 'SOA', 'UPDATE' ])
+        self.assertEqual((result.status, result.message), ('failed', 'REFUSED'))
+
+
+if __name__ == '__main__':
+    unittest.main()
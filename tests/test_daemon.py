@@ -0,0 +1,199 @@
+""" Tests of the zone daemon and its HTTP API """
+
+import asyncio
+import io
+import json
+import os
+import shutil
+import stat
+import struct
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest import mock
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import daemon, dnswire, zonefile, zonescope, zonestate
+from test_dnsclient import HMAC, SOA1, SOA2, ZONE, StandInServer, redirect, response, rr, sign, transfer_messages
+
+RECORDS = """www.example.com. 300 IN A 192.0.2.1
+mail.example.com. 300 IN MX 10 mx.example.com.
+"""
+
+
+def warm_zone(zone: str = 'example.com') -> zonestate.WarmZone:
+    state = zonestate.WarmZone(zone, '127.0.0.1', HMAC)
+    state.records = zonefile.ZoneFile(f'{zone}. 3600 IN SOA {SOA1}\n' + RECORDS.replace(ZONE, zone + '.'))
+    state.serial = 2020092601
+    return state
+
+
+class PollTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_failing_zone(self):
+        server = daemon.ZoneDaemon(lambda zone: HMAC, '127.0.0.1', poll_interval=0)
+        for zone in [ 'example.com', 'example.net' ]:
+            server.zones.zones[zone] = warm_zone(zone)
+
+        refreshed = []
+
+        async def refresh(state, force=False):
+            if state.zone == 'example.com':
+                raise ValueError('broken')
+            refreshed.append(state.zone)
+
+        stderr = io.StringIO()
+        with mock.patch.object(server.zones, 'refresh', refresh), redirect_stderr(stderr):
+            poller = asyncio.create_task(server._poll())
+            while len(refreshed) < 2 and not poller.done():
+                await asyncio.sleep(0)
+            poller.cancel()
+
+        # any error of one zone is logged, the other zones and later polls go on
+        self.assertEqual(refreshed[:2], [ 'example.net', 'example.net' ])
+        self.assertIn('Refresh of example.com failed: ValueError: broken', stderr.getvalue())
+
+
+class DiffLockTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_waits_for_update(self):
+        server = daemon.ZoneDaemon(lambda zone: HMAC, '127.0.0.1')
+        state = warm_zone()
+        body = b'{"add": ["new.example.com. 300 IN A 192.0.2.2"]}'
+
+        async with state.lock:
+            diff = asyncio.create_task(server._post_diff(state, zonescope.ZoneScope(state.zone), { 'content-type': 'application/json' }, body))
+            await asyncio.sleep(0.01)
+            self.assertFalse(diff.done())
+
+        self.assertEqual((await diff)[0], 200)
+
+
+class ApiTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'api.sock')
+
+        self.server = daemon.ZoneDaemon(lambda zone: HMAC if zone == 'example.com' else None, '127.0.0.1', use_cache=False)
+        self.server.zones.zones['example.com'] = warm_zone()
+
+        self.task = asyncio.create_task(self.server.serve(self.path))
+        while not os.path.exists(self.path):
+            await asyncio.sleep(0.01)
+
+    async def asyncTearDown(self):
+        self.task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await self.task
+
+    async def request(self, method: str, target: str, body: bytes = b'', contenttype: str = 'text/plain') -> tuple:
+        """ Status and body of a request, JSON bodies are decoded """
+
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        writer.write(f'{method} {target} HTTP/1.1\r\nContent-Type: {contenttype}\r\nContent-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+        await writer.drain()
+
+        head, payload = (await reader.read()).split(b'\r\n\r\n', 1)
+        writer.close()
+
+        status = int(head.split(b' ')[1])
+        if b'Content-Type: application/json' in head:
+            return (status, json.loads(payload))
+
+        return (status, payload.decode('UTF-8'))
+
+    async def test_socket_of_own_user(self):
+        self.assertTrue(stat.S_ISSOCK(os.stat(self.path).st_mode))
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode) & 0o077, 0)
+
+    async def test_zones(self):
+        status, zones = await self.request('GET', '/zones')
+
+        self.assertEqual(status, 200)
+        self.assertEqual([ (x['zone'], x['serial'], x['records']) for x in zones ], [ ('example.com', 2020092601, 3) ])
+
+    async def test_records(self):
+        status, result = await self.request('GET', '/zones/example.com.?name=www')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(result['records'], [ f'{ZONE} 3600 IN SOA {SOA1}', 'www.example.com. 300 IN A 192.0.2.1' ])
+
+    async def test_file(self):
+        status, text = await self.request('GET', '/zones/example.com/file?type=MX')
+
+        self.assertEqual(status, 200)
+        self.assertIn('mx.example.com.', text)
+        self.assertNotIn('192.0.2.1', text)
+
+    async def test_diff_of_changeset(self):
+        body = json.dumps({ 'add': [ 'new.example.com. 300 IN A 192.0.2.2' ] }).encode('UTF-8')
+        status, result = await self.request('POST', '/zones/example.com/diff', body, 'application/json')
+
+        # the serial is increased, the zone is not changed
+        self.assertEqual(status, 200)
+        self.assertEqual(result['add'], [ 'new.example.com. 300 IN A 192.0.2.2', f'{ZONE} 3600 IN SOA {SOA2}' ])
+        self.assertEqual(result['delete'], [ f'{ZONE} 3600 IN SOA {SOA1}' ])
+        self.assertTrue(any(x.startswith('+') and '192.0.2.2' in x for x in result['diff'].splitlines()))
+        self.assertEqual(len(self.server.zones.zones['example.com'].records.records), 3)
+
+    async def test_diff_of_desired_state(self):
+        desired = f'{ZONE} 3600 IN SOA {SOA1}\nwww.example.com. 300 IN A 192.0.2.9\n'
+        status, result = await self.request('POST', '/zones/example.com/diff?name=www', desired.encode('UTF-8'))
+
+        # only the records of the scope are compared
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(result['delete']), [ f'{ZONE} 3600 IN SOA {SOA1}', 'www.example.com. 300 IN A 192.0.2.1' ])
+        self.assertIn('www.example.com. 300 IN A 192.0.2.9', result['add'])
+
+        status, result = await self.request('POST', '/zones/example.com/diff', desired.replace('192.0.2.9', '192.0.2.999').encode('UTF-8'))
+        self.assertEqual(status, 422)
+        self.assertIsInstance(result['error'], list)
+
+    async def test_errors(self):
+        for method, target, expected in [ ('GET', '/other', 404), ('GET', '/zones/example.com/other', 404),
+                                          ('DELETE', '/zones/example.com', 405), ('GET', '/zones/example.net', 403) ]:
+            self.assertEqual((await self.request(method, target))[0], expected, target)
+
+        status, result = await self.request('POST', '/zones/example.com/diff', b'{"add": [ "invalid" ]}', 'application/json')
+        self.assertEqual((status, result['error']), (400, 'Unable to parse record: invalid'))
+
+        status, result = await self.request('POST', '/zones/example.com/diff', b'{', 'application/json')
+        self.assertEqual(status, 400)
+
+    async def test_update(self):
+        axfr = [ [ rr(ZONE, 'SOA', SOA2), rr('www.example.com.', 'A', '192.0.2.2', 300), rr(ZONE, 'SOA', SOA2) ] ]
+
+        def handler(query, mac):
+            if (query.flags >> 11) & 0xF == dnswire.OPCODE_UPDATE:
+                header = struct.pack('!HHHHHH', query.id, 0x8000 | (dnswire.OPCODE_UPDATE << 11), 1, 0, 0, 0)
+                return [ sign(header + dnswire.make_question(ZONE, dnswire.RRTYPES['SOA']), mac)[0] ]
+
+            if dnswire.rrtype_to_text(query.questions[0][1]) == 'SOA':
+                return [ sign(response(query, [ rr(ZONE, 'SOA', SOA2) ]), mac)[0] ]
+
+            return transfer_messages(query, mac, axfr)
+
+        body = json.dumps({ 'add': [ 'www.example.com. 300 IN A 192.0.2.2' ], 'delete': [ 'www.example.com. 300 IN A 192.0.2.1' ] }).encode('UTF-8')
+        async with StandInServer(handler) as server:
+            with redirect(server.port):
+                status, result = await self.request('POST', '/zones/example.com/update', body, 'application/json')
+
+        # the zone is transferred again after the update
+        self.assertEqual(status, 200)
+        self.assertEqual((result['status'], result['serial']), ('updated', 2020092602))
+        self.assertEqual([ str(x) for x in self.server.zones.zones['example.com'].records.records ][1:], [ 'www.example.com. 300 IN A 192.0.2.2' ])
+
+    async def test_update_unchanged(self):
+        body = json.dumps({ 'add': [] }).encode('UTF-8')
+        status, result = await self.request('POST', '/zones/example.com/update', body, 'application/json')
+
+        self.assertEqual((status, result['status']), (200, 'unchanged'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+""" Tests of showing changes and diffs """
+
+import io
+import os
+import sys
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import diffrender, zonefile
+
+
+def records(*lines: str) -> list:
+    return [ zonefile.from_string(x) for x in lines ]
+
+
+def hunk(count: int) -> list:
+    return [ '@@ -1,{0} +1,{0} @@'.format(count) ] + [ f' line {i}' for i in range(count) ]
+
+
+class SummaryTest(unittest.TestCase):
+
+    def test_counts_per_type(self):
+        add = records('www.example.com. 300 IN A 192.0.2.1', 'www.example.com. 300 IN A 192.0.2.2', 'www.example.com. 300 IN TXT "a"')
+        delete = records('www.example.com. 300 IN AAAA 2001:db8::1')
+
+        self.assertEqual(list(diffrender.summary(add, delete, color=False)), [
+            'Changes: +3 -1 records',
+            '  A                +2       -0',
+            '  AAAA             +0       -1',
+            '  TXT              +1       -0',
+            '',
+        ])
+
+    def test_color(self):
+        line = next(diffrender.summary([], [], color=True))
+
+        self.assertEqual(line, f'{diffrender.BOLD}Changes:{diffrender.RESET} {diffrender.GREEN}+0{diffrender.RESET} {diffrender.RED}-0{diffrender.RESET} records')
+
+
+class ColorizeTest(unittest.TestCase):
+
+    def test_colorize(self):
+        lines = [ '--- org', '+++ new', '@@ -1 +1 @@', '-old', '+new', ' same' ]
+
+        self.assertEqual(list(diffrender.colorize(lines)), [
+            f'{diffrender.BOLD}--- org{diffrender.RESET}',
+            f'{diffrender.BOLD}+++ new{diffrender.RESET}',
+            f'{diffrender.CYAN}@@ -1 +1 @@{diffrender.RESET}',
+            f'{diffrender.RED}-old{diffrender.RESET}',
+            f'{diffrender.GREEN}+new{diffrender.RESET}',
+            ' same',
+        ])
+
+
+class CollapseTest(unittest.TestCase):
+
+    def test_long_hunk(self):
+        lines = [ '--- org', '+++ new' ] + hunk(10) + hunk(2)
+
+        # the first and last lines of each long hunk are shown
+        self.assertEqual(list(diffrender.collapse(lines, 4)), [ '--- org', '+++ new' ] + hunk(10)[:3] + [ '... 6 lines not shown ...' ] + hunk(10)[-2:] + hunk(2))
+
+    def test_short_hunks(self):
+        lines = hunk(4) + hunk(3)
+
+        self.assertEqual(list(diffrender.collapse(lines, 4)), lines)
+        self.assertEqual(list(diffrender.collapse(hunk(10), 0)), hunk(10))
+
+    def test_lazy(self):
+        def lines():
+            yield from hunk(10)
+            raise AssertionError('read too far')
+
+        # lines are passed on while the hunk is read
+        self.assertEqual(next(iter(diffrender.collapse(lines(), 4))), hunk(10)[0])
+
+
+class OutputTest(unittest.TestCase):
+
+    def test_tee(self):
+        file = io.StringIO()
+
+        self.assertEqual(list(diffrender.tee([ 'a', 'b' ], file)), [ 'a', 'b' ])
+        self.assertEqual(file.getvalue(), 'a\nb\n')
+
+    def test_use_color(self):
+        terminal = mock.Mock(isatty=lambda: True)
+
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertTrue(diffrender.use_color(terminal))
+            self.assertFalse(diffrender.use_color(io.StringIO()))
+
+        with mock.patch.dict(os.environ, { 'NO_COLOR': '1' }):
+            self.assertFalse(diffrender.use_color(terminal))
+
+    def test_show_without_terminal(self):
+        output = io.StringIO()
+
+        # no pager is started when the output is not a terminal
+        with mock.patch.dict(os.environ, { 'PAGER': 'false' }), redirect_stdout(output):
+            diffrender.show([ 'a', 'b' ])
+
+        self.assertEqual(output.getvalue(), 'a\nb\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,473 @@
+""" Tests of the native DNS client against an in-process TCP server """
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import sys
+import time
+import unittest
+from unittest import mock
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import aioutils, dnsclient, dnswire, nsupdate, zonefile
+
+HMAC = 'hmac-sha256:testkey:' + base64.b64encode(b'secretsecretsecret').decode('ascii')
+KEY = dnswire.tsigkey_from_hmac(HMAC)
+ZONE = 'example.com.'
+SOA1 = 'ns1.example.com. hostmaster.example.com. 2020092601 3600 900 604800 300'
+SOA2 = 'ns1.example.com. hostmaster.example.com. 2020092602 3600 900 604800 300'
+SOA3 = 'ns1.example.com. hostmaster.example.com. 2020092603 3600 900 604800 300'
+
+
+def rr(name: str, rrtype: str, content: str, ttl: int = 3600, rrclass: str = 'IN') -> bytes:
+    """ Record in wire format """
+
+    rdata = dnswire.rdata_from_text(rrtype, content, ZONE) if content is not None else b''
+    return dnswire.rr_to_wire(dnswire.name_to_wire(name), dnswire.RRTYPES[rrtype], dnswire.RRCLASSES[rrclass], ttl, rdata)
+
+
+def response(query: dnswire.Message, answer: list = [], rcode: int = 0) -> bytes:
+    """ Unsigned response to a query, with its question """
+
+    name, rrtype, rrclass = query.questions[0]
+    header = struct.pack('!HHHHHH', query.id, 0x8400 | rcode, 1, len(answer), 0, 0)
+    return header + dnswire.make_question(name, rrtype, rrclass) + b''.join(answer)
+
+
+def _variables(timesigned: int, fudge: int) -> bytes:
+    """ TSIG variables of RFC 8945 section 4.3.3, written independently of the code under test """
+
+    return dnswire.name_to_wire(KEY.name) + struct.pack('!HI', 255, 0) + dnswire.name_to_wire(KEY.algorithmname) \
+        + struct.pack('!HIH', 0, timesigned, fudge) + struct.pack('!HH', 0, 0)
+
+
+def sign(wire: bytes, prior_mac: bytes, first: bool = True, unsigned: list = [], secret: bytes = KEY.secret) -> tuple:
+    """ Sign a response, the first one with all TSIG variables, later ones of a transfer with the timers only """
+
+    timesigned = int(time.time())
+    h = hmac.new(secret, digestmod=hashlib.sha256)
+    h.update(struct.pack('!H', len(prior_mac)) + prior_mac)
+
+    for message in unsigned:
+        h.update(message)
+
+    h.update(wire)
+    h.update(_variables(timesigned, 300) if first else struct.pack('!HIH', 0, timesigned, 300))
+    mac = h.digest()
+
+    rdata = dnswire.name_to_wire(KEY.algorithmname) + struct.pack('!HIH', 0, timesigned, 300) \
+        + struct.pack('!H', len(mac)) + mac + wire[0:2] + struct.pack('!HH', 0, 0)
+    arcount = struct.unpack_from('!H', wire, 10)[0]
+    signed = wire[0:10] + struct.pack('!H', arcount + 1) + wire[12:] \
+        + dnswire.rr_to_wire(dnswire.name_to_wire(KEY.name), dnswire.RRTYPES['TSIG'], 255, 0, rdata)
+
+    return (signed, mac)
+
+
+def verify_request(buf: bytes) -> bytes:
+    """ Check the TSIG of a request like a server does, returns its MAC """
+
+    message = dnswire.Message(buf)
+    if message.tsig is None:
+        raise AssertionError('Request is not signed')
+
+    algorithm, offset = dnswire.name_from_wire(buf, message.tsig.offset)
+    timehigh, timelow, fudge, maclength = struct.unpack_from('!HIHH', buf, offset)
+    mac = buf[offset+10:offset+10+maclength]
+    originalid = struct.unpack_from('!H', buf, offset + 10 + maclength)[0]
+
+    unsigned = struct.pack('!H', originalid) + buf[2:10] + struct.pack('!H', len(message.additional) - 1) \
+        + buf[12:message.tsigoffset]
+    expected = hmac.new(KEY.secret, unsigned + _variables(timelow, fudge), hashlib.sha256).digest()
+
+    if algorithm.lower() != KEY.algorithmname or not hmac.compare_digest(mac, expected):
+        raise AssertionError('Request signature is invalid')
+
+    return mac
+
+
+def redirect(port: int):
+    """ Connect to the stand-in server instead of port 53, for functions without a port """
+
+    connect = asyncio.open_connection
+    return mock.patch.object(asyncio, 'open_connection', lambda host, _: connect(host, port))
+
+
+class StandInServer:
+    """ TCP server which answers one request per connection with the messages of a handler """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self.server = None
+        self.port = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *args):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            length = struct.unpack('!H', await reader.readexactly(2))[0]
+            buf = await reader.readexactly(length)
+            self.requests.append(buf)
+
+            for message in self.handler(dnswire.Message(buf), verify_request(buf)):
+                # length prefix and message in separate writes, the client has to reassemble them
+                writer.write(struct.pack('!H', len(message)))
+                await writer.drain()
+                writer.write(message)
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+def transfer_messages(query: dnswire.Message, requestmac: bytes, groups: list, signed: list = None, secret: bytes = KEY.secret) -> list:
+    """ Responses of a transfer, one per group of records, signed as given per message and chained by their MACs """
+
+    signed = signed if signed is not None else [ True ] * len(groups)
+    messages = []
+    unsigned = []
+    mac = requestmac
+    first = True
+
+    for group, sign_it in zip(groups, signed):
+        wire = response(query, group)
+
+        if not sign_it:
+            unsigned.append(wire)
+            messages.append(wire)
+            continue
+
+        wire, mac = sign(wire, mac, first, unsigned, secret)
+        messages.append(wire)
+        unsigned = []
+        first = False
+
+    return messages
+
+
+class TsigTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_signed_request_and_response(self):
+        def handler(query, mac):
+            yield sign(response(query, [ rr(ZONE, 'SOA', SOA1) ]), mac)[0]
+
+        async with StandInServer(handler) as server:
+            soa = await dnsclient.soa('127.0.0.1', 'example.com', KEY, port=server.port)
+
+        self.assertEqual(soa.dnsType, 'SOA')
+        self.assertEqual(zonefile.SoaRecord(soa).soaSerial, 2020092601)
+
+    async def test_response_with_wrong_mac(self):
+        def handler(query, mac):
+            yield sign(response(query, [ rr(ZONE, 'SOA', SOA1) ]), mac, secret=b'wrong')[0]
+
+        async with StandInServer(handler) as server:
+            with self.assertRaises(dnsclient.KeyRejectedError):
+                await dnsclient.soa('127.0.0.1', ZONE, KEY, port=server.port)
+
+    async def test_response_signed_without_request_mac(self):
+        def handler(query, mac):
+            yield sign(response(query, [ rr(ZONE, 'SOA', SOA1) ]), b'')[0]
+
+        async with StandInServer(handler) as server:
+            with self.assertRaises(dnsclient.KeyRejectedError):
+                await dnsclient.soa('127.0.0.1', ZONE, KEY, port=server.port)
+
+    async def test_unsigned_response(self):
+        def handler(query, mac):
+            yield response(query, [ rr(ZONE, 'SOA', SOA1) ], rcode=9)
+
+        async with StandInServer(handler) as server:
+            with self.assertRaises(dnsclient.KeyRejectedError):
+                await dnsclient.soa('127.0.0.1', ZONE, KEY, port=server.port)
+
+    async def test_response_with_other_id(self):
+        def handler(query, mac):
+            wire = response(query, [ rr(ZONE, 'SOA', SOA1) ])
+            yield sign(struct.pack('!H', (query.id + 1) % 65536) + wire[2:], mac)[0]
+
+        async with StandInServer(handler) as server:
+            with self.assertRaises(dnsclient.DnsClientError):
+                await dnsclient.soa('127.0.0.1', ZONE, KEY, port=server.port)
+
+
+AXFR_GROUPS = [
+    [ rr(ZONE, 'SOA', SOA1), rr(ZONE, 'NS', 'ns1.example.com.'), rr(ZONE, 'MX', '10 mail.example.com.') ],
+    [ rr('www.example.com.', 'A', '192.0.2.1'), rr('www.example.com.', 'TXT', '"a b" "c"') ],
+    [ rr('_sip._tcp.example.com.', 'SRV', '10 5 5060 sip.example.com.') ],
+    [ rr('mail.example.com.', 'AAAA', '2001:db8::1'), rr(ZONE, 'SOA', SOA1) ],
+]
+
+
+class AxfrTest(unittest.IsolatedAsyncioTestCase):
+
+    async def transfer(self, handler) -> list:
+        async with StandInServer(handler) as server:
+            records = [ x async for x in dnsclient.axfr('127.0.0.1', ZONE, KEY, port=server.port) ]
+            self.assertEqual(dnswire.Message(server.requests[0]).questions[0][1], dnswire.RRTYPES['AXFR'])
+            return records
+
+    async def test_multi_message_transfer(self):
+        records = await self.transfer(lambda query, mac: transfer_messages(query, mac, AXFR_GROUPS))
+
+        self.assertEqual([ str(x) for x in records ], [
+            f'example.com. 3600 IN SOA {SOA1}',
+            'example.com. 3600 IN NS ns1.example.com.',
+            'example.com. 3600 IN MX 10 mail.example.com.',
+            'www.example.com. 3600 IN A 192.0.2.1',
+            'www.example.com. 3600 IN TXT "a b" "c"',
+            '_sip._tcp.example.com. 3600 IN SRV 10 5 5060 sip.example.com.',
+            'mail.example.com. 3600 IN AAAA 2001:db8::1',
+        ])
+
+    async def test_unsigned_messages_between_signed_ones(self):
+        records = await self.transfer(lambda query, mac: transfer_messages(query, mac, AXFR_GROUPS, [ True, False, False, True ]))
+        self.assertEqual(len(records), 7)
+
+    async def test_broken_mac_chain(self):
+        def handler(query, mac):
+            messages = transfer_messages(query, mac, AXFR_GROUPS[:2])
+
+            # the third message is signed as if it was the first one
+            third, _ = sign(response(query, AXFR_GROUPS[2]), mac)
+            return messages + [ third ] + transfer_messages(query, mac, AXFR_GROUPS[3:])
+
+        with self.assertRaises(dnsclient.KeyRejectedError):
+            await self.transfer(handler)
+
+    async def test_last_message_unsigned(self):
+        with self.assertRaises(dnsclient.KeyRejectedError):
+            await self.transfer(lambda query, mac: transfer_messages(query, mac, AXFR_GROUPS, [ True, True, True, False ]))
+
+    async def test_first_message_unsigned(self):
+        with self.assertRaises(dnsclient.KeyRejectedError):
+            await self.transfer(lambda query, mac: transfer_messages(query, mac, AXFR_GROUPS, [ False, True, True, True ]))
+
+    async def test_transfer_without_leading_soa(self):
+        with self.assertRaises(dnsclient.DnsClientError):
+            await self.transfer(lambda query, mac: transfer_messages(query, mac, AXFR_GROUPS[1:]))
+
+    async def test_connection_closed_during_transfer(self):
+        with self.assertRaises(dnsclient.DnsClientError):
+            await self.transfer(lambda query, mac: transfer_messages(query, mac, AXFR_GROUPS[:2]))
+
+    async def test_refused_transfer(self):
+        def handler(query, mac):
+            yield sign(response(query, [], rcode=5), mac)[0]
+
+        with self.assertRaisesRegex(dnsclient.DnsClientError, 'REFUSED'):
+            await self.transfer(handler)
+
+
+class ZonetransferTest(unittest.IsolatedAsyncioTestCase):
+
+    async def transfer(self, groups: list) -> tuple:
+        async with StandInServer(lambda query, mac: transfer_messages(query, mac, groups)) as server:
+            with redirect(server.port):
+                return await aioutils.zonetransfer('127.0.0.1', HMAC, ZONE)
+
+    async def test_transfer(self):
+        ok, records, result = await self.transfer(AXFR_GROUPS)
+
+        self.assertEqual((ok, result), (True, aioutils.ZonetransferResult.OK))
+        self.assertEqual(len(records.records), 7)
+
+    async def test_record_of_other_class(self):
+        # class NONE only exists in UPDATE messages, a zone file can't hold it
+        groups = [ AXFR_GROUPS[0], [ rr('www.example.com.', 'A', '192.0.2.1', rrclass='NONE') ], AXFR_GROUPS[3] ]
+
+        ok, message, result = await self.transfer(groups)
+        self.assertEqual((ok, result), (False, aioutils.ZonetransferResult.FAILED))
+        self.assertIn('NONE', message)
+
+
+class IxfrTest(unittest.IsolatedAsyncioTestCase):
+
+    async def transfer(self, handler) -> tuple:
+        current = zonefile.from_string(f'{ZONE} 3600 IN SOA {SOA1}')
+
+        async with StandInServer(handler) as server:
+            result = await dnsclient.ixfr('127.0.0.1', ZONE, current, KEY, port=server.port)
+
+        # the request carries the known SOA in the authority section
+        request = dnswire.Message(server.requests[0])
+        self.assertEqual(request.questions[0][1], dnswire.RRTYPES['IXFR'])
+        self.assertEqual(len(request.authority), 1)
+        soa = request.authority[0]
+        self.assertEqual(dnswire.rdata_to_text(request.buf, soa.rrtype, soa.offset, soa.length), SOA1)
+
+        return result
+
+    async def test_deltas(self):
+        groups = [
+            [ rr(ZONE, 'SOA', SOA3), rr(ZONE, 'SOA', SOA1), rr('www.example.com.', 'A', '192.0.2.1') ],
+            [ rr(ZONE, 'SOA', SOA2), rr('www.example.com.', 'A', '192.0.2.2') ],
+            [ rr(ZONE, 'SOA', SOA2), rr('old.example.com.', 'TXT', '"x"'), rr(ZONE, 'SOA', SOA3) ],
+            [ rr('new.example.com.', 'MX', '10 mail.example.com.'), rr(ZONE, 'SOA', SOA3) ],
+        ]
+
+        incremental, deltas = await self.transfer(lambda query, mac: transfer_messages(query, mac, groups, [ True, False, True, True ]))
+
+        self.assertTrue(incremental)
+        self.assertEqual([ ([ str(x) for x in d ], [ str(x) for x in a ]) for d, a in deltas ], [
+            ([ f'example.com. 3600 IN SOA {SOA1}', 'www.example.com. 3600 IN A 192.0.2.1' ],
+             [ f'example.com. 3600 IN SOA {SOA2}', 'www.example.com. 3600 IN A 192.0.2.2' ]),
+            ([ f'example.com. 3600 IN SOA {SOA2}', 'old.example.com. 3600 IN TXT "x"' ],
+             [ f'example.com. 3600 IN SOA {SOA3}', 'new.example.com. 3600 IN MX 10 mail.example.com.' ]),
+        ])
+
+    async def test_up_to_date(self):
+        def handler(query, mac):
+            yield sign(response(query, [ rr(ZONE, 'SOA', SOA1) ]), mac)[0]
+
+        self.assertEqual(await self.transfer(handler), (True, []))
+
+    async def test_server_behind(self):
+        # the server only sends its older SOA, the client must not wait for more
+        def handler(query, mac):
+            yield sign(response(query, [ rr(ZONE, 'SOA', SOA1.replace('2020092601', '2020092600')) ]), mac)[0]
+
+        with self.assertRaisesRegex(dnsclient.DnsClientError, 'older'):
+            await self.transfer(handler)
+
+    async def test_full_zone_instead_of_deltas(self):
+        groups = [ [ rr(ZONE, 'SOA', SOA2), rr(ZONE, 'NS', 'ns1.example.com.') ], [ rr('www.example.com.', 'A', '192.0.2.1'), rr(ZONE, 'SOA', SOA2) ] ]
+
+        incremental, records = await self.transfer(lambda query, mac: transfer_messages(query, mac, groups))
+
+        self.assertFalse(incremental)
+        self.assertEqual([ x.dnsType for x in records ], [ 'SOA', 'NS', 'A' ])
+        self.assertEqual(zonefile.SoaRecord(records[0]).soaSerial, 2020092602)
+
+
+def record(line: str) -> zonefile.Record:
+    return zonefile.from_string(line)
+
+
+class UpdateTest(unittest.IsolatedAsyncioTestCase):
+
+    def sections(self, wire: bytes) -> tuple:
+        """ Zone, prerequisite and update section of an UPDATE as (name, type, class, ttl, rdata) """
+
+        message = dnswire.Message(wire)
+        convert = lambda x: (x.name, dnswire.rrtype_to_text(x.rrtype), dnswire.rrclass_to_text(x.rrclass), x.ttl,
+                             dnswire.rdata_to_text(message.buf, x.rrtype, x.offset, x.length) if x.length else None)
+
+        return (message.questions, [ convert(x) for x in message.answer ], [ convert(x) for x in message.authority ])
+
+    def test_sections(self):
+        soa = record(f'{ZONE} 3600 IN SOA {SOA1}')
+        newsoa = record(f'{ZONE} 3600 IN SOA {SOA2}')
+        changeset = nsupdate.NsUpdate(
+            add=[ newsoa, record('www.example.com. 300 IN A 192.0.2.2'), record('new.example.com. 60 IN MX 10 mail.example.com.') ],
+            delete=[ soa, record('www.example.com. 300 IN A 192.0.2.1') ],
+            keep=[ record('www.example.com. 300 IN A 192.0.2.3') ])
+
+        messages = changeset.get_update_messages(ZONE, 4711)
+        self.assertEqual(len(messages), 1)
+
+        header = struct.unpack_from('!HH', messages[0], 0)
+        self.assertEqual(header, (4711, dnswire.OPCODE_UPDATE << 11))
+
+        zone, prereqs, updates = self.sections(messages[0])
+        self.assertEqual(zone, [ (ZONE, dnswire.RRTYPES['SOA'], dnswire.RRCLASSES['IN']) ])
+
+        # RFC 2136 section 2.4: yxrr has class IN with rdata, yxrrset class ANY and nxrrset class NONE without rdata
+        self.assertEqual(sorted(prereqs, key=str), sorted([
+            (ZONE, 'SOA', 'IN', 0, SOA1),
+            ('www.example.com.', 'A', 'ANY', 0, None),
+            ('new.example.com.', 'MX', 'NONE', 0, None),
+        ], key=str))
+
+        # RFC 2136 section 2.5: deletes of single RRs have class NONE and TTL 0, adds their class and TTL
+        # deletes before adds and the new SOA last
+        self.assertEqual(updates, [
+            ('www.example.com.', 'A', 'NONE', 0, '192.0.2.1'),
+            ('www.example.com.', 'A', 'IN', 300, '192.0.2.2'),
+            ('new.example.com.', 'MX', 'IN', 60, '10 mail.example.com.'),
+            (ZONE, 'SOA', 'IN', 3600, SOA2),
+        ])
+
+    def test_rrset_delete(self):
+        changeset = nsupdate.NsUpdate(
+            delete=[ record(f'h0.example.com. 60 IN TXT "{n}"') for n in range(5) ],
+            keep=[])
+
+        zone, prereqs, updates = self.sections(changeset.get_update_messages(ZONE, 1)[0])
+
+        # deleting the whole RRset is one operation instead of five, class ANY without rdata
+        self.assertEqual(updates, [ ('h0.example.com.', 'TXT', 'ANY', 0, None) ])
+
+    def test_nsupdate_batch(self):
+        changeset = nsupdate.NsUpdate(
+            add=[ record('www.example.com. 300 IN HTTPS 1 . alpn=h2'), record('www.example.com. 300 IN TYPE65400 \\# 2 0102') ],
+            delete=[ record('www.example.com. 300 IN MX 10 mail.example.com.') ],
+            keep=[])
+
+        self.assertEqual(list(changeset.get_nsupdate_batch('127.0.0.1', ZONE))[4:-2], [
+            '',
+            'prereq yxrrset www.example.com. IN MX',
+            'prereq nxrrset www.example.com. IN HTTPS',
+            'prereq nxrrset www.example.com. IN TYPE65400',
+            'update del www.example.com. 300 IN MX 10 mail.example.com.',
+            'update add www.example.com. 300 IN HTTPS 1 . alpn=h2',
+            'update add www.example.com. 300 IN TYPE65400 \\# 2 0102',
+            'send',
+        ])
+
+    def test_nsupdate_batch_priority_0(self):
+        changeset = nsupdate.NsUpdate(add=[ record('www.example.com. 300 IN MX 0 mail.example.com.') ], keep=[])
+
+        # a priority of 0 is written, not dropped
+        self.assertIn('update add www.example.com. 300 IN MX 0 mail.example.com.', list(changeset.get_nsupdate_batch('127.0.0.1', ZONE)))
+
+    def test_split_into_transactions(self):
+        changeset = nsupdate.NsUpdate(add=[ record(f'h{i}.example.com. 60 IN TXT "{"x" * 200}"') for i in range(1000) ])
+        messages = changeset.get_update_messages(ZONE, 65535)
+
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(all(len(x) <= nsupdate.MAX_UPDATE_SIZE + 512 for x in messages))
+        self.assertEqual([ struct.unpack_from('!H', x, 0)[0] for x in messages ], [ (65535 + i) % 65536 for i in range(len(messages)) ])
+        self.assertEqual(sum(len(self.sections(x)[2]) for x in messages), 1000)
+
+    async def test_signed_update(self):
+        changeset = nsupdate.NsUpdate(add=[ record('www.example.com. 300 IN A 192.0.2.2') ])
+        message = changeset.get_update_messages(ZONE, 42)[0]
+
+        def handler(query, mac):
+            header = struct.pack('!HHHHHH', query.id, 0x8000 | (dnswire.OPCODE_UPDATE << 11), 1, 0, 0, 0)
+            yield sign(header + dnswire.make_question(ZONE, dnswire.RRTYPES['SOA']), mac)[0]
+
+        async with StandInServer(handler) as server:
+            result = await dnsclient.update('127.0.0.1', message, KEY, port=server.port)
+
+        self.assertEqual(result.rcode_text(), 'NOERROR')
+        self.assertEqual(self.sections(server.requests[0])[2], [ ('www.example.com.', 'A', 'IN', 300, '192.0.2.2') ])
+
+    async def test_update_rejected_by_prerequisite(self):
+        message = nsupdate.NsUpdate(add=[ record('www.example.com. 300 IN A 192.0.2.2') ]).get_update_messages(ZONE, 42)[0]
+
+        def handler(query, mac):
+            header = struct.pack('!HHHHHH', query.id, 0x8000 | (dnswire.OPCODE_UPDATE << 11) | 8, 1, 0, 0, 0)
+            yield sign(header + dnswire.make_question(ZONE, dnswire.RRTYPES['SOA']), mac)[0]
+
+        async with StandInServer(handler) as server:
+            result = await dnsclient.update('127.0.0.1', message, KEY, port=server.port)
+
+        self.assertEqual(result.rcode_text(), 'NXRRSET')
+
+
+if __name__ == '__main__':
+    unittest.main()
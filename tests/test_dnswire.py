@@ -0,0 +1,70 @@
+""" Tests of the conversion between presentation and wire format """
+
+import os
+import sys
+import unittest
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import dnswire
+
+
+class RdataTest(unittest.TestCase):
+
+    def roundtrip(self, rrtype: str, text: str) -> str:
+        """ Encode and decode rdata, the decoded text has to encode to the same rdata """
+
+        wire = dnswire.rdata_from_text(rrtype, text, 'example.com.')
+        result = dnswire.rdata_to_text(wire, dnswire.rrtype_from_text(rrtype), 0, len(wire))
+        self.assertEqual(dnswire.rdata_from_text(rrtype, result, 'example.com.'), wire)
+        return result
+
+    def test_svcb(self):
+        self.assertEqual(self.roundtrip('SVCB', '0 svc.example.net.'), '0 svc.example.net.')
+        self.assertEqual(self.roundtrip('SVCB', '16 foo.example.org. key667=hello dohpath="/dns-query{?dns}"'),
+                         '16 foo.example.org. dohpath="/dns-query{?dns}" key667="hello"')
+        self.assertEqual(self.roundtrip('SVCB', r'1 foo.example.org. alpn=f\\oo\,bar,h2'), r'1 foo.example.org. alpn=f\\oo\,bar,h2')
+
+    def test_https(self):
+        # parameters are ordered by key, as are the keys of mandatory
+        self.assertEqual(self.roundtrip('HTTPS', '1 . alpn=h2,h3 port=443 ipv4hint=192.0.2.1,192.0.2.2 ech=AEX+DQ== ipv6hint=2001:db8::1 mandatory=port,alpn'),
+                         '1 . mandatory=alpn,port alpn=h2,h3 port=443 ipv4hint=192.0.2.1,192.0.2.2 ech=AEX+DQ== ipv6hint=2001:db8::1')
+        self.assertEqual(self.roundtrip('HTTPS', '1 . alpn="h2" no-default-alpn'), '1 . alpn=h2 no-default-alpn')
+
+        # RFC 9460 appendix D.2, port and target
+        self.assertEqual(dnswire.rdata_from_text('HTTPS', '16 foo.example.com. port=53'),
+                         b'\x00\x10\x03foo\x07example\x03com\x00\x00\x03\x00\x02\x00\x35')
+
+    def test_invalid_svcb(self):
+        for text in [ '1 . foo=1', '1 . port=1 port=2', '1 . alpn=', '1 . no-default-alpn=x', '1 . ipv4hint=2001:db8::1' ]:
+            with self.assertRaises(dnswire.DnsWireError, msg=text):
+                dnswire.rdata_from_text('HTTPS', text)
+
+    def test_loc(self):
+        # RFC 1876 appendix A example, missing sizes have their defaults
+        self.assertEqual(self.roundtrip('LOC', '42 21 54 N 71 06 18 W -24m 30m'), '42 21 54.000 N 71 6 18.000 W -24.00m 30.00m 10000.00m 10.00m')
+        self.assertEqual(self.roundtrip('LOC', '52 22 23.000 N 4 53 32.000 E -2.00m 0.00m 10000m 10m'),
+                         '52 22 23.000 N 4 53 32.000 E -2.00m 0.00m 10000.00m 10.00m')
+        self.assertEqual(dnswire.rdata_from_text('LOC', '51 N 0 W 0m').hex(), '001216138af183808000000000989680')
+
+    def test_invalid_loc(self):
+        for text in [ '52 22 23 X', '91 N 0 E 0m', '10 60 N 0 E 0m', '10 N 0 E 0m 1m 1m 1m 1m' ]:
+            with self.assertRaises(dnswire.DnsWireError, msg=text):
+                dnswire.rdata_from_text('LOC', text)
+
+    def test_other_types(self):
+        self.assertEqual(self.roundtrip('CERT', '3 0 0 dGVzdA=='), 'PGP 0 0 dGVzdA==')
+        self.assertEqual(self.roundtrip('DHCID', 'AAIBY2/AuCccgoJbsaxcQc9TUapptP69 lOjxfNuVAA2kjEA='), 'AAIBY2/AuCccgoJbsaxcQc9TUapptP69lOjxfNuVAA2kjEA=')
+        self.assertEqual(self.roundtrip('OPENPGPKEY', 'mQINBFit2jsB'), 'mQINBFit2jsB')
+        self.assertEqual(self.roundtrip('ZONEMD', '2018031500 1 1 febe3d4ce2ec2ffa 4ba99d46cd69d6d2'), '2018031500 1 1 FEBE3D4CE2EC2FFA4BA99D46CD69D6D2')
+
+    def test_unknown_type(self):
+        with self.assertRaises(dnswire.DnsWireError):
+            dnswire.rdata_from_text('TYPE65400', '1 2 3')
+
+        self.assertEqual(self.roundtrip('TYPE65400', '\\# 3 010203'), '\\# 3 010203')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+""" Tests of planning changesets as UPDATE transactions """
+
+import os
+import sys
+import unittest
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import nsupdate, zonefile
+
+ZONE = 'example.com.'
+SOA = 'example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. 2020092601 3600 900 604800 300'
+NEWSOA = SOA.replace('2020092601', '2020092602')
+
+
+def records(*lines: str) -> list:
+    return [ zonefile.from_string(x) for x in lines ]
+
+
+def txt(name: str, count: int, size: int = 10) -> list:
+    return records(*[ f'{name} 60 IN TXT "{i}{"x" * size}"' for i in range(count) ])
+
+
+def operations(operations: list) -> list:
+    return [ (x.mode, str(x.record)) for x in operations ]
+
+
+def batch_transactions(changeset: nsupdate.NsUpdate) -> list:
+    """ Lines of the nsupdate batch per send """
+
+    result = [ [] ]
+    for line in list(changeset.get_nsupdate_batch('127.0.0.1', ZONE))[5:-2]:
+        if line == 'send':
+            result.append([])
+        elif line:
+            result[-1].append(line)
+
+    return result[:-1]
+
+
+class SplitTest(unittest.TestCase):
+
+    def test_rrsets_stay_together(self):
+        changeset = nsupdate.NsUpdate(add=txt('a.example.com.', 3) + txt('b.example.com.', 3) + txt('c.example.com.', 3))
+        size = len(changeset.get_update_messages(ZONE, 1)[0])
+
+        # room for two of the three RRsets
+        transactions = changeset.get_transactions(ZONE, size * 2 // 3)
+
+        self.assertEqual([ [ x.record.dnsName for x in t.updates ] for t in transactions ],
+                         [ [ 'a.example.com.' ] * 3 + [ 'b.example.com.' ] * 3, [ 'c.example.com.' ] * 3 ])
+
+    def test_big_rrset_is_split(self):
+        changeset = nsupdate.NsUpdate(add=txt('a.example.com.', 10, 100))
+        transactions = changeset.get_transactions(ZONE, 500)
+
+        self.assertGreater(len(transactions), 1)
+        self.assertEqual(sum(len(x.updates) for x in transactions), 10)
+
+    def test_batch_is_split_like_the_messages(self):
+        # the text of the TXT records is longer than their wire format, the names are shorter
+        changeset = nsupdate.NsUpdate(add=txt('a.example.com.', 600, 100) + txt('b.example.com.', 600, 0), keep=[])
+        transactions = changeset.get_transactions(ZONE)
+
+        self.assertGreater(len(transactions), 1)
+        self.assertEqual(len(changeset.get_update_messages(ZONE, 1)), len(transactions))
+        self.assertEqual([ len(x) for x in batch_transactions(changeset) ], [ len(x.prereqs) + len(x.updates) for x in transactions ])
+
+
+class PrereqTest(unittest.TestCase):
+
+    def test_with_keep(self):
+        changeset = nsupdate.NsUpdate(
+            add=records(NEWSOA, 'www.example.com. 300 IN A 192.0.2.2', 'new.example.com. 300 IN A 192.0.2.3'),
+            delete=records(SOA, 'www.example.com. 300 IN A 192.0.2.1'),
+            keep=records('www.example.com. 300 IN A 192.0.2.4'))
+
+        transaction, = changeset.get_transactions(ZONE)
+
+        # the zone is still in the state the changes are based on, the RRsets exist or not
+        self.assertEqual(operations(transaction.prereqs), [
+            ('yxrr', SOA),
+            ('yxrrset', 'www.example.com. 300 IN A 192.0.2.1'),
+            ('nxrrset', 'new.example.com. 300 IN A 192.0.2.3'),
+        ])
+        self.assertEqual(operations(transaction.updates)[-1], ('add', NEWSOA))
+
+    def test_without_keep(self):
+        changeset = nsupdate.NsUpdate(add=records('www.example.com. 300 IN A 192.0.2.2'), delete=records(SOA, 'www.example.com. 300 IN A 192.0.2.1'))
+
+        transaction, = changeset.get_transactions(ZONE)
+        self.assertEqual(operations(transaction.prereqs), [ ('yxrr', SOA) ])
+
+    def test_soa_only_in_first_transaction(self):
+        changeset = nsupdate.NsUpdate(add=txt('a.example.com.', 10, 100), delete=records(SOA), keep=[])
+        transactions = changeset.get_transactions(ZONE, 600)
+
+        self.assertGreater(len(transactions), 1)
+        self.assertEqual(operations(transactions[0].prereqs)[0], ('yxrr', SOA))
+        self.assertTrue(all(x.mode != 'yxrr' for t in transactions[1:] for x in t.prereqs))
+
+
+class RRsetDeleteTest(unittest.TestCase):
+
+    def updates(self, changeset: nsupdate.NsUpdate) -> list:
+        """ Modes and addresses of the updates, the record of delrrset only names the RRset """
+
+        return [ (x.mode, x.record.dnsType if x.mode == 'delrrset' else x.record.dnsContent) for x in changeset.get_transactions(ZONE)[0].updates ]
+
+    def test_per_rr(self):
+        rrset = records(*[ f'www.example.com. 300 IN A 192.0.2.{i}' for i in range(3) ])
+
+        # two deletes are not more than deleting the RRset and adding the remaining record
+        self.assertEqual(self.updates(nsupdate.NsUpdate(delete=rrset[:2], keep=rrset[2:])), [ ('del', '192.0.2.0'), ('del', '192.0.2.1') ])
+
+    def test_delrrset(self):
+        rrset = records(*[ f'www.example.com. 300 IN A 192.0.2.{i}' for i in range(4) ])
+
+        self.assertEqual(self.updates(nsupdate.NsUpdate(delete=rrset[:3], keep=rrset[3:])), [ ('delrrset', 'A'), ('add', '192.0.2.3') ])
+        self.assertEqual(self.updates(nsupdate.NsUpdate(delete=rrset, add=records('www.example.com. 300 IN A 192.0.2.9'), keep=[])),
+                         [ ('delrrset', 'A'), ('add', '192.0.2.9') ])
+
+    def test_delrrset_needs_keep(self):
+        # without the unchanged records the remaining content of the RRset is unknown
+        rrset = records(*[ f'www.example.com. 300 IN A 192.0.2.{i}' for i in range(4) ])
+
+        self.assertEqual([ x[0] for x in self.updates(nsupdate.NsUpdate(delete=rrset)) ], [ 'del' ] * 4)
+
+    def test_unchanged_record(self):
+        # a record which is deleted and added again is no change
+        record = records('www.example.com. 300 IN A 192.0.2.1')
+        changeset = nsupdate.NsUpdate(add=record + records('www.example.com. 300 IN A 192.0.2.2'), delete=record, keep=[])
+
+        self.assertEqual(self.updates(changeset), [ ('add', '192.0.2.2') ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+""" Tests of the local zone cache and its refresh by IXFR """
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import dnswire, zonecache, zonefile
+from test_dnsclient import HMAC, SOA1, SOA2, SOA3, ZONE, StandInServer, redirect, rr, sign, response, transfer_messages
+
+SERVER = '127.0.0.1'
+
+
+def records(*lines: str) -> list:
+    return [ zonefile.from_string(x) for x in lines ]
+
+
+def zone(soa: str, *lines: str) -> zonefile.ZoneFile:
+    return zonefile.ZoneFile('\n'.join([ f'{ZONE} 3600 IN SOA {soa}' ] + list(lines)))
+
+
+class ApplyIxfrTest(unittest.TestCase):
+
+    def test_steps(self):
+        records = zone(SOA1, 'www.example.com. 300 IN A 192.0.2.1', 'www.example.com. 300 IN A 192.0.2.2', 'mail.example.com. 300 IN A 192.0.2.3')
+
+        zonecache.apply_ixfr(records, [
+            (self.records(SOA1, 'www.example.com. 300 IN A 192.0.2.1'), self.records(SOA2, 'new.example.com. 300 IN A 192.0.2.4')),
+            (self.records(SOA2, 'new.example.com. 300 IN A 192.0.2.4'), self.records(SOA3, 'www.example.com. 60 IN A 192.0.2.5')),
+        ])
+
+        # the changed RRset stays in place, the current SOA is the first record
+        self.assertEqual([ str(x) for x in records.records ], [
+            f'{ZONE} 3600 IN SOA {SOA3}',
+            'www.example.com. 300 IN A 192.0.2.2',
+            'www.example.com. 60 IN A 192.0.2.5',
+            'mail.example.com. 300 IN A 192.0.2.3',
+        ])
+        self.assertEqual(len(records.get_by_name('new.example.com.')), 0)
+
+    def test_same_record_twice(self):
+        # deletes count, one of two equal records is left
+        records = zone(SOA1, 'www.example.com. 300 IN TXT "a"', 'www.example.com. 300 IN TXT "a"')
+        zonecache.apply_ixfr(records, [ (self.records(SOA1, 'www.example.com. 300 IN TXT "a"'), self.records(SOA2)) ])
+
+        self.assertEqual([ x.dnsType for x in records.records ], [ 'SOA', 'TXT' ])
+
+    def records(self, soa: str, *lines: str) -> list:
+        return records(f'{ZONE} 3600 IN SOA {soa}', *lines)
+
+
+def use_cache_dir(test: unittest.TestCase):
+    """ A cache directory of its own for a test """
+
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory)
+
+    patcher = mock.patch.dict(os.environ, { 'XDG_CACHE_HOME': directory })
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        use_cache_dir(self)
+
+    def test_save_and_load(self):
+        zonecache.save(SERVER, ZONE, zone(SOA1, 'www.example.com. 300 IN A 192.0.2.1', 'www.example.com. 300 IN TXT "a"'))
+
+        records = zonecache.load(SERVER, ZONE)
+        self.assertEqual([ x.dnsType for x in records.records ], [ 'SOA', 'A', 'TXT' ])
+        self.assertEqual((records.nameserver, records.zone), (SERVER, ZONE))
+
+        # the cache keeps all records, ignored types are only left out when loading
+        records = zonecache.load(SERVER, ZONE, [ 'TXT' ])
+        self.assertEqual([ x.dnsType for x in records.records ], [ 'SOA', 'A' ])
+        self.assertEqual(records.ignored, { 'TXT': 1 })
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(zonecache.load(SERVER, ZONE))
+
+        zonecache.save(SERVER, ZONE, zonefile.ZoneFile('www.example.com. 300 IN A 192.0.2.1'))
+        self.assertIsNone(zonecache.load(SERVER, ZONE))
+
+        with open(zonecache.zone_path(SERVER, ZONE), 'wb') as f:
+            f.write(b'invalid')
+        self.assertIsNone(zonecache.load(SERVER, ZONE))
+
+    def test_invalidate(self):
+        zonecache.save(SERVER, ZONE, zone(SOA1))
+        zonecache.invalidate(SERVER, ZONE)
+
+        self.assertIsNone(zonecache.load(SERVER, ZONE))
+
+
+class ZonetransferTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        use_cache_dir(self)
+
+    async def transfer(self, server: StandInServer) -> tuple:
+        with redirect(server.port):
+            return await zonecache.zonetransfer_async(SERVER, HMAC, ZONE)
+
+    def handler(self, serial: str, ixfr: list = None, axfr: list = None):
+        """ Answers SOA queries with the given SOA and transfers with the given groups of records """
+
+        def handle(query, mac):
+            rrtype = dnswire.rrtype_to_text(query.questions[0][1])
+
+            if rrtype == 'SOA':
+                return [ sign(response(query, [ rr(ZONE, 'SOA', serial) ]), mac)[0] ]
+
+            if rrtype == 'IXFR' and ixfr is None:
+                return [ sign(response(query, rcode=5), mac)[0] ]
+
+            return transfer_messages(query, mac, ixfr if rrtype == 'IXFR' else axfr)
+
+        return handle
+
+    def requests(self, server: StandInServer) -> list:
+        return [ dnswire.rrtype_to_text(dnswire.Message(x).questions[0][1]) for x in server.requests ]
+
+    async def test_ixfr(self):
+        zonecache.save(SERVER, ZONE, zone(SOA1, 'www.example.com. 3600 IN A 192.0.2.1'))
+        ixfr = [ [ rr(ZONE, 'SOA', SOA2), rr(ZONE, 'SOA', SOA1), rr('www.example.com.', 'A', '192.0.2.1'),
+                   rr(ZONE, 'SOA', SOA2), rr('www.example.com.', 'A', '192.0.2.2'), rr(ZONE, 'SOA', SOA2) ] ]
+
+        async with StandInServer(self.handler(SOA2, ixfr=ixfr)) as server:
+            ok, records, _ = await self.transfer(server)
+
+        self.assertTrue(ok)
+        self.assertEqual(self.requests(server), [ 'SOA', 'IXFR' ])
+        self.assertEqual([ x.dnsContent for x in records.records ], [ SOA2, '192.0.2.2' ])
+
+        # the cache holds the new state
+        self.assertEqual([ x.dnsContent for x in zonecache.load(SERVER, ZONE).records ], [ SOA2, '192.0.2.2' ])
+
+    async def test_not_cached(self):
+        axfr = [ [ rr(ZONE, 'SOA', SOA1), rr('www.example.com.', 'A', '192.0.2.1'), rr(ZONE, 'SOA', SOA1) ] ]
+
+        async with StandInServer(self.handler(SOA1, axfr=axfr)) as server:
+            ok, records, _ = await self.transfer(server)
+
+        self.assertTrue(ok)
+        self.assertEqual(self.requests(server), [ 'AXFR' ])
+        self.assertEqual([ x.dnsContent for x in zonecache.load(SERVER, ZONE).records ], [ SOA1, '192.0.2.1' ])
+
+    async def test_ixfr_refused(self):
+        zonecache.save(SERVER, ZONE, zone(SOA1, 'www.example.com. 3600 IN A 192.0.2.1'))
+        axfr = [ [ rr(ZONE, 'SOA', SOA2), rr('www.example.com.', 'A', '192.0.2.2'), rr(ZONE, 'SOA', SOA2) ] ]
+
+        async with StandInServer(self.handler(SOA2, axfr=axfr)) as server:
+            ok, records, _ = await self.transfer(server)
+
+        self.assertTrue(ok)
+        self.assertEqual(self.requests(server), [ 'SOA', 'IXFR', 'AXFR' ])
+        self.assertEqual([ x.dnsContent for x in records.records ], [ SOA2, '192.0.2.2' ])
+
+    async def test_ixfr_with_ignored_types(self):
+        zonecache.save(SERVER, ZONE, zone(SOA1, 'www.example.com. 3600 IN A 192.0.2.1', 'www.example.com. 3600 IN TXT "a"'))
+        ixfr = [ [ rr(ZONE, 'SOA', SOA2), rr(ZONE, 'SOA', SOA1), rr('www.example.com.', 'TXT', '"a"'),
+                   rr(ZONE, 'SOA', SOA2), rr('www.example.com.', 'TXT', '"b"'), rr(ZONE, 'SOA', SOA2) ] ]
+
+        async with StandInServer(self.handler(SOA2, ixfr=ixfr)) as server:
+            with redirect(server.port):
+                ok, records, _ = await zonecache.zonetransfer_async(SERVER, HMAC, ZONE, [ 'TXT' ])
+
+        # the changes of ignored types are applied to the cache, they are left out of the result
+        self.assertTrue(ok)
+        self.assertEqual([ x.dnsType for x in records.records ], [ 'SOA', 'A' ])
+        self.assertEqual(records.ignored, { 'TXT': 1 })
+        self.assertEqual([ x.dnsContent for x in zonecache.load(SERVER, ZONE).records ], [ SOA2, '192.0.2.1', '"b"' ])
+
+    async def test_cache_ahead_of_server(self):
+        # e.g. the zone on the server was restored from a backup
+        zonecache.save(SERVER, ZONE, zone(SOA3, 'www.example.com. 3600 IN A 192.0.2.3'))
+        axfr = [ [ rr(ZONE, 'SOA', SOA1), rr('www.example.com.', 'A', '192.0.2.1'), rr(ZONE, 'SOA', SOA1) ] ]
+
+        async with StandInServer(self.handler(SOA1, axfr=axfr)) as server:
+            ok, records, _ = await self.transfer(server)
+
+        # no IXFR, the server has no differences from a newer serial
+        self.assertTrue(ok)
+        self.assertEqual(self.requests(server), [ 'SOA', 'AXFR' ])
+        self.assertEqual([ x.dnsContent for x in records.records ], [ SOA1, '192.0.2.1' ])
+
+    async def test_up_to_date(self):
+        zonecache.save(SERVER, ZONE, zone(SOA1, 'www.example.com. 3600 IN A 192.0.2.1'))
+
+        async with StandInServer(self.handler(SOA1)) as server:
+            ok, records, _ = await self.transfer(server)
+
+        self.assertTrue(ok)
+        self.assertEqual(self.requests(server), [ 'SOA' ])
+        self.assertEqual(len(records.records), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+""" Tests of the in-process zone check """
+
+import os
+import sys
+import unittest
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import zonecheck, zonefile
+
+SOA = 'example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. 2020092601 3600 900 604800 300'
+
+
+def check(*lines: str) -> list:
+    return [ x.message for x in zonecheck.ZoneChecker('example.com').check_lines([ SOA ] + list(lines)) ]
+
+
+class RdataCheckTest(unittest.TestCase):
+
+    def test_valid_rdata(self):
+        self.assertEqual(check(
+            'example.com. 3600 IN HTTPS 1 . alpn=h2',
+            'svc.example.com. 3600 IN SVCB 0 svc.example.net.',
+            'example.com. 3600 IN LOC 52 22 23.000 N 4 53 32.000 E -2.00m 0.00m 10000m 10m',
+            'example.com. 3600 IN CERT PGP 0 0 dGVzdA==',
+        ), [])
+
+    def test_invalid_rdata(self):
+        self.assertEqual(len(check('example.com. 3600 IN HTTPS 1 . foo=1')), 1)
+        self.assertEqual(len(check('example.com. 3600 IN LOC 91 N 0 E 0m')), 1)
+        self.assertEqual(len(check('www.example.com. 3600 IN A 192.0.2.300')), 1)
+
+    def test_unknown_layout(self):
+        # the update is sent in wire format, without a known layout only the generic format can be encoded
+        self.assertEqual(check('example.com. 3600 IN NID 10 0014:4fff:ff20:ee64', 'example.com. 3600 IN TYPE65400 anything'), [
+            'Unable to encode NID records, use the generic \\# format',
+            'Unable to encode TYPE65400 records, use the generic \\# format',
+        ])
+
+    def test_generic_rdata(self):
+        self.assertEqual(check('example.com. 3600 IN TYPE65400 \\# 2 0102'), [])
+        self.assertEqual(len(check('example.com. 3600 IN TYPE65400 \\# 3 0102')), 1)
+
+
+class PendingChangesTest(unittest.TestCase):
+
+    def test_unknown_layout_in_changes(self):
+        # a record transferred from the server is known, the added record with the same type is new
+        known = zonefile.ZoneFile(SOA + '\nexample.com. 3600 IN NID \\# 10 000a00144fffff20ee64\n')
+        checker = zonecheck.ZoneChecker('example.com', known.records)
+
+        problems = checker.check_lines([ SOA, 'example.com. 3600 IN NID \\# 10 000a00144fffff20ee64', 'www.example.com. 3600 IN NID 10 0014:4fff:ff20:ee64' ])
+
+        self.assertEqual(problems, [ zonecheck.ZoneProblem(3, 'Unable to encode NID records, use the generic \\# format') ])
+
+
+if __name__ == '__main__':
+    unittest.main()
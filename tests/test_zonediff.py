@@ -0,0 +1,120 @@
+""" Tests of the changesets between two states of a zone """
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import zonediff, zonefile, zonefileformatter
+
+RECORDS = """example.com. 3600 IN NS ns1.example.com.
+www.example.com. 300 IN A 192.0.2.1
+"""
+
+
+def zone(serial: int, records: str = RECORDS) -> zonefile.ZoneFile:
+    return zonefile.ZoneFile(f'example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. {serial} 3600 900 604800 300\n' + records)
+
+
+def serial(records: list) -> list:
+    return [ zonefile.SoaRecord(x).soaSerial for x in records if x.dnsType == 'SOA' ]
+
+
+class DiffDesiredTest(unittest.TestCase):
+
+    def test_outdated_serial_only(self):
+        changeset = zonediff.diff_desired(zone(2020092605), zone(2019010101))
+
+        self.assertEqual((changeset.add, changeset.delete), ([], []))
+
+    def test_outdated_serial_with_changes(self):
+        changeset = zonediff.diff_desired(zone(5), zone(1, RECORDS + 'new.example.com. 300 IN A 192.0.2.2\n'))
+
+        self.assertEqual(serial(changeset.delete), [ 5 ])
+        self.assertEqual(serial(changeset.add), [ 6 ])
+        self.assertEqual([ str(x) for x in changeset.add if x.dnsType != 'SOA' ], [ 'new.example.com. 300 IN A 192.0.2.2' ])
+
+    def test_newer_serial_is_kept(self):
+        changeset = zonediff.diff_desired(zone(5), zone(42))
+
+        self.assertEqual(serial(changeset.delete), [ 5 ])
+        self.assertEqual(serial(changeset.add), [ 42 ])
+
+
+def formatted(zone: zonefile.ZoneFile) -> str:
+    return '\n'.join(zonefileformatter.ZoneFileFormatter().format(zone)) + '\n'
+
+
+class UnifiedDiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def files(self, org: str, new: str) -> tuple:
+        orgfile = os.path.join(self.directory, 'org.db')
+        newfile = os.path.join(self.directory, 'new.db')
+
+        for file, text in [ (orgfile, org), (newfile, new) ]:
+            with open(file, 'w', newline='') as f:
+                f.write(text)
+
+        return (orgfile, newfile)
+
+    def zonefiles(self, org: zonefile.ZoneFile, new: zonefile.ZoneFile) -> tuple:
+        """ Both zones written by the formatter, like the files of an interactive session """
+
+        return self.files(formatted(org), formatted(new))
+
+    def test_lines(self):
+        self.assertEqual(list(zonediff.unified_diff([ 'a\n', 'b\n', 'c\n' ], [ 'a\n', 'c\n', 'd\n' ], context=1)), [
+            '--- org', '+++ new',
+            '@@ -1,3 +1,3 @@', ' a', '-b', ' c', '+d',
+        ])
+
+    def test_no_changes(self):
+        self.assertEqual(list(zonediff.unified_diff([ 'a\n' ], [ 'a\n' ])), [])
+
+    def test_missing_newline_at_end(self):
+        self.assertEqual(list(zonediff.unified_diff([ 'a\n', 'b' ], [ 'a\n', 'b\n' ])), [
+            '--- org', '+++ new',
+            '@@ -1,2 +1,2 @@', ' a', '-b', '\\ No newline at end of file', '+b',
+        ])
+
+    @unittest.skipUnless(shutil.which('diff'), 'diff is not installed')
+    def test_same_hunks_as_diff(self):
+        org = zone(5, RECORDS + ''.join(f'host{i}.sub{i % 3}.example.com. 300 IN A 192.0.2.{i}\n' for i in range(40)))
+        new = zone(6, RECORDS.replace('192.0.2.1', '192.0.2.99') + ''.join(f'host{i}.sub{i % 3}.example.com. 300 IN A 192.0.2.{i}\n' for i in range(1, 41)))
+        orgfile, newfile = self.zonefiles(org, new)
+
+        expected = subprocess.run([ 'diff', '-u', orgfile, newfile ], capture_output=True, text=True).stdout.splitlines()
+        result = list(zonediff.file_diff(orgfile, newfile))
+
+        # diff adds timestamps to the file names
+        self.assertEqual([ x.split('\t')[0] for x in expected[:2] ], result[:2])
+        self.assertEqual(expected[2:], result[2:])
+
+    @unittest.skipUnless(shutil.which('patch'), 'patch is not installed')
+    def test_patch_applies(self):
+        # the edited file is not written by the formatter, it keeps the text of the user
+        org = formatted(zone(5))
+        edited = org.replace('192.0.2.1', '192.0.2.2') + '; comment\nmx.example.com.  60 IN MX 0 mail.example.com.'
+
+        orgfile, newfile = self.files(org, edited)
+        patchfile = os.path.join(self.directory, 'p.patch')
+
+        with open(patchfile, 'w') as f:
+            f.write('\n'.join(zonediff.file_diff(orgfile, newfile)) + '\n')
+
+        subprocess.run([ 'patch', '--quiet', orgfile, patchfile ], check=True)
+        with open(orgfile, newline='') as f:
+            self.assertEqual(f.read(), edited)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+""" Tests of the zone file records """
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import zonefile
+
+
+class RecordTest(unittest.TestCase):
+
+    def test_str_roundtrip(self):
+        for line in [
+            'example.com. 3600 IN MX 0 mail.example.com.',
+            'example.com. 3600 IN MX 10 mail.example.com.',
+            '_sip._tcp.example.com. 3600 IN SRV 0 5 5060 sip.example.com.',
+            'www.example.com. 300 IN A 192.0.2.1',
+        ]:
+            record = zonefile.from_string(line)
+            self.assertEqual(str(record), line)
+            self.assertEqual(zonefile.from_string(str(record)), record)
+
+
+class SerialTest(unittest.TestCase):
+
+    def test_serial_newer(self):
+        self.assertTrue(zonefile.serial_newer(2020092602, 2020092601))
+        self.assertFalse(zonefile.serial_newer(2020092601, 2020092602))
+        self.assertFalse(zonefile.serial_newer(1, 1))
+
+        # RFC 1982: serials wrap around at 2^32
+        self.assertTrue(zonefile.serial_newer(5, 2**32 - 5))
+        self.assertFalse(zonefile.serial_newer(2**32 - 5, 5))
+        self.assertFalse(zonefile.serial_newer(2**31, 0))
+
+
+ZONE = """; <<>> DiG 9.16.1-Ubuntu <<>> @ns1.example.com -y hmac-sha256:key:c2VjcmV0 -t AXFR example.com.
+example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. 2020092601 3600 900 604800 300
+example.com. 3600 IN NS ns1.example.com.
+WWW.example.com. 300 IN A 192.0.2.1
+www.example.com. 300 IN AAAA 2001:db8::1
+a._acme-challenge.example.com. 60 IN TXT "token"
+_acme-challenge.example.com. 60 IN TXT "token"
+example.com. 3600 IN RRSIG SOA 13 2 3600 20200101000000 20191201000000 12345 example.com. c2lnbmF0dXJl
+example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. 2020092601 3600 900 604800 300
+"""
+
+
+class IndexTest(unittest.TestCase):
+
+    def test_lookups(self):
+        zone = zonefile.ZoneFile(ZONE)
+
+        self.assertEqual(zonefile.SoaRecord(zone.get_soa()).soaSerial, 2020092601)
+        self.assertEqual([ x.dnsContent for x in zone.get_rrset('www.EXAMPLE.com', 'a') ], [ '192.0.2.1' ])
+        self.assertEqual([ x.dnsType for x in zone.get_by_name('www.example.com.') ], [ 'A', 'AAAA' ])
+        self.assertEqual(len(zone.get_by_type('TXT')), 2)
+        self.assertEqual(zone.get_names(), [ 'example.com.', '_acme-challenge.example.com.', 'a._acme-challenge.example.com.', 'www.example.com.' ])
+        self.assertEqual([ x.dnsName for x in zone.get_subtree('_acme-challenge.example.com.') ], [ '_acme-challenge.example.com.', 'a._acme-challenge.example.com.' ])
+
+    def test_changes_of_the_list(self):
+        zone = zonefile.ZoneFile(ZONE)
+        self.assertEqual(len(zone.get_by_type('A')), 1)
+
+        # the same number of records, but different ones
+        zone.records[2] = zonefile.from_string('mail.example.com. 300 IN A 192.0.2.2')
+        self.assertEqual([ x.dnsName for x in zone.get_by_type('A') ], [ 'mail.example.com.' ])
+        self.assertEqual(zone.get_by_name('www.example.com.')[0].dnsType, 'AAAA')
+
+        del zone.records[2]
+        zone.records.append(zonefile.from_string('ftp.example.com. 300 IN A 192.0.2.3'))
+        self.assertEqual([ x.dnsName for x in zone.get_by_type('A') ], [ 'ftp.example.com.' ])
+        self.assertIn('ftp.example.com.', zone.get_names())
+
+    def test_hash_tree_follows_changes(self):
+        zone = zonefile.ZoneFile(ZONE)
+        digest = zone.get_hash_tree().digest()
+
+        zone.records[2] = zonefile.from_string('www.example.com. 300 IN A 192.0.2.2')
+        self.assertNotEqual(zone.get_hash_tree().digest(), digest)
+
+    def test_ignore_rrtypes(self):
+        zone = zonefile.ZoneFile(ZONE, [ 'rrsig', 'TXT', 'SOA' ])
+
+        # the SOA record is always kept
+        self.assertEqual(zone.ignored, { 'RRSIG': 1, 'TXT': 2 })
+        self.assertEqual([ x.dnsType for x in zone.records ], [ 'SOA', 'NS', 'A', 'AAAA' ])
+        self.assertEqual(zone.get_by_type('TXT'), [])
+
+
+class IgnoreRRtypesTest(unittest.TestCase):
+
+    def test_ignored_lines_are_not_parsed(self):
+        text = ZONE.replace('_acme-challenge.example.com. 60 IN TXT', '_acme-challenge.example.com. 60 XX TXT')
+
+        with self.assertRaises(zonefile.ZoneRecordSyntaxError):
+            zonefile.ZoneFile(text)
+
+        self.assertEqual(zonefile.ZoneFile(text, [ 'TXT' ]).ignored, { 'TXT': 2 })
+
+    def test_same_as_exclude(self):
+        parsed = zonefile.ZoneFile(ZONE, [ 'TXT', 'RRSIG' ])
+        zone = zonefile.ZoneFile(ZONE)
+        excluded = zone.exclude_rrtypes([ 'txt', 'RRSIG' ])
+
+        self.assertEqual([ x.as_tuple() for x in excluded.records ], [ x.as_tuple() for x in parsed.records ])
+        self.assertEqual(excluded.ignored, parsed.ignored)
+        self.assertEqual(excluded.nameserver, 'ns1.example.com')
+        self.assertEqual(len(zone.records), 7)
+
+    def test_load(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.zone', delete=False) as f:
+            f.write(ZONE)
+        self.addCleanup(os.remove, f.name)
+
+        for workers in [ 1, 2 ]:
+            self.assertEqual(zonefile.load(f.name, [ 'AAAA' ], workers).ignored, { 'AAAA': 1 })
+
+
+class ParseParallelTest(unittest.TestCase):
+
+    def parse(self, text: str, ignore_rrtypes: list = []) -> zonefile.ZoneFile:
+        # small zones are parsed in-process, the workers have to be used for the test
+        with mock.patch.object(zonefile, 'PARALLEL_MIN_SIZE', 0):
+            return zonefile.parse_parallel(text, 2, ignore_rrtypes)
+
+    def test_same_as_serial(self):
+        text = ZONE.replace('www.example.com. 300 IN AAAA 2001:db8::1\n', ''.join(f'host{i}.example.com. 300 IN A 192.0.2.{i}\n' for i in range(200)))
+
+        for ignore in [ [], [ 'TXT', 'RRSIG' ] ]:
+            serial = zonefile.ZoneFile(text, ignore)
+            parallel = self.parse(text, ignore)
+
+            self.assertEqual([ x.as_tuple() for x in parallel.records ], [ x.as_tuple() for x in serial.records ])
+            self.assertEqual(parallel.ignored, serial.ignored)
+            self.assertEqual((parallel.nameserver, parallel.zone), ('ns1.example.com', 'example.com.'))
+
+    def test_closing_soa_in_own_chunk(self):
+        # with one record per chunk the closing SOA record is the only record of its chunk
+        text = ''.join(ZONE.splitlines(True)[1:4]) + ZONE.splitlines(True)[-1]
+
+        self.assertEqual([ x.dnsType for x in self.parse(text).records ], [ 'SOA', 'NS', 'A' ])
+
+
+if __name__ == '__main__':
+    unittest.main()
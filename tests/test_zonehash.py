@@ -0,0 +1,110 @@
+""" Tests of the hash trees and their comparison """
+
+import os
+import sys
+import unittest
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import zonecache, zonefile, zonehash, zonesnapshot
+
+SOA = 'example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. 1 3600 900 604800 300\n'
+RECORDS = """example.com. 3600 IN NS ns1.example.com.
+www.example.com. 300 IN A 192.0.2.1
+www.example.com. 300 IN A 192.0.2.2
+mail.example.com. 300 IN MX 10 mx.example.com.
+host.a.b.example.com. 300 IN A 192.0.2.3
+other.example.net. 300 IN A 192.0.2.4
+"""
+
+
+def zone(records: str = RECORDS) -> zonefile.ZoneFile:
+    return zonefile.ZoneFile(SOA + records)
+
+
+def nodes(tree: zonehash.HashTree) -> dict:
+    """ Everything of a tree which is hashed or walked """
+
+    return { k: (v.name, v.rrsets, v.own, v.subtree, v.children) for k, v in tree.nodes.items() }
+
+
+class HashTreeTest(unittest.TestCase):
+
+    def test_equal_zones(self):
+        # the order of records and the case of names are not significant
+        other = zone('\n'.join(reversed(RECORDS.splitlines())).replace('www.', 'WWW.'))
+
+        self.assertEqual(zone().get_hash_tree().digest(), other.get_hash_tree().digest())
+        self.assertEqual(zonehash.compare(zone().get_hash_tree(), other.get_hash_tree()), [])
+
+    def test_compare(self):
+        changed = zone(RECORDS.replace('192.0.2.2', '192.0.2.9').replace('mail.', 'smtp.') + 'a.b.example.com. 60 IN TXT "x"\n')
+
+        self.assertEqual(zonehash.compare(zone().get_hash_tree(), changed.get_hash_tree()), [
+            ('a.b.example.com.', [ 'TXT' ]),
+            ('mail.example.com.', [ 'MX' ]),
+            ('smtp.example.com.', [ 'MX' ]),
+            ('www.example.com.', [ 'A' ]),
+        ])
+
+    def test_digests(self):
+        tree = zone().get_hash_tree()
+
+        self.assertIsNotNone(tree.rrset_digest('www.example.com.', 'A'))
+        self.assertIsNone(tree.rrset_digest('www.example.com.', 'AAAA'))
+        self.assertNotEqual(tree.subtree_digest('b.example.com.'), tree.subtree_digest('a.b.example.com.'))
+        self.assertIsNone(tree.subtree_digest('missing.example.com.'))
+
+    def test_update(self):
+        tree = zone().get_hash_tree()
+        changed = zone(RECORDS.replace('host.a.b.', 'host.c.').replace('192.0.2.2', '192.0.2.9'))
+
+        tree.update({ x: changed.get_by_name(x) for x in [ 'host.a.b.example.com.', 'host.c.example.com.', 'www.example.com.' ] })
+
+        # the empty non-terminals of the removed name are gone, the new name has its own
+        self.assertEqual(nodes(tree), nodes(changed.get_hash_tree()))
+        self.assertIsNone(tree.subtree_digest('b.example.com.'))
+
+    def test_exclude_rrtypes(self):
+        tree = zone().get_hash_tree()
+        excluded = tree.exclude_rrtypes([ 'MX', 'A' ])
+
+        self.assertEqual(nodes(excluded), nodes(zone('example.com. 3600 IN NS ns1.example.com.\n').get_hash_tree()))
+        self.assertEqual(nodes(tree), nodes(zone().get_hash_tree()))
+
+
+class StoredHashTreeTest(unittest.TestCase):
+
+    def test_snapshot(self):
+        records = zone()
+        buf = zonesnapshot.dumps(records, records.get_hash_tree())
+
+        loaded = zonesnapshot.loads(buf, hashtree=True)
+        self.assertTrue(loaded.has_hash_tree())
+        self.assertEqual(nodes(loaded.get_hash_tree()), nodes(records.get_hash_tree()))
+
+        # the tree of a zone without ignored RR types
+        loaded = zonesnapshot.loads(buf, [ 'MX' ], hashtree=True)
+        self.assertEqual(nodes(loaded.get_hash_tree()), nodes(zone(RECORDS.replace('mail.example.com. 300 IN MX 10 mx.example.com.\n', '')).get_hash_tree()))
+
+        # only read on request
+        self.assertFalse(zonesnapshot.loads(buf).has_hash_tree())
+        self.assertFalse(zonesnapshot.loads(zonesnapshot.dumps(records), hashtree=True).has_hash_tree())
+
+    def test_apply_ixfr(self):
+        records = zonesnapshot.loads(zonesnapshot.dumps(zone(), zone().get_hash_tree()), hashtree=True)
+        tree = records.get_hash_tree()
+
+        newsoa = zonefile.from_string(SOA.strip().replace(' 1 ', ' 2 '))
+        deleted = [ records.get_soa(), zonefile.from_string('host.a.b.example.com. 300 IN A 192.0.2.3') ]
+        added = [ newsoa, zonefile.from_string('new.example.com. 300 IN A 192.0.2.5') ]
+        zonecache.apply_ixfr(records, [ (deleted, added) ])
+
+        expected = zonefile.ZoneFile(str(newsoa) + '\n' + RECORDS.replace('host.a.b.example.com. 300 IN A 192.0.2.3', 'new.example.com. 300 IN A 192.0.2.5'))
+        self.assertIs(records.get_hash_tree(), tree)
+        self.assertEqual(nodes(tree), nodes(expected.get_hash_tree()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+""" Tests of selecting a part of a zone """
+
+import os
+import sys
+import unittest
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import zonefile, zonescope
+
+ZONE = """example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. 2020092601 3600 900 604800 300
+example.com. 3600 IN NS ns1.example.com.
+www.example.com. 300 IN A 192.0.2.1
+WWW.example.com. 300 IN AAAA 2001:db8::1
+mail.example.com. 300 IN MX 10 mx.example.com.
+host.lab.example.com. 300 IN A 192.0.2.2
+lab.example.com. 300 IN TXT "lab"
+laboratory.example.com. 300 IN A 192.0.2.3
+"""
+
+
+def scope(**kwargs) -> zonescope.ZoneScope:
+    return zonescope.ZoneScope('example.com', **kwargs)
+
+
+def selected(scope: zonescope.ZoneScope) -> list:
+    return [ f'{x.dnsName.lower()} {x.dnsType}' for x in scope.select(zonefile.ZoneFile(ZONE)).records ]
+
+
+class QualifyTest(unittest.TestCase):
+
+    def test_qualify(self):
+        self.assertEqual([ scope().qualify(x) for x in [ '@', '', 'WWW', 'www.example.com', 'other.net.', 'example.com' ] ],
+                         [ 'example.com.', 'example.com.', 'www.example.com.', 'www.example.com.', 'other.net.', 'example.com.' ])
+
+    def test_describe(self):
+        self.assertEqual(scope().describe(), 'whole zone')
+        self.assertEqual(scope(names=[ 'www', 'mail' ], subtrees=[ 'lab' ], rrtypes=[ 'a' ]).describe(),
+                         'names mail.example.com., www.example.com.; subtrees lab.example.com.; types A')
+
+
+class SelectTest(unittest.TestCase):
+
+    def test_empty_scope_is_the_zone(self):
+        zone = zonefile.ZoneFile(ZONE)
+
+        self.assertTrue(scope().is_empty())
+        self.assertIs(scope().select(zone), zone)
+
+    def test_names(self):
+        # names are compared case-insensitive, the SOA record is always part of the scope
+        self.assertEqual(selected(scope(names=[ 'www' ])), [ 'example.com. SOA', 'www.example.com. A', 'www.example.com. AAAA' ])
+
+    def test_subtrees(self):
+        # the subtree ends at a label boundary
+        self.assertEqual(selected(scope(subtrees=[ 'lab' ])), [ 'example.com. SOA', 'lab.example.com. TXT', 'host.lab.example.com. A' ])
+
+    def test_types(self):
+        self.assertEqual(selected(scope(rrtypes=[ 'mx', 'ns' ])), [ 'example.com. SOA', 'mail.example.com. MX', 'example.com. NS' ])
+
+    def test_combined(self):
+        # the types narrow the names and subtrees, a record matched twice is selected once
+        self.assertEqual(selected(scope(names=[ 'www', 'host.lab' ], subtrees=[ 'lab' ], rrtypes=[ 'A' ])),
+                         [ 'example.com. SOA', 'host.lab.example.com. A', 'www.example.com. A' ])
+
+    def test_metadata(self):
+        zone = zonefile.ZoneFile(ZONE, [ 'TXT' ])
+        zone.nameserver = 'ns1.example.com'
+        result = scope(names=[ 'www' ]).select(zone)
+
+        self.assertEqual((result.nameserver, result.ignored), ('ns1.example.com', { 'TXT': 1 }))
+
+    def test_matches(self):
+        record = zonefile.from_string('host.lab.example.com. 300 IN A 192.0.2.2')
+
+        self.assertTrue(scope(subtrees=[ 'lab' ]).matches(record))
+        self.assertFalse(scope(subtrees=[ 'lab' ], rrtypes=[ 'AAAA' ]).matches(record))
+        self.assertFalse(scope(names=[ 'lab' ]).matches(record))
+        self.assertTrue(scope(names=[ 'www' ]).matches(zonefile.ZoneFile(ZONE).get_soa()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+""" Tests of the binary zone snapshots """
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# make the zoneutils package importable without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from zoneutils import zonefile, zonesnapshot
+
+ZONE = """; <<>> DiG 9.16.1-Ubuntu <<>> @ns1.example.com -y hmac-sha256:key:c2VjcmV0 -t AXFR example.com.
+example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. 2020092601 3600 900 604800 300
+example.com. 3600 IN NS ns1.example.com.
+www.example.com. 300 IN A 192.0.2.1
+mail.example.com. 300 IN MX 10 mx.example.com.
+www.example.com. 60 IN TXT "text with spaces" "and \\"quotes\\""
+caf\\195\\169.example.com. 300 IN A 192.0.2.2
+example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. 2020092601 3600 900 604800 300
+"""
+
+
+def rows(zone: zonefile.ZoneFile) -> list:
+    return [ (x.dnsName, x.dnsTtl, x.dnsClass, x.dnsType, x.dnsPrio, x.dnsContent) for x in zone.records ]
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def test_roundtrip(self):
+        zone = zonefile.ZoneFile(ZONE)
+        loaded = zonesnapshot.loads(zonesnapshot.dumps(zone))
+
+        self.assertEqual(rows(loaded), rows(zone))
+        self.assertEqual((loaded.digversion, loaded.nameserver, loaded.zone, loaded.querykeytype),
+                         (zone.digversion, zone.nameserver, zone.zone, zone.querykeytype))
+        self.assertEqual(loaded.get_rrset('WWW.example.com.', 'A')[0].dnsContent, '192.0.2.1')
+
+    def test_records_on_access(self):
+        records = zonesnapshot.loads(zonesnapshot.dumps(zonefile.ZoneFile(ZONE))).records
+
+        self.assertEqual(records[-1].dnsName, 'caf\\195\\169.example.com.')
+        self.assertEqual([ x.dnsType for x in records[1:3] ], [ 'NS', 'A' ])
+        self.assertEqual(len([ x for x in records._records if x is None ]), len(records) - 3)
+
+        # records are created once
+        self.assertIs(records[2], list(records)[2])
+
+        with self.assertRaises(IndexError):
+            records[len(records)]
+
+    def test_ignore_rrtypes(self):
+        buf = zonesnapshot.dumps(zonefile.ZoneFile(ZONE))
+        loaded = zonesnapshot.loads(buf, [ 'txt', 'MX', 'SOA' ])
+
+        # the same records as parsing with the ignored types, the SOA record is always kept
+        self.assertEqual(rows(loaded), rows(zonefile.ZoneFile(ZONE, [ 'TXT', 'MX' ])))
+        self.assertEqual(loaded.ignored, { 'TXT': 1, 'MX': 1 })
+        self.assertEqual(loaded.records[3].dnsContent, '192.0.2.2')
+        self.assertEqual(zonesnapshot.loads(buf, [ 'AAAA' ]).ignored, {})
+
+    def test_empty_zone(self):
+        self.assertEqual(len(zonesnapshot.loads(zonesnapshot.dumps(zonefile.ZoneFile()), [ 'TXT' ]).records), 0)
+
+    def test_invalid(self):
+        buf = zonesnapshot.dumps(zonefile.ZoneFile(ZONE))
+
+        for invalid in [ b'', b'XXXX' + buf[4:], buf[:-1], buf[:zonesnapshot.HEADER.size + 10] ]:
+            with self.assertRaises(zonesnapshot.SnapshotFormatError):
+                zonesnapshot.loads(invalid)
+
+
+class SnapshotFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_save_and_load(self):
+        file = os.path.join(self.directory, 'example.com.snap')
+        zone = zonefile.ZoneFile(ZONE)
+        zonesnapshot.save(file, zone)
+
+        self.assertEqual(rows(zonesnapshot.load(file)), rows(zone))
+
+    def test_empty_file(self):
+        file = os.path.join(self.directory, 'empty.snap')
+        open(file, 'wb').close()
+
+        with self.assertRaises(zonesnapshot.SnapshotFormatError):
+            zonesnapshot.load(file)
+
+
+if __name__ == '__main__':
+    unittest.main()